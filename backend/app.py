@@ -1,27 +1,122 @@
 #!/usr/bin/env python3
 # NETA Backend - 泛神经内分泌癌转录组学分析平台后端
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import event
+import atexit
+import click
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+import numpy as np
 import os
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from r_runner import RRunner
+from r_worker_pool import RWorkerPool
+from task_queue import TaskQueue
+from result_cache import ResultCache, canonical_json
+from result_store import ResultStore, parse_filter, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from streaming import wants_ndjson, ndjson_response, requested_fields, project, project_tables
+import statistics_snapshot
+from gene_index import GeneSearchIndex
+import dataset_search
+from pagination import keyset_page
+from http_cache import HTTPCache
+from metrics import Metrics, Gauge
+import migrations
+import query_plans
+from expression_store import ExpressionStore, ExpressionMatrix, DEFAULT_VALUE_COLUMNS, VALUE_COLUMNS
+from gene_major_store import GeneMajorStore, gene_expression_profile, EXPRESSED_THRESHOLDS
+import pca_engine
+import de_engine
+import survival_engine
+import enrichment_engine
+import plot_data
+from coexpression import CoexpressionIndex, METHODS as COEXPRESSION_METHODS
+import coexpression
 
 # 创建Flask应用
 app = Flask(__name__)
 CORS(app)
 
 # 数据库配置
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///neta_data.sqlite'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('NETA_DATABASE_URL', 'sqlite:///neta_data.sqlite')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# 列式表达矩阵存储目录
+app.config['EXPRESSION_STORE_DIR'] = os.environ.get('NETA_EXPRESSION_STORE', 'data/processed/expression_store')
+# 跨数据集的基因优先表达存储目录及其表达值列（单基因泛癌查询）
+app.config['GENE_MAJOR_STORE_DIR'] = os.environ.get('NETA_GENE_MAJOR_STORE', 'data/processed/gene_major')
+app.config['GENE_MAJOR_VALUE'] = os.environ.get('NETA_GENE_MAJOR_VALUE', 'log2_expression')
+
+# 基因共表达 top-k 近邻索引目录、默认相关方法、每个基因保存的近邻数、构建线程数（0 为 CPU 核数）与表达值列
+app.config['COEXPRESSION_DIR'] = os.environ.get('NETA_COEXPRESSION_DIR', 'data/processed/coexpression')
+app.config['COEXPRESSION_METHOD'] = os.environ.get('NETA_COEXPRESSION_METHOD', 'pearson')
+app.config['COEXPRESSION_TOP_K'] = int(os.environ.get('NETA_COEXPRESSION_TOP_K', '100'))
+app.config['COEXPRESSION_WORKERS'] = int(os.environ.get('NETA_COEXPRESSION_WORKERS', '0'))
+app.config['COEXPRESSION_VALUE'] = os.environ.get('NETA_COEXPRESSION_VALUE', 'expression_value')
+
+# 常驻R工作进程数（0表示每次分析启动新的 Rscript）、预加载的R包与单任务超时（秒）
+app.config['R_WORKERS'] = int(os.environ.get('NETA_R_WORKERS', '0'))
+app.config['R_PRELOAD_PACKAGES'] = [p for p in os.environ.get('NETA_R_PRELOAD', '').split(',') if p]
+app.config['R_JOB_TIMEOUT'] = int(os.environ.get('NETA_R_JOB_TIMEOUT', '600'))
+
+# 分析结果缓存：最大条目数、最大占用（MB）与存活时间（秒）
+app.config['RESULT_CACHE_ENTRIES'] = int(os.environ.get('NETA_RESULT_CACHE_ENTRIES', '256'))
+app.config['RESULT_CACHE_MB'] = int(os.environ.get('NETA_RESULT_CACHE_MB', '256'))
+app.config['RESULT_CACHE_TTL'] = int(os.environ.get('NETA_RESULT_CACHE_TTL', str(24 * 3600)))
+
+# 分析结果列式文件目录；行数不少于阈值的结果表写入文件，AnalysisTask.results 只保留摘要
+app.config['RESULT_STORE_DIR'] = os.environ.get('NETA_RESULT_STORE', 'data/processed/task_results')
+app.config['RESULT_ARTIFACT_MIN_ROWS'] = int(os.environ.get('NETA_RESULT_ARTIFACT_MIN_ROWS', '100'))
+
+# 服务端渲染的绘图（PNG/SVG）缓存目录
+app.config['PLOT_CACHE_DIR'] = os.environ.get('NETA_PLOT_CACHE', 'data/processed/plots')
+
+# 分析任务工作线程数
+app.config['ANALYSIS_WORKERS'] = int(os.environ.get('NETA_ANALYSIS_WORKERS', '2'))
+
+# 任务恢复：每个进程处理第一个请求前重新排队 pending 任务，并把超过该时长（秒）仍为 running 的任务视为进程崩溃遗留
+app.config['TASK_RECOVERY'] = os.environ.get('NETA_TASK_RECOVERY', '1') not in ('0', 'false', 'no')
+app.config['TASK_STALE_SECONDS'] = int(os.environ.get('NETA_TASK_STALE_SECONDS', str(2 * int(os.environ.get('NETA_R_JOB_TIMEOUT', '600')))))
+
+# 批量分析并行度（同时运行的R进程数上限）
+app.config['BATCH_WORKERS'] = int(os.environ.get('NETA_BATCH_WORKERS', '4'))
+
+# PCA默认引擎：'r' 调用 pca_analysis.R，'python' 使用进程内 NumPy 引擎；请求中的 engine 参数优先
+app.config['PCA_ENGINE'] = os.environ.get('NETA_PCA_ENGINE', 'r')
+# 只读接口的 HTTP 缓存：Cache-Control max-age（秒）与进程内响应缓存容量
+app.config['HTTP_CACHE_MAX_AGE'] = int(os.environ.get('NETA_HTTP_CACHE_MAX_AGE', '60'))
+app.config['RESPONSE_CACHE_ENTRIES'] = int(os.environ.get('NETA_RESPONSE_CACHE_ENTRIES', '512'))
+app.config['RESPONSE_CACHE_MB'] = int(os.environ.get('NETA_RESPONSE_CACHE_MB', '64'))
+
+# 差异表达默认引擎：'r' 调用 deseq2_analysis.R，'python' 使用进程内向量化检验
+app.config['DE_ENGINE'] = os.environ.get('NETA_DE_ENGINE', 'r')
+
+# 生存分析默认引擎：survival_analysis.R 目前只输出模拟数据，默认使用进程内 KM/log-rank 引擎
+app.config['SURVIVAL_ENGINE'] = os.environ.get('NETA_SURVIVAL_ENGINE', 'python')
+
+# 富集分析：GMT 基因集目录、默认引擎（enrichment_analysis.R 目前只输出模拟数据）与 GSEA 置换线程数（0 为 CPU 核数）
+app.config['GENE_SET_DIR'] = os.environ.get('NETA_GENE_SET_DIR', 'data/gene_sets')
+app.config['ENRICHMENT_ENGINE'] = os.environ.get('NETA_ENRICHMENT_ENGINE', 'python')
+app.config['GSEA_WORKERS'] = int(os.environ.get('NETA_GSEA_WORKERS', '0'))
+
+# 慢请求日志：超过阈值（毫秒，0 表示关闭）的请求连同其 SQL 写入 neta.slow_requests 日志，可指定日志文件
+app.config['SLOW_REQUEST_MS'] = int(os.environ.get('NETA_SLOW_REQUEST_MS', '0'))
+app.config['SLOW_REQUEST_LOG'] = os.environ.get('NETA_SLOW_REQUEST_LOG', '')
+
+# 多进程指标目录：gunicorn 多个 worker 时设置，/api/metrics 合并所有 worker 的指标；为空时只导出本进程
+app.config['METRICS_DIR'] = os.environ.get('NETA_METRICS_DIR', '')
+
 # 初始化数据库
 db = SQLAlchemy(app)
 
-# 数据库模型
+# 数据库模型（表名与 R_scripts/import_real_geo_data.R 创建的表一致）
 class Dataset(db.Model):
+    __tablename__ = 'datasets'
     id = db.Column(db.Integer, primary_key=True)
     geo_id = db.Column(db.String(50), unique=True, nullable=False)
     title = db.Column(db.String(500))
@@ -34,12 +129,14 @@ class Dataset(db.Model):
     publication_year = db.Column(db.Integer)
     reference_pmid = db.Column(db.String(50))
     data_source = db.Column(db.String(50))
+    priority = db.Column(db.Integer, default=1)
     status = db.Column(db.String(20), default='active')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Sample(db.Model):
+    __tablename__ = 'samples'
     id = db.Column(db.Integer, primary_key=True)
-    dataset_id = db.Column(db.Integer, db.ForeignKey('dataset.id'))
+    dataset_id = db.Column(db.Integer, db.ForeignKey('datasets.id'))
     sample_id = db.Column(db.String(100))
     sample_name = db.Column(db.String(200))
     tissue_type = db.Column(db.String(100))
@@ -57,6 +154,7 @@ class Sample(db.Model):
     quality_score = db.Column(db.Float)
 
 class Gene(db.Model):
+    __tablename__ = 'genes'
     id = db.Column(db.Integer, primary_key=True)
     gene_id = db.Column(db.String(100), unique=True, nullable=False)
     gene_symbol = db.Column(db.String(100))
@@ -68,8 +166,9 @@ class Gene(db.Model):
     ensembl_id = db.Column(db.String(100))
 
 class GeneExpression(db.Model):
+    __tablename__ = 'gene_expression'
     id = db.Column(db.Integer, primary_key=True)
-    dataset_id = db.Column(db.Integer, db.ForeignKey('dataset.id'))
+    dataset_id = db.Column(db.Integer, db.ForeignKey('datasets.id'))
     sample_id = db.Column(db.String(100))
     gene_id = db.Column(db.String(100))
     gene_symbol = db.Column(db.String(100))
@@ -80,17 +179,469 @@ class GeneExpression(db.Model):
     is_expressed = db.Column(db.Boolean)
 
 class AnalysisTask(db.Model):
+    __tablename__ = 'analysis_tasks'
     id = db.Column(db.Integer, primary_key=True)
     task_type = db.Column(db.String(50))
-    dataset_id = db.Column(db.Integer, db.ForeignKey('dataset.id'))
+    dataset_id = db.Column(db.Integer, db.ForeignKey('datasets.id'))
     parameters = db.Column(db.Text)
     status = db.Column(db.String(20), default='pending')
     results = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
     completed_at = db.Column(db.DateTime)
 
+class DatasetSummary(db.Model):
+    # 数据集表达数据汇总（物化表），由 refresh_dataset_summary 在导入后或重建命令中维护
+    dataset_id = db.Column(db.Integer, db.ForeignKey('datasets.id'), primary_key=True, autoincrement=False)
+    has_expression = db.Column(db.Boolean, nullable=False, default=False)
+    expression_rows = db.Column(db.Integer, nullable=False, default=0)
+    n_genes = db.Column(db.Integer, nullable=False, default=0)
+    n_samples = db.Column(db.Integer, nullable=False, default=0)
+    min_value = db.Column(db.Float)
+    max_value = db.Column(db.Float)
+    mean_value = db.Column(db.Float)
+    non_zero_rows = db.Column(db.Integer, nullable=False, default=0)
+    data_version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class StatisticsSnapshot(db.Model):
+    # /api/statistics/overview 的预计算聚合（单行），随数据集增删增量更新
+    id = db.Column(db.Integer, primary_key=True)
+    payload = db.Column(db.Text, nullable=False)
+    data_version = db.Column(db.Integer, nullable=False, default=0)
+    generated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class DataVersion(db.Model):
+    # 数据版本计数器：每次导入/修改表达数据时递增；dataset_id 为 0 表示全局版本
+    dataset_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# 请求、SQL 与 R 进程指标，由 /api/metrics 以 Prometheus 文本格式导出
+metrics = Metrics()
+metrics.init_app(app, app.config['SLOW_REQUEST_MS'], app.config['SLOW_REQUEST_LOG'], app.config['METRICS_DIR'])
+
 # 初始化R运行器
-r_runner = RRunner()
+r_worker_pool = None
+if app.config['R_WORKERS'] > 0:
+    r_worker_pool = RWorkerPool(
+        size=app.config['R_WORKERS'],
+        worker_script=os.path.join('R_scripts', 'r_worker.R'),
+        preload=app.config['R_PRELOAD_PACKAGES'],
+        job_timeout=app.config['R_JOB_TIMEOUT']
+    )
+    atexit.register(r_worker_pool.close)
+r_runner = RRunner(worker_pool=r_worker_pool, timeout=app.config['R_JOB_TIMEOUT'], observer=metrics.observe_r_run)
+
+# 初始化分析任务队列（在模型定义后绑定）
+task_queue = TaskQueue()
+
+# 初始化分析结果缓存
+result_cache = ResultCache(
+    max_entries=app.config['RESULT_CACHE_ENTRIES'],
+    max_bytes=app.config['RESULT_CACHE_MB'] * 1024 * 1024,
+    ttl=app.config['RESULT_CACHE_TTL']
+)
+
+# 分析结果列式文件存储
+result_store = ResultStore(app.config['RESULT_STORE_DIR'], min_rows=app.config['RESULT_ARTIFACT_MIN_ROWS'])
+
+def store_task_result(task, result):
+    """写入任务结果：大表写入列式文件（需要 task.id），results 列只保存标量、小表与文件引用
+
+    result 为其他任务保存的精简结果（如历史任务或缓存命中）时直接链接其列式文件，不重新编码。
+    """
+    stored = result_store.save(task.id, result)
+    task.results = json.dumps(stored)
+    if stored is not result and 'artifact' not in result:
+        # 结果缓存改存精简结果：内存只保留摘要，再次命中时新任务链接本任务的列式文件
+        result_cache.replace(result, stored)
+
+def stored_task_result(task):
+    """results 列中保存的（可能引用列式文件的）结果"""
+    return json.loads(task.results) if task.results else None
+
+def load_task_result(task):
+    """还原任务的完整结果"""
+    return result_store.materialize(stored_task_result(task))
+
+def describe_tables(task_id, stored):
+    """结果中各表的行数、列名、存储位置与分页读取地址（不读取表内容）"""
+    artifact_tables = stored.get('artifact', {}).get('tables', {}) if isinstance(stored, dict) else {}
+    return {
+        name: {'rows': table.rows, 'columns': table.columns,
+               'storage': 'artifact' if name in artifact_tables else 'inline',
+               'url': f'/api/tasks/{task_id}/results/{name}'}
+        for name, table in result_store.tables(stored).items()
+    }
+
+def result_summary(stored):
+    """保存的结果去掉列式文件引用：标量字段与行内小表"""
+    return {k: v for k, v in stored.items() if k != 'artifact'} if isinstance(stored, dict) else stored
+
+def wants_tables():
+    """?include=tables 时接口返回还原后的完整结果表，否则只返回摘要与表描述"""
+    return 'tables' in request.args.get('include', '').split(',')
+
+# 只读接口的条件请求与响应缓存，键与 ETag 由数据版本号派生
+http_cache = HTTPCache(
+    max_entries=app.config['RESPONSE_CACHE_ENTRIES'],
+    max_bytes=app.config['RESPONSE_CACHE_MB'] * 1024 * 1024,
+    max_age=app.config['HTTP_CACHE_MAX_AGE']
+)
+
+def get_data_version(dataset_id=0):
+    """返回数据集（或全局，dataset_id=0）的数据版本号"""
+    version = db.session.get(DataVersion, dataset_id or 0)
+    return version.version if version else 0
+
+def get_data_version_info(dataset_id=0):
+    """返回 (版本号, 最近更新时间)，用于 HTTP 条件缓存"""
+    version = db.session.get(DataVersion, dataset_id or 0)
+    return (version.version, version.updated_at) if version else (0, None)
+
+http_cache.init_app(app, get_data_version_info)
+
+def after_commit(callback):
+    """当前事务提交后执行 callback（如删除派生文件）；事务回滚时丢弃，避免数据未变而文件已删除"""
+    db.session.info.setdefault('neta_after_commit', []).append(callback)
+
+@event.listens_for(db.session, 'after_commit')
+def _run_after_commit(session):
+    for callback in session.info.pop('neta_after_commit', []):
+        callback()
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_after_commit(session, previous_transaction):
+    session.info.pop('neta_after_commit', None)
+
+def bump_data_version(dataset_id):
+    """数据集表达数据变化后递增其版本与全局版本，并清除相关缓存结果（由调用方提交事务）"""
+    now = datetime.utcnow()
+    for key in {dataset_id, 0}:
+        version = db.session.get(DataVersion, key)
+        if version is None:
+            version = DataVersion(dataset_id=key, version=0)
+            db.session.add(version)
+        version.version = (version.version or 0) + 1
+        version.updated_at = now
+    result_cache.invalidate_dataset(dataset_id)
+    # 列式矩阵按数据版本判断过期，提交后删除旧文件，避免占用磁盘
+    if dataset_id:
+        after_commit(partial(expression_store.remove, dataset_id))
+
+def refresh_dataset_summary(dataset_ids=None):
+    """用一次分组聚合重新计算数据集汇总；dataset_ids 为空时重建全部（由调用方提交事务）"""
+    query = db.session.query(
+        GeneExpression.dataset_id,
+        db.func.count(GeneExpression.id),
+        db.func.count(db.distinct(GeneExpression.gene_id)),
+        db.func.count(db.distinct(GeneExpression.sample_id)),
+        db.func.min(GeneExpression.expression_value),
+        db.func.max(GeneExpression.expression_value),
+        db.func.avg(GeneExpression.expression_value),
+        db.func.sum(db.case((GeneExpression.expression_value > 0, 1), else_=0))
+    )
+    if dataset_ids is None:
+        dataset_ids = [r[0] for r in db.session.query(Dataset.id)]
+        DatasetSummary.query.filter(DatasetSummary.dataset_id.notin_(dataset_ids)).delete(synchronize_session=False)
+    else:
+        dataset_ids = list(dataset_ids)
+        query = query.filter(GeneExpression.dataset_id.in_(dataset_ids))
+    aggregates = {row[0]: row for row in query.group_by(GeneExpression.dataset_id)}
+    versions = {v.dataset_id: v.version for v in DataVersion.query.filter(DataVersion.dataset_id.in_(dataset_ids))}
+
+    now = datetime.utcnow()
+    for dataset_id in dataset_ids:
+        summary = db.session.get(DatasetSummary, dataset_id)
+        if summary is None:
+            summary = DatasetSummary(dataset_id=dataset_id)
+            db.session.add(summary)
+        row = aggregates.get(dataset_id)
+        summary.has_expression = bool(row and row[1])
+        summary.expression_rows = row[1] if row else 0
+        summary.n_genes = row[2] if row else 0
+        summary.n_samples = row[3] if row else 0
+        summary.min_value = row[4] if row else None
+        summary.max_value = row[5] if row else None
+        summary.mean_value = row[6] if row else None
+        summary.non_zero_rows = (row[7] or 0) if row else 0
+        summary.data_version = versions.get(dataset_id, 0)
+        summary.updated_at = now
+    return len(dataset_ids)
+
+def datasets_with_expression():
+    """仅包含存在基因表达数据的数据集查询（读取汇总表，不扫描表达数据）"""
+    return Dataset.query.join(DatasetSummary, DatasetSummary.dataset_id == Dataset.id).filter(
+        DatasetSummary.has_expression.is_(True)
+    )
+
+@app.cli.command('rebuild-dataset-summary')
+@click.option('--dataset-id', 'dataset_ids', type=int, multiple=True, help='只刷新指定数据集（可重复）')
+def rebuild_dataset_summary_command(dataset_ids):
+    """重建数据集表达数据汇总表"""
+    db.create_all()
+    count = refresh_dataset_summary(dataset_ids or None)
+    db.session.commit()
+    click.echo(f"Refreshed summary for {count} datasets")
+
+def _dataset_contributions(dataset_ids):
+    """读取数据集行、汇总行与样本数，计算其统计快照贡献"""
+    dataset_ids = list(dataset_ids)
+    datasets = Dataset.query.filter(Dataset.id.in_(dataset_ids)).all()
+    summaries = {s.dataset_id: s for s in DatasetSummary.query.filter(DatasetSummary.dataset_id.in_(dataset_ids))}
+    sample_counts = dict(db.session.query(Sample.dataset_id, db.func.count(Sample.id)).filter(
+        Sample.dataset_id.in_(dataset_ids)
+    ).group_by(Sample.dataset_id).all())
+    return {d.id: statistics_snapshot.dataset_contribution(d, summaries.get(d.id), sample_counts.get(d.id, 0))
+            for d in datasets}
+
+def rebuild_statistics_snapshot():
+    """全量重建统计快照（由调用方提交事务）"""
+    snapshot = statistics_snapshot.empty_snapshot()
+    for dataset_id, contribution in _dataset_contributions(r[0] for r in db.session.query(Dataset.id)).items():
+        statistics_snapshot.add_dataset(snapshot, dataset_id, contribution)
+    return _save_statistics_snapshot(snapshot)
+
+def update_statistics_snapshot(changed=(), removed=()):
+    """增量更新统计快照：扣减被删除/变化数据集的旧贡献，加入变化数据集的新贡献"""
+    row = db.session.get(StatisticsSnapshot, 1)
+    if row is None:
+        return rebuild_statistics_snapshot()
+    snapshot = json.loads(row.payload)
+    for dataset_id in removed:
+        statistics_snapshot.remove_dataset(snapshot, dataset_id)
+    contributions = _dataset_contributions(changed) if changed else {}
+    for dataset_id in changed:
+        if dataset_id in contributions:
+            statistics_snapshot.add_dataset(snapshot, dataset_id, contributions[dataset_id])
+        else:
+            statistics_snapshot.remove_dataset(snapshot, dataset_id)
+    return _save_statistics_snapshot(snapshot)
+
+def _save_statistics_snapshot(snapshot):
+    snapshot['total_genes'] = Gene.query.count()
+    row = db.session.get(StatisticsSnapshot, 1)
+    if row is None:
+        row = StatisticsSnapshot(id=1)
+        db.session.add(row)
+    row.payload = json.dumps(snapshot)
+    row.data_version = get_data_version(0)
+    row.generated_at = datetime.utcnow()
+    return row
+
+def sync_datasets():
+    """把数据版本变化、新增或已删除的数据集同步到汇总表与统计快照，返回 (变化, 删除) 的ID列表"""
+    versions = {v.dataset_id: v.version for v in DataVersion.query.filter(DataVersion.dataset_id != 0)}
+    summaries = dict(db.session.query(DatasetSummary.dataset_id, DatasetSummary.data_version).all())
+    existing = {r[0] for r in db.session.query(Dataset.id)}
+    changed = sorted(d for d in existing if d not in summaries or versions.get(d, 0) != summaries[d])
+    removed = sorted(d for d in summaries if d not in existing)
+    if changed:
+        refresh_dataset_summary(changed)
+    if removed:
+        DatasetSummary.query.filter(DatasetSummary.dataset_id.in_(removed)).delete(synchronize_session=False)
+    if changed or removed or db.session.get(StatisticsSnapshot, 1) is None:
+        update_statistics_snapshot(changed, removed)
+    else:
+        db.session.get(StatisticsSnapshot, 1).data_version = get_data_version(0)
+    return changed, removed
+
+def remove_dataset(dataset_id):
+    """删除数据集及其样本、表达数据、分析任务，并同步汇总表与统计快照（由调用方提交事务，文件在提交后删除）"""
+    for task in AnalysisTask.query.filter(AnalysisTask.dataset_id == dataset_id):
+        after_commit(partial(result_store.remove, stored_task_result(task)))
+        after_commit(partial(plot_cache.remove, task.id))
+    AnalysisTask.query.filter(AnalysisTask.dataset_id == dataset_id).delete(synchronize_session=False)
+    GeneExpression.query.filter(GeneExpression.dataset_id == dataset_id).delete(synchronize_session=False)
+    Sample.query.filter(Sample.dataset_id == dataset_id).delete(synchronize_session=False)
+    DatasetSummary.query.filter(DatasetSummary.dataset_id == dataset_id).delete(synchronize_session=False)
+    Dataset.query.filter(Dataset.id == dataset_id).delete(synchronize_session=False)
+    bump_data_version(dataset_id)
+    after_commit(partial(coexpression_index.remove, dataset_id))
+    update_statistics_snapshot(removed=[dataset_id])
+
+@app.cli.command('sync-datasets')
+def sync_datasets_command():
+    """导入数据后同步数据集汇总表与统计快照"""
+    db.create_all()
+    changed, removed = sync_datasets()
+    db.session.commit()
+    click.echo(f"Synced {len(changed)} changed and {len(removed)} removed datasets")
+
+@app.cli.command('refresh-statistics')
+@click.option('--full', is_flag=True, help='全量重建，而不是只同步变化的数据集')
+def refresh_statistics_command(full):
+    """刷新 /api/statistics/overview 使用的统计快照"""
+    db.create_all()
+    if full:
+        refresh_dataset_summary()
+        rebuild_statistics_snapshot()
+    else:
+        sync_datasets()
+    db.session.commit()
+    click.echo('Statistics snapshot refreshed')
+
+@app.cli.command('remove-dataset')
+@click.argument('dataset_id', type=int)
+def remove_dataset_command(dataset_id):
+    """删除数据集及其表达数据"""
+    remove_dataset(dataset_id)
+    db.session.commit()
+    click.echo(f"Removed dataset {dataset_id}")
+
+@app.cli.command('bump-data-version')
+@click.option('--dataset-id', type=int, default=0, show_default=True, help='数据集ID，0 表示只递增全局版本')
+def bump_data_version_command(dataset_id):
+    """手工修改数据后递增数据版本，使分析结果缓存与 HTTP 缓存失效"""
+    db.create_all()
+    bump_data_version(dataset_id)
+    db.session.commit()
+    click.echo(f"Data version: global {get_data_version(0)}, dataset {dataset_id} {get_data_version(dataset_id)}")
+
+# 初始化列式表达矩阵存储
+expression_store = ExpressionStore(app.config['EXPRESSION_STORE_DIR'])
+
+def _expression_index(dataset_id):
+    """查询数据集的基因 (gene_id, gene_symbol) 与样本ID列表，按ID排序"""
+    genes = db.session.query(
+        GeneExpression.gene_id, db.func.min(GeneExpression.gene_symbol)
+    ).filter(GeneExpression.dataset_id == dataset_id).group_by(GeneExpression.gene_id).order_by(GeneExpression.gene_id).all()
+    samples = db.session.query(GeneExpression.sample_id).filter(
+        GeneExpression.dataset_id == dataset_id
+    ).distinct().order_by(GeneExpression.sample_id).all()
+    return [(g[0], g[1]) for g in genes], [s[0] for s in samples]
+
+def _expression_rows(dataset_id, value_columns):
+    """流式读取数据集的长表表达记录"""
+    columns = [getattr(GeneExpression, c) for c in value_columns]
+    return db.session.query(
+        GeneExpression.gene_id, GeneExpression.sample_id, *columns
+    ).filter(GeneExpression.dataset_id == dataset_id).yield_per(50000)
+
+def get_expression_matrix(dataset_id, value_column='expression_value'):
+    """获取数据集的基因×样本表达矩阵
+
+    优先使用列式存储（内存映射，不拷贝）；未构建时回退为从 GeneExpression 长表透视。
+    数据集没有表达数据时返回 None。
+    """
+    if value_column not in VALUE_COLUMNS:
+        raise ValueError(f"Unknown expression value column: {value_column}")
+    # 列式存储构建后数据又有变化（导入脚本 --replace、bump-data-version 等）时不使用旧矩阵
+    data_version = get_data_version(dataset_id)
+    matrix = expression_store.open(dataset_id, value_column, data_version=data_version)
+    if matrix is not None:
+        return matrix
+
+    genes, sample_ids = _expression_index(dataset_id)
+    if not genes or not sample_ids:
+        return None
+    gene_pos = {g[0]: i for i, g in enumerate(genes)}
+    sample_pos = {s: i for i, s in enumerate(sample_ids)}
+    values = np.full((len(genes), len(sample_ids)), np.nan, dtype=np.float32)
+    for gene_id, sample_id, value in _expression_rows(dataset_id, [value_column]):
+        if value is not None:
+            values[gene_pos[gene_id], sample_pos[sample_id]] = value
+    return ExpressionMatrix(values, [g[0] for g in genes], [g[1] for g in genes], sample_ids, source='database',
+                            data_version=data_version)
+
+def build_expression_store(dataset_id, value_columns=DEFAULT_VALUE_COLUMNS):
+    """从 GeneExpression 表构建单个数据集的列式矩阵"""
+    genes, sample_ids = _expression_index(dataset_id)
+    return expression_store.build(dataset_id, genes, sample_ids, _expression_rows(dataset_id, value_columns), value_columns,
+                                  data_version=get_data_version(dataset_id))
+
+@app.cli.command('build-expression-store')
+@click.option('--dataset-id', 'dataset_ids', type=int, multiple=True, help='只构建指定数据集（可重复）')
+@click.option('--value', 'value_columns', multiple=True, type=click.Choice(VALUE_COLUMNS),
+              default=DEFAULT_VALUE_COLUMNS, show_default=True, help='要写入的表达值列')
+def build_expression_store_command(dataset_ids, value_columns):
+    """从 GeneExpression 表构建列式表达矩阵存储"""
+    if not dataset_ids:
+        dataset_ids = [r[0] for r in db.session.query(GeneExpression.dataset_id).distinct().order_by(GeneExpression.dataset_id)]
+    for dataset_id in dataset_ids:
+        meta = build_expression_store(dataset_id, tuple(value_columns))
+        click.echo(f"Dataset {dataset_id}: {meta['shape'][0]} genes x {meta['shape'][1]} samples, {meta['n_cells']} values")
+
+# 基因优先表达存储：全部数据集的样本拼成一行，单基因查询只读取该基因的一行
+gene_major_store = GeneMajorStore(app.config['GENE_MAJOR_STORE_DIR'])
+
+def expression_sample_columns(value_column):
+    """有表达数据的数据集及其样本 [(dataset_id, [(sample_id, tumor_type), ...])]
+
+    样本的肿瘤类型为空时使用数据集的肿瘤类型。
+    """
+    columns = []
+    for dataset in datasets_with_expression().order_by(Dataset.id):
+        matrix = expression_store.open(dataset.id, value_column, data_version=get_data_version(dataset.id))
+        sample_ids = matrix.sample_ids if matrix is not None else _expression_index(dataset.id)[1]
+        tumor = dict(db.session.query(Sample.sample_id, Sample.tumor_type).filter(Sample.dataset_id == dataset.id))
+        columns.append((dataset.id, [(s, tumor.get(s) or dataset.tumor_type) for s in sample_ids]))
+    return columns
+
+def build_gene_major_store(value_column=None):
+    """从列式存储（未构建时为 GeneExpression 表）构建基因优先存储"""
+    value_column = value_column or app.config['GENE_MAJOR_VALUE']
+    data_version = get_data_version(0)
+
+    def load_symbols(dataset_id):
+        matrix = expression_store.open(dataset_id, value_column, data_version=get_data_version(dataset_id))
+        if matrix is not None:
+            return matrix.gene_symbols
+        return [g[1] for g in _expression_index(dataset_id)[0]]
+
+    return gene_major_store.build(
+        expression_sample_columns(value_column), load_symbols,
+        lambda dataset_id: get_expression_matrix(dataset_id, value_column),
+        value_column, data_version=data_version
+    )
+
+@app.cli.command('build-gene-major-store')
+@click.option('--value', 'value_column', type=click.Choice(VALUE_COLUMNS), default=None,
+              help='表达值列（默认 NETA_GENE_MAJOR_VALUE）')
+def build_gene_major_store_command(value_column):
+    """构建跨数据集的基因优先表达存储，供 /api/genes/<symbol>/expression 使用"""
+    meta = build_gene_major_store(value_column)
+    click.echo(f"{meta['shape'][0]} genes x {meta['shape'][1]} samples across {len(meta['datasets'])} datasets, "
+               f"{meta['n_cells']} values ({meta['value_column']}, data version {meta['data_version']})")
+
+# 初始化共表达近邻索引
+coexpression_index = CoexpressionIndex(app.config['COEXPRESSION_DIR'])
+
+def build_coexpression_index(dataset_id, method=None, k=None, workers=None):
+    """计算数据集全部基因两两相关并保存每个基因的 top-k 近邻；数据集没有表达数据时返回 None"""
+    value_column = app.config['COEXPRESSION_VALUE']
+    matrix = get_expression_matrix(dataset_id, value_column)
+    if matrix is None:
+        return None
+    return coexpression_index.build(
+        dataset_id, matrix,
+        method=method or app.config['COEXPRESSION_METHOD'],
+        k=k or app.config['COEXPRESSION_TOP_K'],
+        workers=app.config['COEXPRESSION_WORKERS'] if workers is None else workers,
+        data_version=get_data_version(dataset_id),
+        value_column=value_column
+    )
+
+@app.cli.command('build-coexpression-index')
+@click.option('--dataset-id', 'dataset_ids', type=int, multiple=True, help='数据集ID，可重复；默认全部有表达数据的数据集')
+@click.option('--method', type=click.Choice(COEXPRESSION_METHODS), default=None, help='相关方法（默认 NETA_COEXPRESSION_METHOD）')
+@click.option('--k', type=int, default=None, help='每个基因保存的正/负相关近邻数（默认 NETA_COEXPRESSION_TOP_K）')
+@click.option('--workers', type=int, default=None, help='并行线程数（默认 NETA_COEXPRESSION_WORKERS）')
+def build_coexpression_index_command(dataset_ids, method, k, workers):
+    """构建 /api/datasets/<id>/coexpression/<gene> 使用的共表达近邻索引"""
+    if not dataset_ids:
+        dataset_ids = [r[0] for r in db.session.query(DatasetSummary.dataset_id).filter(
+            DatasetSummary.has_expression.is_(True)).order_by(DatasetSummary.dataset_id)]
+    for dataset_id in dataset_ids:
+        started = datetime.utcnow()
+        meta = build_coexpression_index(dataset_id, method, k, workers)
+        if meta is None:
+            click.echo(f"Dataset {dataset_id}: no expression data, skipped")
+            continue
+        seconds = (datetime.utcnow() - started).total_seconds()
+        click.echo(f"Dataset {dataset_id}: {meta['n_genes']} genes x {meta['n_samples']} samples, "
+                   f"{meta['method']} top {meta['k']} in {seconds:.1f}s")
 
 # API路由
 @app.route('/api/health', methods=['GET'])
@@ -101,18 +652,49 @@ def health_check():
         'timestamp': datetime.utcnow().isoformat()
     })
 
+# 数据集列表可用的排序键（直接使用列，由 (列, id) 索引覆盖排序；NULL 由分页游标单独处理）
+DATASET_SORT_KEYS = {
+    'id': Dataset.id,
+    'publication_year': Dataset.publication_year,
+    'n_samples': Dataset.n_samples,
+    'n_genes': Dataset.n_genes,
+    'created_at': Dataset.created_at
+}
+
+# 任务历史可用的排序键
+TASK_SORT_KEYS = {
+    'id': AnalysisTask.id,
+    'created_at': AnalysisTask.created_at,
+    'completed_at': AnalysisTask.completed_at
+}
+
+def keyset_response(query, key, serialize, sort_keys, id_column, default_sort='id', default_limit=20, max_limit=500):
+    """按请求中的 sort/cursor/limit/include_total 参数做键集分页并返回 JSON 响应"""
+    limit = max(1, min(request.args.get('limit', request.args.get('per_page', default_limit, type=int), type=int), max_limit))
+    include_total = request.args.get('include_total', '').lower() in ('1', 'true', 'yes')
+    try:
+        items, next_cursor, total = keyset_page(
+            query, sort_keys, id_column,
+            sort=request.args.get('sort'), default_sort=default_sort,
+            cursor=request.args.get('cursor'), limit=limit, include_total=include_total
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response = {
+        key: [serialize(item) for item in items],
+        'count': len(items),
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    }
+    if include_total:
+        response['total'] = total
+    return jsonify(response)
+
 @app.route('/api/datasets', methods=['GET'])
+@http_cache.cached()
 def get_datasets():
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
-    # 仅返回存在基因表达数据的数据集，保证学术严谨性
-    exists_expr = db.session.query(GeneExpression.id).filter(GeneExpression.dataset_id == Dataset.id).exists()
-    datasets = Dataset.query.filter(exists_expr).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
-    
-    return jsonify({
-        'datasets': [{
+    def serialize(d):
+        return {
             'id': d.id,
             'geo_id': d.geo_id,
             'title': d.title,
@@ -121,18 +703,32 @@ def get_datasets():
             'n_samples': d.n_samples,
             'n_genes': d.n_genes,
             'publication_year': d.publication_year
-        } for d in datasets.items],
-        'total': datasets.total,
-        'pages': datasets.pages,
-        'current_page': page
-    })
+        }
+
+    # 仅返回存在基因表达数据的数据集，保证学术严谨性
+    query = datasets_with_expression()
+
+    # 兼容旧的页码分页（前端 DatasetsPage 使用 page/per_page）
+    if 'page' in request.args and 'cursor' not in request.args:
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 20, type=int)
+        datasets = query.order_by(Dataset.id).paginate(page=page, per_page=per_page, error_out=False)
+        return jsonify({
+            'datasets': [serialize(d) for d in datasets.items],
+            'total': datasets.total,
+            'pages': datasets.pages,
+            'current_page': page
+        })
+
+    return keyset_response(query, 'datasets', serialize, DATASET_SORT_KEYS, Dataset.id)
 
 @app.route('/api/datasets/<int:dataset_id>', methods=['GET'])
+@http_cache.cached(dataset_arg='dataset_id')
 def get_dataset_detail(dataset_id):
     dataset = Dataset.query.get_or_404(dataset_id)
     # 若该数据集没有表达数据，则不返回详情
-    has_expr = db.session.query(GeneExpression.id).filter(GeneExpression.dataset_id == dataset.id).first()
-    if not has_expr:
+    summary = db.session.get(DatasetSummary, dataset.id)
+    if summary is None or not summary.has_expression:
         return jsonify({'error': 'Dataset has no expression data'}), 404
     return jsonify({
         'id': dataset.id,
@@ -146,215 +742,823 @@ def get_dataset_detail(dataset_id):
         'n_genes': dataset.n_genes,
         'publication_year': dataset.publication_year,
         'reference_pmid': dataset.reference_pmid,
-        'data_source': dataset.data_source
+        'data_source': dataset.data_source,
+        'expression_summary': {
+            'expression_rows': summary.expression_rows,
+            'n_genes': summary.n_genes,
+            'n_samples': summary.n_samples,
+            'min_value': summary.min_value,
+            'max_value': summary.max_value,
+            'mean_value': summary.mean_value,
+            'non_zero_rows': summary.non_zero_rows
+        }
     })
 
 @app.route('/api/statistics/overview', methods=['GET'])
+@http_cache.cached()
 def get_statistics():
-    total_datasets = Dataset.query.count()
-    total_samples = Sample.query.count()
-    total_genes = Gene.query.count()
-    total_expressions = GeneExpression.query.count()
-    
-    # 按组织类型统计
-    tissue_stats = db.session.query(
-        Dataset.tissue_type, db.func.count(Dataset.id)
-    ).group_by(Dataset.tissue_type).all()
-    
-    # 按肿瘤类型统计
-    tumor_stats = db.session.query(
-        Dataset.tumor_type, db.func.count(Dataset.id)
-    ).group_by(Dataset.tumor_type).all()
-    
-    # 按数据源统计
-    source_stats = db.session.query(
-        Dataset.data_source, db.func.count(Dataset.id)
-    ).group_by(Dataset.data_source).all()
-    
-    # 按发表年份统计
-    year_stats = db.session.query(
-        Dataset.publication_year, db.func.count(Dataset.id)
-    ).group_by(Dataset.publication_year).all()
-    
-    # 按优先级统计
-    priority_stats = db.session.query(
-        Dataset.priority, db.func.count(Dataset.id)
-    ).group_by(Dataset.priority).all()
-    
-    # 表达数据统计
-    expr_stats = db.session.query(
-        db.func.min(GeneExpression.expression_value).label('min_value'),
-        db.func.max(GeneExpression.expression_value).label('max_value'),
-        db.func.avg(GeneExpression.expression_value).label('mean_value'),
-        db.func.count(GeneExpression.id).label('total_records'),
-        db.func.sum(db.case([(GeneExpression.expression_value > 0, 1)], else_=0)).label('non_zero_records')
-    ).first()
-    
-    # 计算数据质量评分
-    completeness_score = min(100, (total_datasets * 10 + total_samples * 0.1 + total_genes * 0.01))
-    coverage_score = (expr_stats.non_zero_records / expr_stats.total_records * 100) if expr_stats.total_records > 0 else 0
-    diversity_score = min(100, len(tissue_stats) * 20 + len(tumor_stats) * 10)
-    overall_score = (completeness_score + coverage_score + diversity_score) / 3
+    # 从预计算快照读取；全局数据版本变化（如导入新数据集）时先增量同步
+    snapshot = db.session.get(StatisticsSnapshot, 1)
+    if snapshot is None or snapshot.data_version != get_data_version(0):
+        sync_datasets()
+        db.session.commit()
+        snapshot = db.session.get(StatisticsSnapshot, 1)
     
-    return jsonify({
-        'total_datasets': total_datasets,
-        'total_samples': total_samples,
-        'total_genes': total_genes,
-        'total_expressions': total_expressions,
-        'tissue_types': [{'name': t[0], 'count': t[1]} for t in tissue_stats],
-        'tumor_types': [{'name': t[0], 'count': t[1]} for t in tumor_stats],
-        'data_sources': [{'name': s[0], 'count': s[1]} for s in source_stats],
-        'publication_years': [{'name': str(y[0]), 'count': y[1]} for y in year_stats if y[0]],
-        'priority_levels': [{'name': f'Priority {p[0]}', 'count': p[1]} for p in priority_stats],
-        'expression_statistics': {
-            'min_value': float(expr_stats.min_value) if expr_stats.min_value else 0,
-            'max_value': float(expr_stats.max_value) if expr_stats.max_value else 0,
-            'mean_value': float(expr_stats.mean_value) if expr_stats.mean_value else 0,
-            'total_records': expr_stats.total_records,
-            'non_zero_records': expr_stats.non_zero_records
-        },
-        'quality_metrics': {
-            'data_completeness': round(completeness_score, 2),
-            'expression_coverage': round(coverage_score, 2),
-            'dataset_diversity': round(diversity_score, 2),
-            'overall_score': round(overall_score, 2)
-        }
-    })
+    result = statistics_snapshot.render(json.loads(snapshot.payload))
+    result['generated_at'] = snapshot.generated_at.isoformat()
+    return jsonify(result)
 
-@app.route('/api/analysis/differential_expression', methods=['POST'])
-def run_differential_expression():
-    data = request.get_json()
-    
-    # 创建分析任务
-    task = AnalysisTask(
-        task_type='differential_expression',
-        dataset_id=data.get('dataset_id'),
-        parameters=json.dumps(data),
-        status='running'
+# 任务类型到R分析类型的映射
+ANALYSIS_TYPES = {
+    'differential_expression': 'differential_expression',
+    'pca': 'pca_analysis',
+    'enrichment': 'enrichment_analysis',
+    'survival': 'survival_analysis'
+}
+
+def analysis_cache_key(analysis_type, parameters, dataset_id):
+    """计算分析结果缓存键，同时记录数据集当前版本以便清除旧结果"""
+    data_version = get_data_version(dataset_id or 0)
+    result_cache.note_data_version(dataset_id or 0, data_version)
+    return result_cache.make_key(analysis_type, parameters, data_version)
+
+def load_stored_result(analysis_type, parameters, dataset_id):
+    """从历史 AnalysisTask 中查找参数相同、且晚于数据最近一次变化的已完成结果
+
+    返回保存的精简结果，不读取列式文件；写入新任务时直接链接该任务的文件。
+    """
+    task_types = [t for t, a in ANALYSIS_TYPES.items() if a == analysis_type] + [analysis_type]
+    query = AnalysisTask.query.filter(
+        AnalysisTask.task_type.in_(task_types),
+        AnalysisTask.status == 'completed',
+        AnalysisTask.parameters == canonical_json(parameters)
     )
-    db.session.add(task)
-    db.session.commit()
-    
-    try:
-        # 运行R分析
-        result = r_runner.run_analysis('differential_expression', data)
-        
-        # 更新任务状态
-        task.status = 'completed'
-        task.results = json.dumps(result)
-        task.completed_at = datetime.utcnow()
+    query = query.filter(AnalysisTask.dataset_id == dataset_id) if dataset_id else query.filter(AnalysisTask.dataset_id.is_(None))
+    version = db.session.get(DataVersion, dataset_id or 0)
+    if version is not None and version.updated_at:
+        query = query.filter(AnalysisTask.completed_at >= version.updated_at)
+    if result_cache.ttl:
+        query = query.filter(AnalysisTask.completed_at >= datetime.utcnow() - timedelta(seconds=result_cache.ttl))
+    task = query.order_by(AnalysisTask.id.desc()).first()
+    return stored_task_result(task) if task and task.results else None
+
+# 可按样本临床信息着色的字段
+SAMPLE_GROUP_FIELDS = ('tissue_type', 'tumor_type', 'tumor_subtype', 'grade', 'stage', 'gender',
+                       'survival_status', 'treatment_type', 'metastasis_status', 'primary_site')
+
+def sample_groups(dataset_id, field):
+    """返回 {sample_id: 分组值}，field 为空时返回 None"""
+    if not field:
+        return None
+    if field not in SAMPLE_GROUP_FIELDS:
+        raise ValueError(f"Unsupported sample group field: {field}")
+    rows = db.session.query(Sample.sample_id, getattr(Sample, field)).filter(Sample.dataset_id == dataset_id)
+    return {sample_id: value for sample_id, value in rows}
+
+def require_expression_matrix(parameters, dataset_id):
+    if not dataset_id:
+        raise ValueError('dataset_id is required')
+    matrix = get_expression_matrix(dataset_id, parameters.get('value_column', 'expression_value'))
+    if matrix is None:
+        raise ValueError(f"Dataset {dataset_id} has no expression data")
+    return matrix
+
+def run_native_pca(parameters, dataset_id):
+    """使用进程内 NumPy 引擎运行PCA，参数与 pca_analysis.R 兼容"""
+    matrix = require_expression_matrix(parameters, dataset_id)
+    top_genes = parameters.get('top_genes', 500)
+    return pca_engine.run_pca(
+        matrix,
+        n_components=int(parameters.get('n_components') or 2),
+        top_genes=int(top_genes) if top_genes else None,
+        log_transform=bool(parameters.get('log_transform', True)),
+        center=bool(parameters.get('center', True)),
+        # 与 pca_analysis.R 中 prcomp(scale = TRUE) 的默认行为一致
+        scale=bool(parameters.get('scale', True)),
+        method=parameters.get('svd_method', 'auto'),
+        groups=sample_groups(dataset_id, parameters.get('color_by') or parameters.get('group_by')),
+        parameters=parameters
+    )
+
+def group_samples(dataset_id, group, field):
+    """分组既可以是样本ID列表，也可以是样本字段 field 的取值"""
+    if isinstance(group, list):
+        return [str(s) for s in group]
+    if not group:
+        raise ValueError('group1 and group2 are required')
+    if field not in SAMPLE_GROUP_FIELDS:
+        raise ValueError(f"Unsupported sample group field: {field}")
+    rows = db.session.query(Sample.sample_id).filter(
+        Sample.dataset_id == dataset_id, getattr(Sample, field) == group
+    )
+    return [r[0] for r in rows]
+
+def run_native_differential_expression(parameters, dataset_id):
+    """使用进程内向量化检验运行差异表达，参数与 deseq2_analysis.R 兼容"""
+    matrix = require_expression_matrix(parameters, dataset_id)
+    field = parameters.get('group_by', 'tumor_type')
+    return de_engine.run_differential_expression(
+        matrix,
+        group_samples(dataset_id, parameters.get('group1'), field),
+        group_samples(dataset_id, parameters.get('group2'), field),
+        method=parameters.get('method', 'moderated'),
+        log_transform=bool(parameters.get('log_transform', True)),
+        pvalue_cutoff=float(parameters.get('pvalue_cutoff', 0.05)),
+        logfc_cutoff=float(parameters.get('logfc_cutoff', 1.0)),
+        parameters=parameters
+    )
+
+def run_native_survival(parameters, dataset_id):
+    """进程内 Kaplan–Meier / log-rank 生存分析
+
+    指定 gene/genes（或 all_genes）时按表达高/低分组，所有基因一次向量化检验；否则按 group_by 的临床分组。
+    """
+    if not dataset_id:
+        raise ValueError('dataset_id is required')
+    genes = parameters.get('genes') or parameters.get('gene') or []
+    if isinstance(genes, str):
+        genes = [genes]
+    all_genes = bool(parameters.get('all_genes'))
+    group_by = parameters.get('group_by')
+    if group_by and group_by not in SAMPLE_GROUP_FIELDS:
+        raise ValueError(f"Unsupported sample group field: {group_by}")
+    label = getattr(Sample, group_by) if group_by else db.literal(None)
+    clinical = {sample_id: (time, status, value) for sample_id, time, status, value in db.session.query(
+        Sample.sample_id, Sample.survival_time, Sample.survival_status, label
+    ).filter(Sample.dataset_id == dataset_id)}
+    matrix = require_expression_matrix(parameters, dataset_id) if genes or all_genes else None
+    return survival_engine.run_survival(
+        matrix, clinical,
+        genes=[str(g) for g in genes],
+        all_genes=all_genes,
+        cutpoint=parameters.get('cutpoint', 'median'),
+        group_by=group_by,
+        log_transform=bool(parameters.get('log_transform', True)),
+        min_fraction=float(parameters.get('min_group_fraction', 0.1)),
+        max_cutpoints=int(parameters.get('max_cutpoints', 50)),
+        n_curves=int(parameters.get('n_curves', 10)),
+        parameters=parameters
+    )
+
+# 基因集库：启动时解析 GMT 文件，全局数据版本变化后重新映射到 genes 表
+gene_set_library = enrichment_engine.GeneSetLibrary(app.config['GENE_SET_DIR'])
+gene_set_library_lock = threading.Lock()
+
+def get_gene_set_library():
+    """返回映射到当前 genes 表的基因集索引"""
+    version = get_data_version(0)
+    if gene_set_library.version != version:
+        # 已有旧索引时，重建期间其他请求继续使用旧索引
+        if not gene_set_library_lock.acquire(blocking=gene_set_library.version is None):
+            return gene_set_library.index()
+        try:
+            if gene_set_library.version != version:
+                gene_set_library.build(db.session.query(
+                    Gene.gene_id, Gene.gene_symbol, Gene.entrez_id, Gene.ensembl_id
+                ).order_by(Gene.id).yield_per(50000), version=version)
+        finally:
+            gene_set_library_lock.release()
+    return gene_set_library.index()
+
+def _gene_list(value):
+    # 基因列表可以是数组，也可以是以逗号、空白分隔的字符串
+    if isinstance(value, str):
+        return [g for g in value.replace(',', ' ').split() if g]
+    return [str(g) for g in value or []]
+
+def run_native_enrichment(parameters, dataset_id):
+    """进程内基因集富集：method 为 'ora'（默认，gene_list 过表达）或 'gsea'（ranked_genes 预排序 GSEA）"""
+    index = get_gene_set_library()
+    if index is None or not index.names:
+        raise ValueError(f"No gene sets loaded; add GMT files to {app.config['GENE_SET_DIR']}")
+    method = parameters.get('method', 'ora')
+    collections = parameters.get('collections') or None
+    if method == 'gsea':
+        ranked = parameters.get('ranked_genes')
+        if not ranked:
+            raise ValueError('ranked_genes is required for GSEA')
+        return enrichment_engine.run_gsea(
+            index, ranked,
+            collections=collections,
+            min_size=int(parameters.get('min_size', 15)),
+            max_size=int(parameters.get('max_size', 500)),
+            permutations=int(parameters.get('permutations', 1000)),
+            weight=float(parameters.get('weight', 1.0)),
+            max_results=int(parameters.get('max_results', 200)),
+            workers=app.config['GSEA_WORKERS'] or None,
+            seed=int(parameters.get('seed', 0)),
+            parameters=parameters
+        )
+    if method != 'ora':
+        raise ValueError(f"Unknown enrichment method: {method}")
+
+    genes = _gene_list(parameters.get('gene_list'))
+    if not genes:
+        raise ValueError('gene_list is required')
+    # 背景基因：默认整个 genes 表；'dataset' 为数据集中测到的基因；也可直接给出基因列表
+    background = parameters.get('background')
+    if background == 'dataset':
+        matrix = require_expression_matrix(parameters, dataset_id)
+        background = enrichment_engine.map_genes(index, matrix.gene_ids + matrix.gene_symbols)[0]
+    elif background:
+        background = enrichment_engine.map_genes(index, _gene_list(background))[0]
+    else:
+        background = None
+    return enrichment_engine.run_ora(
+        index, genes,
+        background=background,
+        collections=collections,
+        min_size=int(parameters.get('min_size', 10)),
+        max_size=int(parameters.get('max_size', 500)),
+        max_results=int(parameters.get('max_results', 200)),
+        padj_cutoff=float(parameters.get('padj_cutoff', 0.05)),
+        parameters=parameters
+    )
+
+# 支持进程内引擎的分析类型：(默认引擎配置项, 引擎函数)
+NATIVE_ENGINES = {
+    'pca_analysis': ('PCA_ENGINE', run_native_pca),
+    'differential_expression': ('DE_ENGINE', run_native_differential_expression),
+    'survival_analysis': ('SURVIVAL_ENGINE', run_native_survival),
+    'enrichment_analysis': ('ENRICHMENT_ENGINE', run_native_enrichment)
+}
+
+def analysis_engine(analysis_type, parameters):
+    """确定分析使用的引擎：请求参数 engine 优先，其次为配置项"""
+    if analysis_type not in NATIVE_ENGINES:
+        return 'r'
+    engine = (parameters.get('engine') or app.config[NATIVE_ENGINES[analysis_type][0]]).lower()
+    if engine not in ('r', 'python'):
+        raise ValueError(f"Unknown analysis engine: {engine}")
+    return engine
+
+def engine_cache_type(analysis_type, engine):
+    # 不同引擎的结果分开缓存；R引擎沿用原有缓存键
+    return analysis_type if engine == 'r' else f'{analysis_type}:{engine}'
+
+def run_cached_analysis(analysis_type, parameters, dataset_id=None):
+    """运行分析；相同类型、参数与数据版本的结果直接复用，并发的相同请求只运行一次"""
+    engine = analysis_engine(analysis_type, parameters)
+    if engine == 'python':
+        # 进程内引擎足够快，不回查历史任务
+        key = analysis_cache_key(engine_cache_type(analysis_type, engine), parameters, dataset_id)
+        return result_cache.get_or_compute(
+            key,
+            lambda: NATIVE_ENGINES[analysis_type][1](parameters, dataset_id),
+            dataset_id=dataset_id or 0
+        )
+    key = analysis_cache_key(analysis_type, parameters, dataset_id)
+    return result_cache.get_or_compute(
+        key,
+        lambda: r_runner.run_analysis(analysis_type, parameters),
+        dataset_id=dataset_id or 0,
+        loader=lambda: load_stored_result(analysis_type, parameters, dataset_id)
+    )
+
+def execute_analysis_task(task, report_progress):
+    """在工作线程中执行一个 AnalysisTask"""
+    analysis_type = ANALYSIS_TYPES.get(task.task_type, task.task_type)
+    parameters = json.loads(task.parameters) if task.parameters else {}
+    report_progress(10)
+    return run_cached_analysis(analysis_type, parameters, task.dataset_id)
+
+task_queue.init_app(app, db, AnalysisTask, execute_analysis_task, store_result=store_task_result)
+
+@app.cli.command('requeue-tasks')
+def requeue_tasks_command():
+    """重新执行上次进程退出时遗留的 pending/running 任务（等待执行完成后退出）"""
+    n = task_queue.recover()
+    task_queue.shutdown()
+    click.echo(f"Requeued {n} tasks")
+
+@app.cli.command('compact-task-results')
+@click.option('--vacuum', is_flag=True, help='完成后执行 VACUUM 回收数据库空间（仅 SQLite）')
+def compact_task_results_command(vacuum):
+    """把历史任务 results 列中的大表迁移到列式结果文件"""
+    db.create_all()
+    moved = saved = 0
+    ids = [i for (i,) in db.session.query(AnalysisTask.id).filter(AnalysisTask.status == 'completed').order_by(AnalysisTask.id)]
+    for start in range(0, len(ids), 200):
+        for task in AnalysisTask.query.filter(AnalysisTask.id.in_(ids[start:start + 200])):
+            stored = stored_task_result(task)
+            if not isinstance(stored, dict) or 'artifact' in stored:
+                continue
+            before = len(task.results)
+            store_task_result(task, stored)
+            if len(task.results) < before:
+                moved += 1
+                saved += before - len(task.results)
         db.session.commit()
-        
-        return jsonify({
-            'task_id': task.id,
-            'status': 'completed',
-            'results': result
-        })
-    except Exception as e:
-        task.status = 'failed'
-        task.results = json.dumps({'error': str(e)})
+    if vacuum and db.engine.dialect.name == 'sqlite':
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql('VACUUM')
+    click.echo(f"Moved results of {moved} tasks to {result_store.root} ({saved / 1024 / 1024:.1f} MB removed from the database)")
+
+# 进行中的任务：各进程的任务队列与批量执行池（多进程模式下累加存活的 worker），以及数据库中未完成的任务
+metrics.gauge('neta_task_queue_tasks', 'Analysis tasks queued or running in worker task queues', ('state',),
+              lambda: {(state,): n for state, n in task_queue.counts().items()})
+batch_jobs = metrics.registry.register(Gauge('neta_batch_jobs', 'Batch analysis jobs queued or running', ('state',)))
+metrics.gauge('neta_analysis_tasks', 'Unfinished analysis tasks in the database', ('status',),
+              lambda: {(status,): n for status, n in db.session.query(
+                  AnalysisTask.status, db.func.count(AnalysisTask.id)
+              ).filter(AnalysisTask.status.in_(('pending', 'running'))).group_by(AnalysisTask.status)},
+              multiprocess='local')
+
+def serialize_task(task, include_results=True, include_tables=False):
+    """任务信息；include_results 时附带结果摘要与表描述，include_tables 时改为还原后的完整结果"""
+    item = {
+        'task_id': task.id,
+        'task_type': task.task_type,
+        'dataset_id': task.dataset_id,
+        'status': task.status,
+        'progress': task_queue.progress(task.id, task.status),
+        'created_at': task.created_at.isoformat() if task.created_at else None,
+        'started_at': task.started_at.isoformat() if task.started_at else None,
+        'completed_at': task.completed_at.isoformat() if task.completed_at else None
+    }
+    if include_results:
+        item['parameters'] = json.loads(task.parameters) if task.parameters else None
+        stored = stored_task_result(task)
+        if task.status == 'failed' and stored:
+            item['error'] = stored.get('error')
+        elif include_tables:
+            item['results'] = result_store.materialize(stored)
+        else:
+            item['results'] = result_summary(stored)
+            item['tables'] = describe_tables(task.id, stored)
+    return item
+
+def submit_analysis(task_type, data):
+    """创建 pending 状态的分析任务并交给工作线程池，立即返回任务ID
+
+    结果缓存命中时直接记录为已完成任务并返回结果。
+    """
+    dataset_id = data.get('dataset_id')
+    analysis_type = ANALYSIS_TYPES[task_type]
+    try:
+        engine = analysis_engine(analysis_type, data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    key = analysis_cache_key(engine_cache_type(analysis_type, engine), data, dataset_id)
+    cached = result_cache.get(key, record_miss=False)
+    if cached is not None:
+        task = AnalysisTask(
+            task_type=task_type,
+            dataset_id=dataset_id,
+            parameters=canonical_json(data),
+            status='completed',
+            completed_at=datetime.utcnow()
+        )
+        db.session.add(task)
+        db.session.flush()
+        # 缓存中为来源任务的精简结果时链接其列式文件，不重新编码
+        store_task_result(task, cached)
         db.session.commit()
-        
-        return jsonify({
-            'task_id': task.id,
-            'status': 'failed',
-            'error': str(e)
-        }), 500
+        fields = requested_fields()
+        if wants_ndjson():
+            return ndjson_response(result_store.stream_rows(
+                {'task_id': task.id, 'cached': True}, stored_task_result(task), fields, request.args.get('table')))
+        item = serialize_task(task, include_tables=wants_tables())
+        item['cached'] = True
+        item['results'] = project_tables(item['results'], fields)
+        return jsonify(item)
 
-@app.route('/api/analysis/pca', methods=['POST'])
-def run_pca_analysis():
-    data = request.get_json()
-    
     task = AnalysisTask(
-        task_type='pca',
-        dataset_id=data.get('dataset_id'),
-        parameters=json.dumps(data),
-        status='running'
+        task_type=task_type,
+        dataset_id=dataset_id,
+        parameters=canonical_json(data),
+        status='pending'
     )
     db.session.add(task)
     db.session.commit()
-    
-    try:
-        result = r_runner.run_analysis('pca_analysis', data)
-        
-        task.status = 'completed'
-        task.results = json.dumps(result)
-        task.completed_at = datetime.utcnow()
-        db.session.commit()
-        
-        return jsonify({
-            'task_id': task.id,
-            'status': 'completed',
-            'results': result
-        })
-    except Exception as e:
-        task.status = 'failed'
-        task.results = json.dumps({'error': str(e)})
-        db.session.commit()
-        
-        return jsonify({
-            'task_id': task.id,
-            'status': 'failed',
-            'error': str(e)
-        }), 500
+    task_queue.submit(task.id)
+
+    return jsonify({
+        'task_id': task.id,
+        'status': 'pending',
+        'status_url': f'/api/tasks/{task.id}'
+    }), 202
+
+@app.route('/api/analysis/differential_expression', methods=['POST'])
+def run_differential_expression():
+    data = request.get_json() or {}
+    return submit_analysis('differential_expression', data)
+
+@app.route('/api/analysis/pca', methods=['POST'])
+def run_pca_analysis():
+    data = request.get_json() or {}
+    return submit_analysis('pca', data)
 
 @app.route('/api/analysis/enrichment', methods=['POST'])
 def run_enrichment_analysis():
-    data = request.get_json()
-    
-    task = AnalysisTask(
-        task_type='enrichment',
-        dataset_id=data.get('dataset_id'),
-        parameters=json.dumps(data),
-        status='running'
-    )
-    db.session.add(task)
-    db.session.commit()
-    
+    data = request.get_json() or {}
+    return submit_analysis('enrichment', data)
+
+@app.route('/api/analysis/survival', methods=['POST'])
+def run_survival_analysis():
+    data = request.get_json() or {}
+    return submit_analysis('survival', data)
+
+@app.route('/api/gene_sets', methods=['GET'])
+def get_gene_sets():
+    """已加载的基因集库：各集合（GMT 文件）的基因集数与映射到 genes 表的基因数"""
+    get_gene_set_library()
+    return jsonify(gene_set_library.stats())
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    stats = result_cache.stats()
+    stats['responses'] = http_cache.stats()
+    return jsonify(stats)
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return metrics.response()
+
+@app.route('/api/tasks/<int:task_id>', methods=['GET'])
+def get_task(task_id):
+    task = AnalysisTask.query.get_or_404(task_id)
+    fields = requested_fields()
+    if wants_ndjson():
+        # 首行为任务信息，其后逐行输出结果中的表（如 de_results、volcano_data）
+        item = serialize_task(task, include_results=False)
+        item['parameters'] = json.loads(task.parameters) if task.parameters else None
+        result = stored_task_result(task)
+        if item['status'] == 'failed' and result:
+            return ndjson_response([{'type': 'header', **item, 'error': result.get('error')}])
+        # 列式文件中的表按块读取，首行之前不还原完整结果
+        return ndjson_response(result_store.stream_rows(item, result, fields, request.args.get('table')))
+    # 默认只返回摘要与表描述，表内容按 tables[*].url 分页读取；?include=tables 时还原完整结果
+    item = serialize_task(task, include_tables=wants_tables())
+    if 'results' in item:
+        item['results'] = project_tables(item['results'], fields)
+    return jsonify(item)
+
+def completed_task_tables(task_id):
+    """已完成任务的 (保存的结果, {表名: ResultTable})；任务未完成时返回错误响应"""
+    task = AnalysisTask.query.get_or_404(task_id)
+    if task.status != 'completed':
+        return None, (jsonify({'error': f'Task {task_id} is {task.status}'}), 409)
+    stored = stored_task_result(task)
+    return stored, result_store.tables(stored)
+
+@app.route('/api/tasks/<int:task_id>/results', methods=['GET'])
+def get_task_results(task_id):
+    """任务结果摘要：标量字段与各结果表的行数、列名（不读取表内容）"""
+    stored, tables = completed_task_tables(task_id)
+    if stored is None:
+        return tables
+    body = stored.get('results') if isinstance(stored, dict) else None
+    return jsonify({
+        'task_id': task_id,
+        'status': stored.get('status') if isinstance(stored, dict) else None,
+        'message': stored.get('message') if isinstance(stored, dict) else None,
+        'results': {k: v for k, v in (body or {}).items() if k not in tables} if isinstance(body, dict) else body,
+        'tables': describe_tables(task_id, stored)
+    })
+
+@app.route('/api/tasks/<int:task_id>/results/<table>', methods=['GET'])
+def get_task_result_table(task_id, table):
+    """分页读取结果表，只解压用到的列
+
+    查询参数：fields=列1,列2；filter=padj<0.05（可重复，条件取交集，支持 abs(列)）；
+    sort=列 或 -列（降序，空值在后）；offset、limit（默认 100，最大 10000）。
+    """
+    stored, tables = completed_task_tables(task_id)
+    if stored is None:
+        return tables
+    if table not in tables:
+        return jsonify({'error': f'Unknown result table: {table}', 'tables': list(tables)}), 404
+    result_table = tables[table]
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
     try:
-        result = r_runner.run_analysis('enrichment_analysis', data)
-        
-        task.status = 'completed'
-        task.results = json.dumps(result)
-        task.completed_at = datetime.utcnow()
-        db.session.commit()
-        
-        return jsonify({
-            'task_id': task.id,
-            'status': 'completed',
-            'results': result
-        })
-    except Exception as e:
-        task.status = 'failed'
-        task.results = json.dumps({'error': str(e)})
-        db.session.commit()
-        
-        return jsonify({
-            'task_id': task.id,
-            'status': 'failed',
-            'error': str(e)
-        }), 500
+        filters = [parse_filter(f) for f in request.args.getlist('filter')]
+        matched, rows = result_table.query(requested_fields(), filters, request.args.get('sort'), offset, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 410
+    if wants_ndjson():
+        header = {'type': 'header', 'task_id': task_id, 'table': table, 'total_rows': result_table.rows,
+                  'matched_rows': matched, 'offset': offset, 'limit': limit}
+        return ndjson_response([header] + rows)
+    return jsonify({
+        'task_id': task_id,
+        'table': table,
+        'columns': result_table.columns,
+        'total_rows': result_table.rows,
+        'matched_rows': matched,
+        'offset': offset,
+        'limit': limit,
+        'rows': rows
+    })
+
+# 绘图数据服务：散点图对应的结果表，图像按任务与绘图参数缓存到文件
+PLOT_TABLES = {'volcano': 'volcano_data', 'pca': 'pca_data'}
+plot_cache = plot_data.PlotCache(app.config['PLOT_CACHE_DIR'])
+
+def task_heatmap(task, tables, max_genes, max_samples):
+    """任务数据集的热图数据；差异表达任务只取显著基因并按两组排列样本"""
+    parameters = json.loads(task.parameters) if task.parameters else {}
+    matrix = require_expression_matrix(parameters, task.dataset_id)
+    candidates = groups = None
+    if 'volcano_data' in tables:
+        volcano = tables['volcano_data']
+        if 'significant' in volcano.columns:
+            _, significant, nulls = volcano.column('significant')
+            significant = significant.astype(bool) & (~nulls if nulls is not None else True)
+            symbols = {str(s).upper() for s in volcano.column('gene_symbol')[1][significant].tolist()}
+            rows = [i for i, s in enumerate(matrix.gene_symbols) if s and s.upper() in symbols]
+            candidates = rows if len(rows) >= 2 else None
+        field = parameters.get('group_by', 'tumor_type')
+        groups = {}
+        for key in ('group1', 'group2'):
+            group = parameters.get(key)
+            label = group if isinstance(group, str) else key
+            groups.update((s, label) for s in group_samples(task.dataset_id, group, field))
+    else:
+        groups = sample_groups(task.dataset_id, parameters.get('color_by') or parameters.get('group_by'))
+    return plot_data.heatmap_payload(matrix, candidates, groups, max_genes=max_genes, max_samples=max_samples,
+                                     log_transform=bool(parameters.get('log_transform', True)))
+
+@app.route('/api/tasks/<int:task_id>/plots/<plot>', methods=['GET'])
+@http_cache.cached()
+def get_task_plot(task_id, plot):
+    """按显示分辨率精简的绘图数据（format=json），或服务端渲染的图像（format=png/svg）
+
+    volcano/pca：显著、标注（label=A,B）的点全部保留，其余点按 width×height 画布上 cell 像素的网格汇总；
+    heatmap：方差最大的 max_genes 个基因（差异表达任务只在显著基因中选取）、最多 max_samples 个样本的行 z-score。
+    """
+    if plot not in ('volcano', 'pca', 'heatmap'):
+        return jsonify({'error': f'Unknown plot: {plot}'}), 404
+    fmt = request.args.get('format', 'json')
+    if fmt != 'json' and fmt not in plot_data.IMAGE_FORMATS:
+        return jsonify({'error': f'Unsupported format: {fmt}'}), 400
+    stored, tables = completed_task_tables(task_id)
+    if stored is None:
+        return tables
+    if plot in PLOT_TABLES and PLOT_TABLES[plot] not in tables:
+        return jsonify({'error': f'Task {task_id} has no {PLOT_TABLES[plot]} to plot'}), 404
+
+    width = min(max(request.args.get('width', plot_data.DEFAULT_WIDTH, type=int), 100), 4000)
+    height = min(max(request.args.get('height', plot_data.DEFAULT_HEIGHT, type=int), 100), 4000)
+    labels = [label.strip() for value in request.args.getlist('label') for label in value.split(',') if label.strip()]
+    if plot == 'heatmap':
+        options = {
+            'max_genes': min(max(request.args.get('max_genes', plot_data.DEFAULT_HEATMAP_GENES, type=int), 2), 500),
+            'max_samples': min(max(request.args.get('max_samples', plot_data.DEFAULT_HEATMAP_SAMPLES, type=int), 2), 2000)
+        }
+        task = db.session.get(AnalysisTask, task_id)
+        make_payload = lambda: task_heatmap(task, tables, **options)  # noqa: E731
+        # 热图取自数据集当前的表达矩阵，数据变化后图像失效
+        key = {**options, 'data_version': get_data_version(task.dataset_id or 0)}
+    else:
+        options = {
+            'labels': labels,
+            'width': width,
+            'height': height,
+            'cell': min(max(request.args.get('cell', plot_data.DEFAULT_CELL, type=int), 1), 50),
+            'max_points': min(max(request.args.get('max_points', plot_data.DEFAULT_MAX_POINTS, type=int), 0), 100000)
+        }
+        if plot == 'volcano':
+            options['label_top'] = min(max(request.args.get('label_top', plot_data.DEFAULT_LABEL_TOP, type=int), 0), 200)
+            make_payload = lambda: plot_data.volcano_payload(tables['volcano_data'], **options)  # noqa: E731
+        else:
+            options['x'] = request.args.get('x', 'PC1')
+            options['y'] = request.args.get('y', 'PC2')
+            make_payload = lambda: plot_data.pca_payload(tables['pca_data'], **options)  # noqa: E731
+        key = options
+    try:
+        if fmt == 'json':
+            return jsonify({'task_id': task_id, **make_payload()})
+        image = plot_cache.get_or_render(task_id, plot, {**key, 'width': width, 'height': height}, fmt,
+                                         make_payload, width, height)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 410
+    except ImportError:
+        return jsonify({'error': 'Server-side rendering requires matplotlib'}), 501
+    return Response(image, mimetype=plot_data.IMAGE_FORMATS[fmt])
+
+@app.route('/api/tasks', methods=['GET'])
+def list_tasks():
+    status = request.args.get('status', '')
+    task_type = request.args.get('task_type', '')
+    dataset_id = request.args.get('dataset_id', type=int)
+
+    # 列表不返回结果，避免加载可能很大的 results 列
+    query = AnalysisTask.query.options(db.defer(AnalysisTask.results))
+    if status:
+        query = query.filter(AnalysisTask.status == status)
+    if task_type:
+        query = query.filter(AnalysisTask.task_type == task_type)
+    if dataset_id:
+        query = query.filter(AnalysisTask.dataset_id == dataset_id)
+
+    # 默认按ID倒序（最新在前），用 next_cursor 继续向后翻页
+    return keyset_response(query, 'tasks', lambda t: serialize_task(t, include_results=False),
+                           TASK_SORT_KEYS, AnalysisTask.id, default_sort='-id', default_limit=50)
+
+# 基因搜索索引：启动时或全局数据版本变化后从 genes 表加载
+gene_index = GeneSearchIndex()
+gene_index_lock = threading.Lock()
+
+def get_gene_index():
+    """返回与当前数据版本一致的基因搜索索引"""
+    version = get_data_version(0)
+    if gene_index.version != version:
+        # 已有旧索引时，重建期间其他请求继续使用旧索引
+        if not gene_index_lock.acquire(blocking=gene_index.version is None):
+            return gene_index
+        try:
+            if gene_index.version != version:
+                gene_index.build(db.session.query(
+                    Gene.id, Gene.gene_id, Gene.gene_symbol, Gene.gene_name, Gene.chromosome,
+                    Gene.gene_type, Gene.entrez_id, Gene.ensembl_id
+                ).order_by(Gene.id).yield_per(50000), version=version)
+        finally:
+            gene_index_lock.release()
+    return gene_index
 
 @app.route('/api/genes/search', methods=['GET'])
+@http_cache.cached()
 def search_genes():
     query = request.args.get('q', '')
     limit = request.args.get('limit', 50, type=int)
     
-    genes = Gene.query.filter(
-        Gene.gene_symbol.contains(query) | 
-        Gene.gene_name.contains(query)
-    ).limit(limit).all()
+    # 排名：精确符号 > 精确ID（gene_id/Entrez/Ensembl）> 符号前缀 > 名称前缀 > 符号子串
+    index = get_gene_index()
+    matches = index.search(query, limit)
     
-    return jsonify([{
-        'id': g.id,
-        'gene_id': g.gene_id,
-        'gene_symbol': g.gene_symbol,
-        'gene_name': g.gene_name,
-        'chromosome': g.chromosome,
-        'gene_type': g.gene_type
-    } for g in genes])
+    response = jsonify([{
+        'id': g[0],
+        'gene_id': g[1],
+        'gene_symbol': g[2],
+        'gene_name': g[3],
+        'chromosome': g[4],
+        'gene_type': g[5]
+    } for _, g in matches])
+    # 索引仍在按新版本重建时，结果来自旧索引，不进入缓存
+    if index.version != get_data_version(0):
+        response.cache_control.no_store = True
+    return response
+
+def _gene_values_from_database(symbol, value_column):
+    """基因优先存储未构建或已过期时，经 (gene_symbol, dataset_id) 索引从长表读取单个基因
+
+    返回与 GeneMajorStore.lookup 相同顺序的 (取值, dataset_id, sample_id, tumor_type)；基因不存在时返回 None。
+    """
+    column = getattr(GeneExpression, value_column)
+    rows = []
+    for candidate in dict.fromkeys((symbol, symbol.upper())):
+        rows = db.session.query(
+            GeneExpression.dataset_id, GeneExpression.gene_id, GeneExpression.sample_id, column
+        ).filter(GeneExpression.gene_symbol == candidate).all()
+        if rows:
+            break
+    if not rows:
+        return None
+
+    # 同一数据集有多个探针对应该符号时保留平均表达最高的探针（与 GeneMajorStore.build 一致）
+    probes = {}
+    for dataset_id, gene_id, sample_id, value in rows:
+        if value is not None:
+            probes.setdefault((dataset_id, gene_id), []).append((sample_id, value))
+    best = {}
+    for (dataset_id, _), items in probes.items():
+        mean = sum(v for _, v in items) / len(items)
+        if dataset_id not in best or mean > best[dataset_id][0]:
+            best[dataset_id] = (mean, items)
+
+    dataset_tumor = dict(db.session.query(Dataset.id, Dataset.tumor_type).filter(Dataset.id.in_(list(best))))
+    sample_tumor = {(d, s): t for d, s, t in db.session.query(
+        Sample.dataset_id, Sample.sample_id, Sample.tumor_type
+    ).filter(Sample.dataset_id.in_(list(best)))}
+    values, dataset_ids, sample_ids, tumor_types = [], [], [], []
+    for dataset_id in sorted(best):
+        for sample_id, value in sorted(best[dataset_id][1]):
+            values.append(value)
+            dataset_ids.append(dataset_id)
+            sample_ids.append(sample_id)
+            tumor_types.append(sample_tumor.get((dataset_id, sample_id)) or dataset_tumor.get(dataset_id))
+    return np.asarray(values, dtype=np.float64), np.asarray(dataset_ids), sample_ids, tumor_types
+
+@app.route('/api/genes/<symbol>/expression', methods=['GET'])
+@http_cache.cached()
+def get_gene_expression(symbol):
+    """单个基因在全部数据集中的表达：每个数据集/样本的取值及按肿瘤类型的中位数、四分位距与表达比例"""
+    include_samples = request.args.get('include_samples', 'true').lower() not in ('false', '0', 'no')
+
+    # 基因优先存储与当前全局数据版本一致时直接读取该基因的一行，否则回退到数据库
+    found = gene_major_store.lookup(symbol)
+    if found is not None and found[4]['data_version'] == get_data_version(0):
+        values, dataset_ids, sample_ids, tumor_types, meta = found
+        value_column, source = meta['value_column'], 'gene_major_store'
+        if values is None:
+            return jsonify({'error': f'Gene not found: {symbol}'}), 404
+    else:
+        value_column, source = app.config['GENE_MAJOR_VALUE'], 'database'
+        found = _gene_values_from_database(symbol, value_column)
+        if found is None:
+            return jsonify({'error': f'Gene not found: {symbol}'}), 404
+        values, dataset_ids, sample_ids, tumor_types = found
+
+    expressed_above = request.args.get('expressed_above', type=float)
+    if expressed_above is None:
+        expressed_above = EXPRESSED_THRESHOLDS.get(value_column, 0.0)
+
+    present_ids = np.unique(np.asarray(dataset_ids)[~np.isnan(values)]).tolist()
+    datasets = {d.id: {
+        'dataset_id': d.id,
+        'geo_id': d.geo_id,
+        'title': d.title,
+        'tissue_type': d.tissue_type,
+        'tumor_type': d.tumor_type
+    } for d in Dataset.query.filter(Dataset.id.in_(present_ids))} if present_ids else {}
+
+    profile = gene_expression_profile(values, dataset_ids, sample_ids, tumor_types, datasets,
+                                      expressed_above=expressed_above, include_samples=include_samples)
+    return jsonify({
+        'gene_symbol': symbol,
+        'value_column': value_column,
+        'expressed_above': expressed_above,
+        'source': source,
+        **profile
+    })
+
+@app.route('/api/datasets/<int:dataset_id>/coexpression/<gene>', methods=['GET'])
+@http_cache.cached(dataset_arg='dataset_id')
+def get_gene_coexpression(dataset_id, gene):
+    """数据集中与基因（符号或基因ID）共表达最强的基因
+
+    查询参数：limit（默认 25）、sign=positive/negative/both、method=pearson/spearman、min_abs_r。
+    近邻索引的方法一致、k 足够且与数据集当前版本一致时只读取索引中的一行，否则从表达矩阵计算该基因的相关。
+    """
+    Dataset.query.get_or_404(dataset_id)
+    limit = min(max(request.args.get('limit', 25, type=int), 1), 1000)
+    sign = request.args.get('sign', 'positive')
+    method = request.args.get('method', app.config['COEXPRESSION_METHOD'])
+    min_abs_r = request.args.get('min_abs_r', 0.0, type=float)
+    if sign not in ('positive', 'negative', 'both'):
+        return jsonify({'error': f'Unsupported sign: {sign}'}), 400
+    if method not in COEXPRESSION_METHODS:
+        return jsonify({'error': f'Unknown correlation method: {method}'}), 400
+
+    found = coexpression_index.lookup(dataset_id, gene)
+    meta = found[0]['meta'] if found else None
+    if (meta and meta['method'] == method and limit <= meta['k']
+            and meta['data_version'] == get_data_version(dataset_id)):
+        loaded, row = found
+        if row is None:
+            return jsonify({'error': f'Gene not found in dataset {dataset_id}: {gene}'}), 404
+        # 正/负近邻分别按相关强度排好序，sign=both 时合并后按绝对值排序
+        parts = {'positive': ('pos',), 'negative': ('neg',), 'both': ('pos', 'neg')}[sign]
+        idx = np.concatenate([np.asarray(loaded[f'{p}_idx'][row]) for p in parts])
+        r = np.concatenate([np.asarray(loaded[f'{p}_r'][row], dtype=np.float64) for p in parts])
+        if sign == 'both':
+            order = np.argsort(-np.abs(r), kind='stable')
+            idx, r = idx[order], r[order]
+        keep = (np.abs(r) >= min_abs_r) & (r > 0 if sign == 'positive' else r < 0 if sign == 'negative' else True)
+        idx, r = idx[keep][:limit], r[keep][:limit]
+        gene_ids, gene_symbols = loaded['gene_ids'], loaded['gene_symbols']
+        n_samples, n_genes, source = meta['n_samples'], meta['n_genes'], 'index'
+    else:
+        matrix = get_expression_matrix(dataset_id, app.config['COEXPRESSION_VALUE'])
+        if matrix is None:
+            return jsonify({'error': 'Dataset has no expression data'}), 404
+        row = coexpression.symbol_rows(matrix).get(gene.upper())
+        if row is None:
+            return jsonify({'error': f'Gene not found in dataset {dataset_id}: {gene}'}), 404
+        z = coexpression.standardize(np.asarray(matrix.values), method)
+        correlations = coexpression.gene_correlations(z, row).astype(np.float64)
+        idx = coexpression.neighbors_from_correlations(correlations, limit, sign, min_abs_r)
+        r = correlations[idx]
+        gene_ids, gene_symbols = matrix.gene_ids, matrix.gene_symbols
+        n_samples, n_genes, source = z.shape[1], z.shape[0], 'matrix'
+
+    pvalues = coexpression.correlation_pvalues(r, n_samples)
+    return jsonify({
+        'dataset_id': dataset_id,
+        'gene': gene,
+        'gene_id': gene_ids[row],
+        'gene_symbol': gene_symbols[row] or None,
+        'method': method,
+        'sign': sign,
+        'n_samples': int(n_samples),
+        'n_genes': int(n_genes),
+        'source': source,
+        'neighbors': [{
+            'gene_id': gene_ids[j],
+            'gene_symbol': gene_symbols[j] or None,
+            'r': float(value),
+            'pvalue': float(p)
+        } for j, value, p in zip(idx.tolist(), r.tolist(), pvalues.tolist())]
+    })
 
 @app.route('/api/datasets/filter', methods=['GET'])
+@http_cache.cached()
 def filter_datasets():
     tissue_type = request.args.get('tissue_type', '')
     tumor_type = request.args.get('tumor_type', '')
@@ -368,8 +1572,7 @@ def filter_datasets():
     year_to = request.args.get('year_to', type=int)
     
     # 仅返回存在表达数据的数据集
-    exists_expr = db.session.query(GeneExpression.id).filter(GeneExpression.dataset_id == Dataset.id).exists()
-    query = Dataset.query.filter(exists_expr)
+    query = datasets_with_expression()
     
     if tissue_type:
         query = query.filter(Dataset.tissue_type == tissue_type)
@@ -392,32 +1595,70 @@ def filter_datasets():
     if year_to:
         query = query.filter(Dataset.publication_year <= year_to)
     
-    datasets = query.all()
+    fields = requested_fields()
+    def serialize(d):
+        return project({
+            'id': d.id,
+            'geo_id': d.geo_id,
+            'title': d.title,
+            'tissue_type': d.tissue_type,
+            'tumor_type': d.tumor_type,
+            'data_source': d.data_source,
+            'n_samples': d.n_samples,
+            'n_genes': d.n_genes,
+            'publication_year': d.publication_year,
+            'priority': d.priority
+        }, fields)
     
-    return jsonify([{
-        'id': d.id,
-        'geo_id': d.geo_id,
-        'title': d.title,
-        'tissue_type': d.tissue_type,
-        'tumor_type': d.tumor_type,
-        'data_source': d.data_source,
-        'n_samples': d.n_samples,
-        'n_genes': d.n_genes,
-        'publication_year': d.publication_year,
-        'priority': d.priority
-    } for d in datasets])
+    # 流式模式：按批从游标读取并逐行输出，不在内存中物化整个结果集
+    if wants_ndjson():
+        return ndjson_response(serialize(d) for d in query.order_by(Dataset.id).yield_per(500))
+    
+    # 传入 limit/cursor/sort 时按键集分页返回，否则保持原来的完整列表
+    if any(arg in request.args for arg in ('limit', 'cursor', 'sort')):
+        return keyset_response(query, 'datasets', serialize, DATASET_SORT_KEYS, Dataset.id)
+    
+    return jsonify([serialize(d) for d in query.all()])
+
+_dataset_search_ready = None
+
+def ensure_dataset_search():
+    """确保数据集全文索引及同步触发器存在；数据库不支持 FTS5 时返回 False"""
+    global _dataset_search_ready
+    if _dataset_search_ready is None:
+        connection = db.session.connection()
+        _dataset_search_ready = dataset_search.fts_supported(connection)
+        if _dataset_search_ready:
+            dataset_search.ensure_dataset_fts(connection, Dataset.__tablename__)
+            db.session.commit()
+    return _dataset_search_ready
+
+@app.cli.command('rebuild-dataset-search')
+def rebuild_dataset_search_command():
+    """重建数据集全文索引"""
+    if not ensure_dataset_search():
+        raise click.ClickException('FTS5 is not available for this database')
+    dataset_search.rebuild_dataset_fts(db.session.connection())
+    db.session.commit()
+    click.echo('Dataset search index rebuilt')
 
 @app.route('/api/datasets/search', methods=['GET'])
+@http_cache.cached()
 def search_datasets():
     query = request.args.get('q', '')
     limit = request.args.get('limit', 20, type=int)
-    # 仅返回存在表达数据的数据集
-    exists_expr = db.session.query(GeneExpression.id).filter(GeneExpression.dataset_id == Dataset.id).exists()
-    datasets = Dataset.query.filter(exists_expr).filter(
-        Dataset.title.contains(query) | 
-        Dataset.description.contains(query) |
-        Dataset.geo_id.contains(query)
-    ).limit(limit).all()
+    # 全文索引可用时按 BM25 排序（支持 "短语" 与 前缀* 查询），否则回退为子串匹配
+    if query.strip() and ensure_dataset_search():
+        ranked = dataset_search.search_dataset_ids(db.session.connection(), query, limit)
+        by_id = {d.id: d for d in Dataset.query.filter(Dataset.id.in_([r[0] for r in ranked]))}
+        datasets = [by_id[r[0]] for r in ranked if r[0] in by_id]
+    else:
+        # 仅返回存在表达数据的数据集
+        datasets = datasets_with_expression().filter(
+            Dataset.title.contains(query) | 
+            Dataset.description.contains(query) |
+            Dataset.geo_id.contains(query)
+        ).limit(limit).all()
     
     return jsonify([{
         'id': d.id,
@@ -433,6 +1674,7 @@ def search_datasets():
     } for d in datasets])
 
 @app.route('/api/datasets/statistics', methods=['GET'])
+@http_cache.cached()
 def get_dataset_statistics():
     # 按数据源统计
     source_stats = db.session.query(
@@ -456,12 +1698,13 @@ def get_dataset_statistics():
     
     # 样本数分布
     sample_dist = db.session.query(
-        db.case([
+        db.case(
             (Dataset.n_samples < 50, 'Small (<50)'),
             (Dataset.n_samples < 100, 'Medium (50-100)'),
             (Dataset.n_samples < 200, 'Large (100-200)'),
-            (Dataset.n_samples < 500, 'Very Large (200-500)')
-        ], else_='Huge (500+)').label('size_category'),
+            (Dataset.n_samples < 500, 'Very Large (200-500)'),
+            else_='Huge (500+)'
+        ).label('size_category'),
         db.func.count(Dataset.id)
     ).group_by('size_category').all()
     
@@ -473,71 +1716,206 @@ def get_dataset_statistics():
         'sample_sizes': [{'name': s[0], 'count': s[1]} for s in sample_dist]
     })
 
-@app.route('/api/analysis/batch', methods=['POST'])
-def run_batch_analysis():
-    data = request.get_json()
-    analysis_type = data.get('analysis_type')
-    dataset_ids = data.get('dataset_ids', [])
-    parameters = data.get('parameters', {})
-    
-    if not dataset_ids:
-        return jsonify({'error': 'No datasets specified'}), 400
-    
-    results = []
-    for dataset_id in dataset_ids:
-        try:
-            # 创建分析任务
-            task = AnalysisTask(
-                task_type=analysis_type,
-                dataset_id=dataset_id,
-                parameters=json.dumps(parameters),
-                status='running'
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+def get_batch_executor():
+    """批量分析共享的有界执行池；每个任务在独立的R进程中运行"""
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is None:
+            _batch_executor = ThreadPoolExecutor(
+                max_workers=max(1, app.config['BATCH_WORKERS']),
+                thread_name_prefix='neta-batch'
             )
-            db.session.add(task)
-            db.session.commit()
-            
-            # 运行分析
-            result = r_runner.run_analysis(analysis_type, {
-                'dataset_id': dataset_id,
-                **parameters
-            })
-            
-            # 更新任务状态
+        return _batch_executor
+
+def run_batch_job(task_id, analysis_type, dataset_id, parameters):
+    """在执行池中运行单个数据集的分析，并回写对应的 AnalysisTask"""
+    batch_jobs.dec(state='queued')
+    batch_jobs.inc(state='running')
+    try:
+        return _run_batch_job(task_id, analysis_type, dataset_id, parameters)
+    finally:
+        batch_jobs.dec(state='running')
+
+def _run_batch_job(task_id, analysis_type, dataset_id, parameters):
+    with app.app_context():
+        task = db.session.get(AnalysisTask, task_id)
+        try:
+            result = run_cached_analysis(analysis_type, parameters, dataset_id)
             task.status = 'completed'
-            task.results = json.dumps(result)
+            store_task_result(task, result)
             task.completed_at = datetime.utcnow()
             db.session.commit()
-            
-            results.append({
+            stored = stored_task_result(task)
+            return {
                 'dataset_id': dataset_id,
-                'task_id': task.id,
+                'task_id': task_id,
                 'status': 'completed',
-                'results': result
-            })
+                'results': result_summary(stored),
+                'tables': describe_tables(task_id, stored)
+            }
         except Exception as e:
-            if 'task' in locals():
-                task.status = 'failed'
-                task.results = json.dumps({'error': str(e)})
-                db.session.commit()
-            
-            results.append({
+            db.session.rollback()
+            task = db.session.get(AnalysisTask, task_id)
+            task.status = 'failed'
+            task.results = json.dumps({'error': str(e)})
+            task.completed_at = datetime.utcnow()
+            db.session.commit()
+            return {
                 'dataset_id': dataset_id,
+                'task_id': task_id,
                 'status': 'failed',
                 'error': str(e)
-            })
+            }
+
+@app.route('/api/analysis/batch', methods=['POST'])
+def run_batch_analysis():
+    data = request.get_json() or {}
+    analysis_type = data.get('analysis_type')
+    dataset_ids = data.get('dataset_ids', [])
+    parameters = data.get('parameters', {})
     
-    return jsonify({
-        'analysis_type': analysis_type,
-        'total_datasets': len(dataset_ids),
-        'successful': len([r for r in results if r['status'] == 'completed']),
-        'failed': len([r for r in results if r['status'] == 'failed']),
-        'results': results
-    })
+    if not dataset_ids:
+        return jsonify({'error': 'No datasets specified'}), 400
+    
+    # 一次性创建所有分析任务
+    tasks = [AnalysisTask(
+        task_type=analysis_type,
+        dataset_id=dataset_id,
+        parameters=canonical_json({'dataset_id': dataset_id, **parameters}),
+        status='running'
+    ) for dataset_id in dataset_ids]
+    db.session.add_all(tasks)
+    db.session.commit()
+    
+    # 并行分发到执行池
+    runner_type = ANALYSIS_TYPES.get(analysis_type, analysis_type)
+    executor = get_batch_executor()
+    batch_jobs.inc(len(dataset_ids), state='queued')
+    futures = [executor.submit(
+        run_batch_job, task.id, runner_type, dataset_id, {'dataset_id': dataset_id, **parameters}
+    ) for task, dataset_id in zip(tasks, dataset_ids)]
+    
+    def summary(results):
+        return {
+            'analysis_type': analysis_type,
+            'total_datasets': len(dataset_ids),
+            'successful': len([r for r in results if r['status'] == 'completed']),
+            'failed': len([r for r in results if r['status'] == 'failed'])
+        }
+    
+    # 流式模式：每个数据集完成后立即输出一行，最后输出汇总
+    if wants_ndjson():
+        def generate():
+            results = []
+            for future in as_completed(futures):
+                item = future.result()
+                results.append(item)
+                yield {'type': 'result', **item}
+            yield {'type': 'summary', **summary(results)}
+        return ndjson_response(generate())
+    
+    results = [future.result() for future in futures]
+    return jsonify({**summary(results), 'results': results})
+
+def upgrade_schema(log=None):
+    """创建缺失的表并应用未执行的结构迁移"""
+    db.create_all()
+    return migrations.apply_migrations(db.engine, log=log)
+
+@app.cli.command('migrate')
+@click.option('--target', type=int, help='只迁移到指定版本')
+def migrate_command(target):
+    """创建缺失的表并按版本号顺序应用结构迁移"""
+    db.create_all()
+    applied = migrations.apply_migrations(db.engine, target=target, log=click.echo)
+    click.echo(f"Schema version {migrations.current_version(db.engine)} ({len(applied)} migrations applied)")
+
+@app.cli.command('migration-status')
+def migration_status_command():
+    """列出各迁移版本及其应用时间"""
+    applied = migrations.applied_migrations(db.engine)
+    for version, name, _ in migrations.MIGRATIONS:
+        state = applied[version][1] if version in applied else 'pending'
+        click.echo(f"{version:04d} {name}: {state}")
+
+def query_plan_probes():
+    """执行各接口与分析数据加载使用的查询，返回记录到的 {语句: 参数}，供 EXPLAIN QUERY PLAN 检查"""
+    summary = DatasetSummary.query.filter(DatasetSummary.has_expression.is_(True)).first()
+    dataset_id = summary.dataset_id if summary else 1
+    dataset = db.session.get(Dataset, dataset_id)
+    task = AnalysisTask.query.order_by(AnalysisTask.id.desc()).first()
+    tissue = dataset.tissue_type if dataset else ''
+    urls = [
+        '/api/datasets?page=1&per_page=20',
+        '/api/datasets?limit=20&sort=-n_samples',
+        f'/api/datasets/{dataset_id}',
+        f'/api/datasets/filter?tissue_type={tissue}',
+        '/api/datasets/filter?limit=20&min_samples=10',
+        '/api/datasets/search?q=tumor',
+        '/api/datasets/statistics',
+        '/api/statistics/overview',
+        '/api/genes/search?q=A',
+        '/api/genes/GENE1/expression',
+        '/api/tasks?limit=20',
+        '/api/tasks?sort=-completed_at&limit=20',
+        '/api/tasks?status=completed&task_type=pca',
+        f'/api/tasks?dataset_id={dataset_id}',
+    ]
+    if task is not None:
+        urls.append(f'/api/tasks/{task.id}')
+    client = app.test_client()
+    with query_plans.record_statements(db.engine) as statements:
+        for url in urls:
+            client.get(url).close()
+        # 分析引擎的数据加载路径（不运行分析本身）
+        _expression_index(dataset_id)
+        for _ in _expression_rows(dataset_id, ['expression_value']).limit(1):
+            pass
+        sample_groups(dataset_id, 'tumor_type')
+        group_samples(dataset_id, tissue or 'x', 'tissue_type')
+        load_stored_result('pca_analysis', {'dataset_id': dataset_id}, dataset_id)
+    return statements
+
+@app.cli.command('check-query-plans')
+@click.option('--verbose', is_flag=True, help='输出每条语句的查询计划')
+def check_query_plans_command(verbose):
+    """检查接口查询在大表上是否都走索引；出现全表扫描时以非零状态退出，可用于 CI"""
+    statements = query_plan_probes()
+    db.session.rollback()
+    problems = 0
+    with db.engine.connect() as connection:
+        for statement, plan, scans in query_plans.check_statements(connection, statements):
+            if scans:
+                problems += 1
+            if scans or verbose:
+                click.echo(('FULL SCAN: ' if scans else 'ok: ') + ' '.join(statement.split())[:300])
+                for detail in plan:
+                    click.echo(f'    {detail}')
+    click.echo(f"Checked {len(statements)} statements, {problems} with full scans of "
+               f"{', '.join(query_plans.LARGE_TABLES)}")
+    if problems:
+        raise SystemExit(1)
 
 if __name__ == '__main__':
-    # 创建数据库表
+    # 创建数据库表并应用结构迁移
     with app.app_context():
-        db.create_all()
+        upgrade_schema(log=print)
+        # 首次启动时生成数据集汇总表
+        if DatasetSummary.query.first() is None:
+            refresh_dataset_summary()
+            db.session.commit()
+
+    # 预加载基因搜索索引与基因集库，并确保数据集全文索引存在
+    with app.app_context():
+        get_gene_index()
+        get_gene_set_library()
+        ensure_dataset_search()
+
+    # 重新排队上次退出时未执行的任务
+    task_queue.recover()
 
     # 部署环境通常提供 PORT 环境变量（如 Render/Heroku）
     port = int(os.environ.get('PORT', '5000'))
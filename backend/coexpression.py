@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# 基因共表达：分块矩阵乘法计算 Pearson/Spearman 相关（不生成完整的 基因×基因 矩阵），
+# 离线构建每个数据集的 top-k 近邻索引供在线查询
+
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from scipy import stats
+
+from expression_store import prepare_rows
+from gene_major_store import collapse_probes
+
+METHODS = ('pearson', 'spearman')
+# 每块的基因行数：块×全部基因 的 float32 相关矩阵约 40MB（2 万基因时）
+ROW_BLOCK = 512
+DEFAULT_TOP_K = 100
+# 索引文件格式版本；格式不同的旧索引视为不存在（查询回退为从表达矩阵计算），重建后恢复
+INDEX_FORMAT = 2
+
+
+def standardize(values, method='pearson', log_transform=True):
+    """把 基因×样本 矩阵变为单位长度的中心化行（float32），行间点积即相关系数；方差为 0 的行全为 0"""
+    if method not in METHODS:
+        raise ValueError(f"Unknown correlation method: {method}")
+    z = np.empty(values.shape, dtype=np.float32)
+    for start in range(0, values.shape[0], 4096):
+        block = prepare_rows(values[start:start + 4096], log_transform)
+        if method == 'spearman':
+            block = stats.rankdata(block, axis=1)
+        block = block - block.mean(axis=1, keepdims=True)
+        norms = np.sqrt((block ** 2).sum(axis=1, keepdims=True))
+        z[start:start + 4096] = np.divide(block, norms, out=np.zeros_like(block), where=norms > 1e-12)
+    return z
+
+
+def correlation_pvalues(r, n_samples):
+    """相关系数的双侧 p 值（t 分布近似，Spearman 同样适用于中等以上样本量）"""
+    r = np.clip(np.asarray(r, dtype=np.float64), -1.0, 1.0)
+    df = n_samples - 2
+    if df <= 0:
+        return np.full(r.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = r * np.sqrt(df / np.maximum(1.0 - r * r, 1e-300))
+    return 2 * stats.t.sf(np.abs(t), df)
+
+
+def _top_k(sims, k, largest=True):
+    """每行取 k 个最大（或最小）值，按相关强度排序，返回 (列号, 值)"""
+    signed = sims if largest else -sims
+    idx = np.argpartition(signed, -k, axis=1)[:, -k:]
+    vals = np.take_along_axis(signed, idx, axis=1)
+    order = np.argsort(-vals, axis=1, kind='stable')
+    idx = np.take_along_axis(idx, order, axis=1)
+    return idx.astype(np.int32), np.take_along_axis(sims, idx, axis=1)
+
+
+def top_k_neighbors(z, k=DEFAULT_TOP_K, workers=0, block=ROW_BLOCK):
+    """每个基因正相关与负相关最强的 k 个基因
+
+    按 block 行分块计算 z[块] @ z.T，块在线程池中并行（矩阵乘法释放 GIL）；内存占用为 workers×block×基因数。
+    返回 (pos_idx, pos_r, neg_idx, neg_r)，形状均为 基因数×k。
+    """
+    n = z.shape[0]
+    k = max(0, min(k, n - 1))
+    pos_idx = np.zeros((n, k), dtype=np.int32)
+    neg_idx = np.zeros((n, k), dtype=np.int32)
+    pos_r = np.zeros((n, k), dtype=np.float32)
+    neg_r = np.zeros((n, k), dtype=np.float32)
+    if not k:
+        return pos_idx, pos_r, neg_idx, neg_r
+
+    def run(start):
+        stop = min(start + block, n)
+        sims = z[start:stop] @ z.T
+        rows = np.arange(stop - start)
+        # 排除基因自身
+        sims[rows, rows + start] = np.inf
+        pos_idx[start:stop], pos_r[start:stop] = _top_k(np.where(np.isinf(sims), -np.inf, sims), k, largest=True)
+        neg_idx[start:stop], neg_r[start:stop] = _top_k(sims, k, largest=False)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1, thread_name_prefix='neta-coexpr') as pool:
+        list(pool.map(run, range(0, n, block)))
+    return pos_idx, pos_r, neg_idx, neg_r
+
+
+def gene_correlations(z, row):
+    """单个基因与全部基因的相关系数（一次矩阵-向量乘法）"""
+    r = z @ z[row]
+    r[row] = np.nan
+    return r
+
+
+def neighbors_from_correlations(r, limit, sign='positive', min_abs_r=0.0):
+    """从一行相关系数中选取近邻下标：sign 为 positive / negative / both（按绝对值）"""
+    r = np.where(np.isnan(r), 0.0, r)
+    key = {'positive': r, 'negative': -r, 'both': np.abs(r)}[sign]
+    limit = min(limit, key.size)
+    idx = np.argpartition(key, -limit)[-limit:] if limit < key.size else np.arange(key.size)
+    idx = idx[np.argsort(-key[idx], kind='stable')]
+    return idx[key[idx] > max(min_abs_r, 0.0)] if sign != 'both' else idx[key[idx] >= min_abs_r]
+
+
+def symbol_rows(matrix):
+    """{大写符号或基因ID: 行号}；同一符号多个探针时取平均表达最高的一行"""
+    values = np.asarray(matrix.values)
+    rows = {gene_id.upper(): i for i, gene_id in enumerate(matrix.gene_ids)}
+    rows.update(collapse_probes(matrix.gene_symbols, values))
+    return rows
+
+
+class CoexpressionIndex:
+    """每个数据集的共表达 top-k 近邻索引
+
+    目录结构::
+
+        <root>/<dataset_id>/meta.json      方法、k、样本数、数据版本
+        <root>/<dataset_id>/genes.tsv      行对应的 gene_id \\t gene_symbol
+        <root>/<dataset_id>/pos_idx.npy    正相关最强的 k 个近邻（行号，按相关系数降序）
+        <root>/<dataset_id>/pos_r.npy      对应的相关系数
+        <root>/<dataset_id>/neg_idx.npy    负相关最强的 k 个近邻
+        <root>/<dataset_id>/neg_r.npy
+
+    查询时以内存映射读取单行。已加载的索引按 meta.json 的 inode 与修改时间判断是否被重建，
+    每次查询只需一次 stat，不重新解析文件。
+    """
+
+    def __init__(self, root='data/processed/coexpression'):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._loaded = {}
+
+    def read_meta(self, dataset_id):
+        meta_file = self.root / str(dataset_id) / 'meta.json'
+        if not meta_file.exists():
+            return None
+        with open(meta_file, 'r') as f:
+            return json.load(f)
+
+    def _load(self, dataset_id):
+        directory = self.root / str(dataset_id)
+        try:
+            st = os.stat(directory / 'meta.json')
+        except FileNotFoundError:
+            return None
+        # 重建时整个目录被原子替换，meta.json 是新文件
+        stamp = (st.st_ino, st.st_mtime_ns)
+        with self._lock:
+            loaded = self._loaded.get(dataset_id)
+            if loaded is not None and loaded['stamp'] == stamp:
+                return loaded
+        meta = self.read_meta(dataset_id)
+        if meta is None or meta.get('format') != INDEX_FORMAT:
+            return None
+        gene_ids, gene_symbols, rows, primary_rows = [], [], {}, {}
+        with open(directory / 'genes.tsv', 'r') as f:
+            for i, line in enumerate(f):
+                gene_id, symbol, primary = line.rstrip('\n').split('\t')
+                gene_ids.append(gene_id)
+                gene_symbols.append(symbol)
+                rows[gene_id.upper()] = i
+                if primary == '1':
+                    primary_rows[symbol.upper()] = i
+        # 与 symbol_rows 相同：基因符号优先于同名的基因ID
+        rows.update(primary_rows)
+        loaded = {
+            'stamp': stamp,
+            'meta': meta,
+            'gene_ids': gene_ids,
+            'gene_symbols': gene_symbols,
+            'rows': rows,
+            **{name: np.load(directory / f'{name}.npy', mmap_mode='r')
+               for name in ('pos_idx', 'pos_r', 'neg_idx', 'neg_r')}
+        }
+        with self._lock:
+            self._loaded[dataset_id] = loaded
+        return loaded
+
+    def lookup(self, dataset_id, gene):
+        """返回 (索引, 行号)；索引不存在返回 None，基因不存在时行号为 None"""
+        loaded = self._load(dataset_id)
+        if loaded is None:
+            return None
+        return loaded, loaded['rows'].get(gene.upper())
+
+    def build(self, dataset_id, matrix, method='pearson', k=DEFAULT_TOP_K, log_transform=True, workers=0,
+              data_version=0, value_column=None):
+        values = np.asarray(matrix.values)
+        z = standardize(values, method, log_transform)
+        primary = set(collapse_probes(matrix.gene_symbols, values).values())
+        pos_idx, pos_r, neg_idx, neg_r = top_k_neighbors(z, k, workers)
+
+        directory = self.root / str(dataset_id)
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_dir = self.root / f".{dataset_id}.tmp-{os.getpid()}"
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+        for name, array in (('pos_idx', pos_idx), ('pos_r', pos_r), ('neg_idx', neg_idx), ('neg_r', neg_r)):
+            np.save(tmp_dir / f'{name}.npy', array)
+        with open(tmp_dir / 'genes.tsv', 'w') as f:
+            for i, (gene_id, symbol) in enumerate(zip(matrix.gene_ids, matrix.gene_symbols)):
+                f.write(f"{gene_id}\t{symbol or ''}\t{int(i in primary)}\n")
+        meta = {
+            'format': INDEX_FORMAT,
+            'dataset_id': dataset_id,
+            'method': method,
+            'k': int(pos_idx.shape[1]),
+            'log_transform': log_transform,
+            'value_column': value_column,
+            'n_genes': int(z.shape[0]),
+            'n_samples': int(z.shape[1]),
+            'data_version': data_version,
+            'built_at': datetime.utcnow().isoformat()
+        }
+        with open(tmp_dir / 'meta.json', 'w') as f:
+            json.dump(meta, f)
+
+        # 原子替换旧索引
+        if directory.exists():
+            old_dir = self.root / f".{dataset_id}.old-{os.getpid()}"
+            os.replace(directory, old_dir)
+            os.replace(tmp_dir, directory)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        else:
+            os.replace(tmp_dir, directory)
+        return meta
+
+    def remove(self, dataset_id):
+        shutil.rmtree(self.root / str(dataset_id), ignore_errors=True)
+        with self._lock:
+            self._loaded.pop(dataset_id, None)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# 数据集全文检索：SQLite FTS5 外部内容表 + 触发器同步 + BM25 排序
+
+import re
+
+from sqlalchemy import text
+
+FTS_TABLE = 'dataset_fts'
+FTS_COLUMNS = ('geo_id', 'title', 'description', 'tissue_type', 'tumor_type', 'platform')
+# BM25 列权重，与 FTS_COLUMNS 顺序一致：GEO编号与标题命中优先于描述
+BM25_WEIGHTS = (10.0, 5.0, 1.0, 2.0, 2.0, 1.0)
+
+_PHRASE_RE = re.compile(r'"([^"]*)"')
+
+
+def fts_supported(connection):
+    """当前数据库是否支持 FTS5（仅 SQLite）"""
+    if connection.dialect.name != 'sqlite':
+        return False
+    options = {row[0] for row in connection.execute(text('PRAGMA compile_options'))}
+    return 'ENABLE_FTS5' in options
+
+
+def ensure_dataset_fts(connection, source_table='datasets'):
+    """创建 FTS 表与同步触发器；首次创建时从数据集表全量构建索引"""
+    exists = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+    ), {'name': FTS_TABLE}).first() is not None
+
+    columns = ', '.join(FTS_COLUMNS)
+    new_values = ', '.join(f'new.{c}' for c in FTS_COLUMNS)
+    old_values = ', '.join(f'old.{c}' for c in FTS_COLUMNS)
+
+    if not exists:
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({columns}, "
+            f"content='{source_table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        ))
+    # 触发器建在数据库中，R导入脚本等外部写入同样会同步到索引
+    connection.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {source_table} BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values}); END"
+    ))
+    connection.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {source_table} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END"
+    ))
+    connection.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON {source_table} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values}); END"
+    ))
+    if not exists:
+        rebuild_dataset_fts(connection)
+
+
+def rebuild_dataset_fts(connection):
+    connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def build_match_query(query):
+    """把用户输入转换为 FTS5 MATCH 表达式
+
+    - "..." 为短语查询
+    - 以 * 结尾的词为前缀查询；最后一个词也按前缀处理，便于输入即搜
+    - 多个条件之间为 AND
+    """
+    phrases = [p.strip() for p in _PHRASE_RE.findall(query) if p.strip()]
+    rest = _PHRASE_RE.sub(' ', query)
+    words = [w for w in re.split(r'\s+', rest.replace('"', ' ')) if w.strip('*')]
+
+    terms = [_quote(p) for p in phrases]
+    for i, word in enumerate(words):
+        prefix = word.endswith('*') or i == len(words) - 1
+        word = word.rstrip('*')
+        terms.append(_quote(word) + ('*' if prefix else ''))
+    return ' AND '.join(terms)
+
+
+def search_dataset_ids(connection, query, limit, summary_table='dataset_summary'):
+    """返回按 BM25 排序的 [(dataset_id, score), ...]，只包含存在表达数据的数据集"""
+    match = build_match_query(query)
+    if not match:
+        return []
+    weights = ', '.join(str(w) for w in BM25_WEIGHTS)
+    rows = connection.execute(text(
+        f"SELECT f.rowid, bm25({FTS_TABLE}, {weights}) AS score "
+        f"FROM {FTS_TABLE} f JOIN {summary_table} s ON s.dataset_id = f.rowid "
+        f"WHERE {FTS_TABLE} MATCH :match AND s.has_expression "
+        f"ORDER BY score LIMIT :limit"
+    ), {'match': match, 'limit': limit})
+    return [(row[0], row[1]) for row in rows]
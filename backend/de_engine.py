@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# 进程内差异表达引擎：全基因矩阵一次性计算 Welch t / 调节 t（limma eBayes）/ 秩和检验 + BH 校正
+
+import numpy as np
+from scipy import special, stats
+
+from expression_store import prepare_rows
+
+METHODS = ('welch', 'moderated', 'rank')
+
+
+def bh_adjust(pvalues):
+    """Benjamini–Hochberg 校正，NaN 保持为 NaN"""
+    p = np.asarray(pvalues, dtype=np.float64)
+    padj = np.full(p.shape, np.nan)
+    valid = ~np.isnan(p)
+    pv = p[valid]
+    n = pv.size
+    if n == 0:
+        return padj
+    order = np.argsort(pv)[::-1]
+    ranked = pv[order] * n / np.arange(n, 0, -1)
+    ranked = np.minimum.accumulate(ranked)
+    out = np.empty(n)
+    out[order] = np.minimum(ranked, 1.0)
+    padj[valid] = out
+    return padj
+
+
+def welch_test(a, b):
+    """逐基因 Welch t 检验，a/b 为 基因×样本 矩阵，返回 (t, p)"""
+    na, nb = a.shape[1], b.shape[1]
+    va, vb = a.var(axis=1, ddof=1) / na, b.var(axis=1, ddof=1) / nb
+    se2 = va + vb
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (b.mean(axis=1) - a.mean(axis=1)) / np.sqrt(se2)
+        df = se2 ** 2 / (va ** 2 / (na - 1) + vb ** 2 / (nb - 1))
+    p = 2 * stats.t.sf(np.abs(t), df)
+    return t, p
+
+
+def _trigamma_inverse(x):
+    """trigamma 的反函数（limma 中的牛顿迭代）"""
+    y = 0.5 + 1.0 / x
+    for _ in range(50):
+        tri = special.polygamma(1, y)
+        dif = tri * (1 - tri / x) / special.polygamma(2, y)
+        y += dif
+        if -dif / y < 1e-8:
+            break
+    return y
+
+
+def fit_f_dist(s2, df):
+    """按 Smyth (2004) 的矩估计拟合方差先验，返回 (s0^2, d0)；d0 为 inf 表示方差完全收缩"""
+    s2 = s2[np.isfinite(s2) & (s2 > 0)]
+    if s2.size < 2:
+        return (float(s2.mean()) if s2.size else 0.0), 0.0
+    z = np.log(s2)
+    e = z - special.digamma(df / 2) + np.log(df / 2)
+    emean = e.mean()
+    evar = e.var(ddof=1) - special.polygamma(1, df / 2)
+    if evar > 0:
+        d0 = 2 * _trigamma_inverse(evar)
+        s0_2 = np.exp(emean + special.digamma(d0 / 2) - np.log(d0 / 2))
+    else:
+        d0 = np.inf
+        s0_2 = np.exp(emean)
+    return float(s0_2), float(d0)
+
+
+def moderated_test(a, b):
+    """limma 式调节 t 检验：合并方差向经验贝叶斯先验收缩，返回 (t, p)"""
+    na, nb = a.shape[1], b.shape[1]
+    df = na + nb - 2
+    ss = ((a - a.mean(axis=1, keepdims=True)) ** 2).sum(axis=1) + ((b - b.mean(axis=1, keepdims=True)) ** 2).sum(axis=1)
+    s2 = ss / df
+    s0_2, d0 = fit_f_dist(s2, df)
+    if np.isinf(d0):
+        s2_post = np.full_like(s2, s0_2)
+    else:
+        s2_post = (d0 * s0_2 + df * s2) / (d0 + df)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (b.mean(axis=1) - a.mean(axis=1)) / np.sqrt(s2_post * (1 / na + 1 / nb))
+    if np.isinf(d0):
+        p = 2 * stats.norm.sf(np.abs(t))
+    else:
+        p = 2 * stats.t.sf(np.abs(t), df + d0)
+    return t, p
+
+
+def rank_test(a, b):
+    """逐基因 Mann–Whitney U 检验（正态近似，含结校正与连续性校正），返回 (z, p)"""
+    na, nb = a.shape[1], b.shape[1]
+    n = na + nb
+    # 每行只排序一次，在排序后的数组上直接计算平均秩，避免逐行 rankdata
+    values = np.concatenate([a, b], axis=1)
+    order = np.argsort(values, axis=1)
+    ordered = np.take_along_axis(values, order, axis=1)
+    positions = np.arange(n)
+    starts = np.ones(ordered.shape, dtype=bool)
+    starts[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    ends = np.ones(ordered.shape, dtype=bool)
+    ends[:, :-1] = starts[:, 1:]
+    first = np.maximum.accumulate(np.where(starts, positions, 0), axis=1)
+    last = np.minimum.accumulate(np.where(ends, positions, n)[:, ::-1], axis=1)[:, ::-1]
+    ranks = (first + last) / 2 + 1
+    u = np.where(order >= na, ranks, 0).sum(axis=1) - nb * (nb + 1) / 2
+    mu = na * nb / 2
+    # 平均秩的平方和与无结时的差额即为 sum(t^3 - t) / 12
+    ties = 12 * (n * (n + 1) * (2 * n + 1) / 6 - (ranks ** 2).sum(axis=1))
+    sigma = np.sqrt(na * nb / 12 * ((n + 1) - ties / (n * (n - 1))))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.sign(u - mu) * np.maximum(np.abs(u - mu) - 0.5, 0) / sigma
+    p = 2 * stats.norm.sf(np.abs(z))
+    return z, p
+
+
+TESTS = {'welch': welch_test, 'moderated': moderated_test, 'rank': rank_test}
+
+
+def _json_values(values):
+    # JSON 不支持 NaN/Infinity，转为 None
+    return [None if v != v or v in (np.inf, -np.inf) else v for v in values.tolist()]
+
+
+def run_differential_expression(matrix, group1_samples, group2_samples, method='moderated', log_transform=True,
+                                pvalue_cutoff=0.05, logfc_cutoff=1.0, parameters=None):
+    """对 ExpressionMatrix 的两组样本做全基因差异表达
+
+    group1 为参照组，log2FoldChange = mean(group2) - mean(group1)（log2 尺度）。
+    输出与 deseq2_analysis.R 相同的 volcano_data/计数字段，并在 de_results 中给出
+    与 deseq2_results.tsv 相同的列（gene, log2FoldChange, pvalue, padj），按 pvalue 排序。
+    """
+    if method not in TESTS:
+        raise ValueError(f"Unknown differential expression method: {method}")
+    idx1 = matrix.sample_indices(group1_samples)
+    idx2 = matrix.sample_indices(group2_samples)
+    if len(idx1) < 2 or len(idx2) < 2:
+        raise ValueError('Each group needs at least 2 samples with expression data')
+
+    a = prepare_rows(matrix.values[:, idx1], log_transform)
+    b = prepare_rows(matrix.values[:, idx2], log_transform)
+    log2fc = b.mean(axis=1) - a.mean(axis=1)
+    base_mean = np.concatenate([a, b], axis=1).mean(axis=1)
+    stat, pvalue = TESTS[method](a, b)
+    padj = bh_adjust(pvalue)
+
+    valid = ~np.isnan(pvalue)
+    significant = valid & (padj < pvalue_cutoff) & (np.abs(log2fc) > logfc_cutoff)
+    with np.errstate(divide='ignore'):
+        neg_log10 = np.where(valid, -np.log10(np.where(valid, pvalue, 1.0)), np.nan)
+
+    symbols = [s or g for s, g in zip(matrix.gene_symbols, matrix.gene_ids)]
+    order = np.lexsort((-np.nan_to_num(np.abs(stat)), np.where(valid, pvalue, np.inf)))
+    columns = {name: _json_values(values[order]) for name, values in (
+        ('baseMean', base_mean), ('log2FoldChange', log2fc), ('stat', stat), ('pvalue', pvalue), ('padj', padj)
+    )}
+    de_results = [{
+        'gene': symbols[i],
+        'gene_id': matrix.gene_ids[i],
+        'baseMean': base,
+        'log2FoldChange': fc,
+        'stat': st,
+        'pvalue': p,
+        'padj': q
+    } for i, base, fc, st, p, q in zip(order.tolist(), *columns.values())]
+    volcano_data = [{
+        'log2FoldChange': fc,
+        'negLog10Pvalue': nl,
+        'gene_symbol': symbol,
+        'significant': sig
+    } for fc, nl, symbol, sig in zip(_json_values(log2fc), _json_values(neg_log10), symbols, significant.tolist())]
+
+    return {
+        'status': 'completed',
+        'message': 'Differential expression analysis completed successfully',
+        'results': {
+            'volcano_data': volcano_data,
+            'de_results': de_results,
+            'upregulated_count': int((significant & (log2fc > 0)).sum()),
+            'downregulated_count': int((significant & (log2fc < 0)).sum()),
+            'significant_count': int(significant.sum()),
+            'total_genes': len(symbols),
+            'n_group1': len(idx1),
+            'n_group2': len(idx2),
+            'method': method,
+            'engine': 'python',
+            'parameters': parameters or {}
+        }
+    }
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+# 进程内基因集富集引擎：GMT 基因集常驻内存（整数数组），超几何检验一次覆盖全部基因集，可选 preranked GSEA
+
+import gzip
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from scipy import special
+
+from de_engine import bh_adjust
+
+GMT_SUFFIXES = ('.gmt', '.gmt.gz')
+
+# 每批置换数，控制 GSEA 零分布中间矩阵的内存
+PERMUTATION_BATCH = 256
+
+
+def read_gmt(path):
+    """逐行读取 GMT：名称 \\t 描述 \\t 基因...，返回 [(名称, 描述, [基因])]"""
+    opener = gzip.open if str(path).endswith('.gz') else open
+    sets = []
+    with opener(path, 'rt', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            fields = line.rstrip('\r\n').split('\t')
+            if len(fields) < 3 or not fields[0]:
+                continue
+            sets.append((fields[0], fields[1], [g for g in fields[2:] if g]))
+    return sets
+
+
+def collection_name(path):
+    name = Path(path).name
+    for suffix in GMT_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def gene_keys(row):
+    """基因表一行 (gene_id, gene_symbol, entrez_id, ensembl_id) 可被 GMT 与查询列表引用的标识（大写）"""
+    keys = []
+    for identifier in row:
+        if not identifier:
+            continue
+        identifier = str(identifier).upper()
+        keys.append(identifier)
+        # Ensembl ID 允许不带版本号（ENSG00000141510.16 -> ENSG00000141510）
+        if identifier.startswith('ENS') and '.' in identifier:
+            keys.append(identifier.split('.', 1)[0])
+    return keys
+
+
+class _LibraryIndex:
+    """映射到基因表位置空间后的基因集（CSR 整数数组，只读，整体替换）"""
+
+    def __init__(self, names, descriptions, collections, indptr, members, universe_symbols, lookup, version):
+        self.names = names
+        self.descriptions = descriptions
+        self.collections = collections
+        self.indptr = indptr
+        self.members = members
+        # 每个成员所属基因集的下标，用于 bincount 一次统计所有基因集的重叠数
+        self.member_set = np.repeat(np.arange(len(names), dtype=np.int32), np.diff(indptr))
+        self.sizes = np.diff(indptr)
+        self.universe_symbols = universe_symbols
+        self.lookup = lookup
+        self.version = version
+
+    @property
+    def universe_size(self):
+        return len(self.universe_symbols)
+
+
+class GeneSetLibrary:
+    """从本地 GMT 文件加载的基因集库
+
+    GMT 文件只解析一次，基因以词表编号保存；基因表（数据版本）变化时只重新映射到基因表位置空间。
+    每个基因集保存为排序后的 int32 位置数组（CSR），无法映射到基因表的基因被丢弃。
+    """
+
+    def __init__(self, directory='data/gene_sets'):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+        self._parsed = None
+        self._index = None
+
+    @property
+    def version(self):
+        return self._index.version if self._index is not None else None
+
+    def files(self):
+        if not self.directory.is_dir():
+            return []
+        return sorted(p for p in self.directory.iterdir() if p.name.endswith(GMT_SUFFIXES))
+
+    def _parse(self):
+        vocabulary = {}
+        names, descriptions, collections, tokens = [], [], [], []
+        for path in self.files():
+            collection = collection_name(path)
+            for name, description, genes in read_gmt(path):
+                names.append(name)
+                descriptions.append(description)
+                collections.append(collection)
+                tokens.append(np.fromiter(
+                    (vocabulary.setdefault(g.upper(), len(vocabulary)) for g in genes), dtype=np.int32, count=len(genes)
+                ))
+        return {'vocabulary': vocabulary, 'names': names, 'descriptions': descriptions,
+                'collections': collections, 'tokens': tokens}
+
+    def build(self, universe_rows, version=None):
+        """universe_rows: 按基因表位置排列的 (gene_id, gene_symbol, entrez_id, ensembl_id)"""
+        if self._parsed is None:
+            self._parsed = self._parse()
+        parsed = self._parsed
+
+        lookup = {}
+        symbols = []
+        for pos, row in enumerate(universe_rows):
+            symbols.append(row[1] or row[0])
+            for key in gene_keys(row):
+                lookup.setdefault(key, pos)
+
+        vocabulary = parsed['vocabulary']
+        token_pos = np.full(len(vocabulary), -1, dtype=np.int32)
+        for token, tid in vocabulary.items():
+            pos = lookup.get(token)
+            if pos is not None:
+                token_pos[tid] = pos
+
+        indptr = np.zeros(len(parsed['tokens']) + 1, dtype=np.int64)
+        chunks = []
+        for i, tokens in enumerate(parsed['tokens']):
+            positions = token_pos[tokens]
+            positions = np.unique(positions[positions >= 0])
+            chunks.append(positions)
+            indptr[i + 1] = indptr[i] + positions.size
+        members = np.concatenate(chunks).astype(np.int32) if chunks else np.zeros(0, dtype=np.int32)
+
+        index = _LibraryIndex(parsed['names'], parsed['descriptions'], parsed['collections'], indptr, members,
+                              symbols, lookup, version)
+        with self._lock:
+            self._index = index
+        return index
+
+    def index(self):
+        return self._index
+
+    def stats(self):
+        index = self._index
+        if index is None:
+            return {'loaded': False, 'files': [p.name for p in self.files()]}
+        counts = {}
+        for collection in index.collections:
+            counts[collection] = counts.get(collection, 0) + 1
+        return {
+            'loaded': True,
+            'version': index.version,
+            'gene_sets': len(index.names),
+            'memberships': int(index.members.size),
+            'universe_size': index.universe_size,
+            'collections': counts
+        }
+
+
+def map_genes(index, genes):
+    """把基因列表映射为去重的基因表位置，返回 (位置数组, 未识别的基因)"""
+    positions, unmapped = set(), []
+    for gene in genes:
+        pos = index.lookup.get(str(gene).strip().upper())
+        if pos is None:
+            unmapped.append(gene)
+        else:
+            positions.add(pos)
+    return np.fromiter(sorted(positions), dtype=np.int64, count=len(positions)), unmapped
+
+
+def _selected_sets(index, collections, min_size, max_size, set_sizes):
+    selected = (set_sizes >= min_size) & (set_sizes <= max_size)
+    if collections:
+        wanted = set(collections)
+        selected &= np.fromiter((c in wanted for c in index.collections), dtype=bool, count=len(index.names))
+    return selected
+
+
+def _log_hypergeom_pmf(x, total, n, draws):
+    return (special.gammaln(n + 1) - special.gammaln(x + 1) - special.gammaln(n - x + 1)
+            + special.gammaln(total - n + 1) - special.gammaln(draws - x + 1) - special.gammaln(total - n - draws + x + 1)
+            - special.gammaln(total + 1) + special.gammaln(draws + 1) + special.gammaln(total - draws + 1))
+
+
+def _pmf_run(start, steps, ratio, chunk=32):
+    """从 pmf(start) 出发按相邻项比值递推至多 steps 项并求和（每行一个基因集）
+
+    按 chunk 列分段递推，后续项相对已有和小于 1e-17 的行提前结束。
+    """
+    total = np.zeros(start.shape)
+    rows = np.flatnonzero(steps > 0)
+    last = np.exp(start)
+    done = 0
+    while rows.size:
+        offsets = np.arange(done, done + chunk)
+        r = ratio(rows, offsets)
+        if done == 0:
+            r[:, 0] = 1.0
+        terms = last[rows, None] * np.cumprod(r, axis=1)
+        terms[offsets[None, :] >= steps[rows, None]] = 0.0
+        total[rows] += terms.sum(axis=1)
+        last[rows] = terms[:, -1]
+        done += chunk
+        rows = rows[(steps[rows] > done) & (last[rows] > total[rows] * 1e-17)]
+    return total
+
+
+def hypergeom_sf(k, total, n, draws):
+    """超几何分布上尾 P(X >= k)，k/n 为数组（每个基因集一个值），total/draws 为标量
+
+    与 scipy.stats.hypergeom.sf(k - 1, total, n, draws) 相同，但按相邻概率的比值向量化递推，
+    上万个基因集一次计算只需毫秒级；k 不超过期望时改为 1 - 下尾和，只需递推 k 项。
+    """
+    k = np.asarray(k, dtype=np.float64)
+    n = np.asarray(n, dtype=np.float64)
+    lo = np.maximum(0, draws + n - total)
+    hi = np.minimum(n, draws)
+    p = np.where(k <= lo, 1.0, 0.0)
+    active = (k > lo) & (k <= hi)
+    upper = active & (k > n * draws / total)
+    lower = active & ~upper
+
+    if upper.any():
+        ku, nu = k[upper], n[upper]
+
+        def ratio(rows, offsets):
+            x = ku[rows, None] + offsets[None, :] - 1
+            n_ = nu[rows, None]
+            return (n_ - x) * (draws - x) / ((x + 1) * (total - n_ - draws + x + 1))
+        p[upper] = _pmf_run(_log_hypergeom_pmf(ku, total, nu, draws), hi[upper] - ku + 1, ratio)
+
+    if lower.any():
+        kl, nl = k[lower] - 1, n[lower]
+
+        def ratio(rows, offsets):
+            x = kl[rows, None] - offsets[None, :] + 1
+            n_ = nl[rows, None]
+            return x * (total - n_ - draws + x) / ((n_ - x + 1) * (draws - x + 1))
+        cdf = _pmf_run(_log_hypergeom_pmf(kl, total, nl, draws), kl - lo[lower] + 1, ratio)
+        p[lower] = np.clip(1.0 - cdf, 0.0, 1.0)
+    return np.clip(p, 0.0, 1.0)
+
+
+def _json_value(v):
+    return None if v != v or v in (np.inf, -np.inf) else float(v)
+
+
+def run_ora(index, gene_list, background=None, collections=None, min_size=10, max_size=500, max_results=200,
+            padj_cutoff=0.05, parameters=None):
+    """过表达分析：对全部基因集一次计算重叠数与超几何上尾 p 值（等价于单侧 Fisher 精确检验），BH 校正
+
+    background 为基因表位置数组（如数据集中测到的基因）；None 表示整个基因表。
+    """
+    query, unmapped = map_genes(index, gene_list)
+    universe = np.zeros(index.universe_size, dtype=bool)
+    if background is not None:
+        universe[background] = True
+        query = query[universe[query]]
+    else:
+        universe[:] = True
+    if query.size == 0:
+        raise ValueError('None of the genes in gene_list were found in the gene annotation')
+
+    in_query = np.zeros(index.universe_size, dtype=bool)
+    in_query[query] = True
+    n_sets = len(index.names)
+    member_weights = universe[index.members] if background is not None else None
+    set_sizes = (np.bincount(index.member_set, weights=member_weights, minlength=n_sets).astype(np.int64)
+                 if background is not None else index.sizes)
+    overlap = np.bincount(index.member_set, weights=in_query[index.members], minlength=n_sets).astype(np.int64)
+
+    selected = _selected_sets(index, collections, min_size, max_size, set_sizes)
+    tested = np.flatnonzero(selected)
+    total, n_query = int(universe.sum()), int(query.size)
+    pvalue = np.ones(tested.size)
+    hit = overlap[tested] > 0
+    # 重叠为 0 的基因集 p = 1，不必计算
+    pvalue[hit] = hypergeom_sf(overlap[tested][hit], total, set_sizes[tested][hit], n_query)
+    padj = bh_adjust(pvalue)
+    expected = set_sizes[tested] * n_query / total
+
+    order = np.lexsort((-overlap[tested], pvalue))
+    if max_results:
+        order = order[:int(max_results)]
+    results = []
+    for j in order.tolist():
+        i = int(tested[j])
+        genes = index.members[index.indptr[i]:index.indptr[i + 1]]
+        genes = genes[in_query[genes]]
+        results.append({
+            'gene_set': index.names[i],
+            'description': index.descriptions[i],
+            'collection': index.collections[i],
+            'set_size': int(set_sizes[i]),
+            'overlap': int(overlap[i]),
+            'expected': _json_value(expected[j]),
+            'fold_enrichment': _json_value(overlap[i] / expected[j]) if expected[j] else None,
+            'pvalue': _json_value(pvalue[j]),
+            'padj': _json_value(padj[j]),
+            'genes': [index.universe_symbols[g] for g in genes.tolist()]
+        })
+
+    return {
+        'status': 'completed',
+        'message': 'Enrichment analysis completed successfully',
+        'results': {
+            'method': 'ora',
+            'enrichment_results': results,
+            'total_gene_sets': int(tested.size),
+            'significant_count': int((padj < padj_cutoff).sum()),
+            'n_query_genes': n_query,
+            'n_background_genes': total,
+            'unmapped_genes': unmapped,
+            'engine': 'python',
+            'parameters': parameters or {}
+        }
+    }
+
+
+def enrichment_scores(hit_ranks, weights, n_genes):
+    """加权 KS 富集分数，hit_ranks 为 B×k 的排序后命中位置（每行一个基因集），weights 为排序列表的基因权重
+
+    最大偏离只可能出现在命中处（向上）或命中前一步（向下），因此只需在 k 个命中位置上计算。
+    """
+    k = hit_ranks.shape[1]
+    w = weights[hit_ranks]
+    total = w.sum(axis=1, keepdims=True)
+    total = np.where(total > 0, total, 1.0)
+    hit_cum = np.cumsum(w, axis=1) / total
+    miss_before = (hit_ranks - np.arange(k)) / max(n_genes - k, 1)
+    top = hit_cum - miss_before
+    bottom = hit_cum - w / total - miss_before
+    es_max, es_min = top.max(axis=1), bottom.min(axis=1)
+    return np.where(es_max >= -es_min, es_max, es_min), np.where(es_max >= -es_min, top.argmax(axis=1), bottom.argmin(axis=1))
+
+
+def random_subsets(n_genes, length, permutations, seed):
+    """permutations 行随机排列的前 length 个位置；任一前缀 [:, :k] 都是大小为 k 的均匀无放回抽样"""
+    rng = np.random.default_rng(seed)
+    prefixes = np.empty((permutations, length), dtype=np.int64)
+    for start in range(0, permutations, PERMUTATION_BATCH):
+        keys = rng.random((min(PERMUTATION_BATCH, permutations - start), n_genes))
+        part = np.argpartition(keys, length - 1, axis=1)[:, :length] if length < n_genes else np.argsort(keys, axis=1)
+        order = np.argsort(np.take_along_axis(keys, part, axis=1), axis=1)
+        prefixes[start:start + part.shape[0]] = np.take_along_axis(part, order, axis=1)
+    return prefixes
+
+
+def run_gsea(index, ranked_genes, collections=None, min_size=15, max_size=500, permutations=1000, weight=1.0,
+             max_results=200, padj_cutoff=0.05, workers=None, seed=0, parameters=None):
+    """preranked GSEA：ranked_genes 为 {基因: 分数} 或 [(基因, 分数)]，按分数降序排列
+
+    零分布按基因集大小共享：每个不同大小各有 permutations 个随机基因集（与 fgsea 的简单模式相同），
+    不同大小的置换在线程池中并行计算。NES 为 ES 除以同号零分布均值；FDR 为名义 p 值的 BH 校正。
+    """
+    if isinstance(ranked_genes, dict):
+        ranked_genes = list(ranked_genes.items())
+    scores = {}
+    unmapped = []
+    for gene, score in ranked_genes:
+        pos = index.lookup.get(str(gene).strip().upper())
+        if pos is None or score is None:
+            unmapped.append(gene)
+        elif pos not in scores or abs(score) > abs(scores[pos]):
+            scores[pos] = float(score)
+    if len(scores) < 2:
+        raise ValueError('ranked_genes needs at least 2 genes found in the gene annotation')
+
+    positions = np.fromiter(scores.keys(), dtype=np.int64, count=len(scores))
+    values = np.fromiter(scores.values(), dtype=np.float64, count=len(scores))
+    order = np.argsort(-values, kind='stable')
+    positions, values = positions[order], values[order]
+    n_genes = positions.size
+    rank_of = np.full(index.universe_size, -1, dtype=np.int64)
+    rank_of[positions] = np.arange(n_genes)
+    weights = np.abs(values) ** weight
+
+    member_ranks = rank_of[index.members]
+    in_list = member_ranks >= 0
+    n_sets = len(index.names)
+    set_sizes = np.bincount(index.member_set, weights=in_list, minlength=n_sets).astype(np.int64)
+    tested = np.flatnonzero(_selected_sets(index, collections, min_size, max_size, set_sizes))
+    if tested.size == 0:
+        raise ValueError('No gene sets within the size limits overlap the ranked list')
+
+    hits = {}
+    for i in tested.tolist():
+        ranks = member_ranks[index.indptr[i]:index.indptr[i + 1]]
+        hits[i] = np.sort(ranks[ranks >= 0])
+    es = np.empty(tested.size)
+    peak = np.empty(tested.size, dtype=np.int64)
+    by_size = {}
+    for j, i in enumerate(tested.tolist()):
+        by_size.setdefault(int(set_sizes[i]), []).append(j)
+    for size, js in by_size.items():
+        ranks = np.stack([hits[int(tested[j])] for j in js])
+        es[js], peak[js] = enrichment_scores(ranks, weights, n_genes)
+
+    # 所有大小共用同一批随机排列，各大小取其前缀；按大小分批在线程池中计算（NumPy 排序与累加释放 GIL）
+    prefixes = random_subsets(n_genes, max(by_size), permutations, seed)
+    workers = workers or min(os.cpu_count() or 1, 8)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        nulls = dict(zip(by_size, pool.map(
+            lambda size: enrichment_scores(np.sort(prefixes[:, :size], axis=1), weights, n_genes)[0], by_size
+        )))
+
+    nes = np.full(tested.size, np.nan)
+    pvalue = np.full(tested.size, np.nan)
+    for size, js in by_size.items():
+        null = nulls[size]
+        positive, negative = null[null >= 0], null[null < 0]
+        for j in js:
+            if es[j] >= 0:
+                pvalue[j] = (np.count_nonzero(positive >= es[j]) + 1) / (positive.size + 1)
+                nes[j] = es[j] / positive.mean() if positive.size else np.nan
+            else:
+                pvalue[j] = (np.count_nonzero(negative <= es[j]) + 1) / (negative.size + 1)
+                nes[j] = -es[j] / negative.mean() if negative.size else np.nan
+    padj = bh_adjust(pvalue)
+
+    # 置换 p 值的分辨率有限（多个基因集同为 1/(n+1)），按 |NES| 排序
+    order = np.lexsort((pvalue, -np.abs(np.nan_to_num(nes))))
+    if max_results:
+        order = order[:int(max_results)]
+    results = []
+    for j in order.tolist():
+        i = int(tested[j])
+        ranks = hits[i]
+        # 领先基因：正向富集为峰值及之前的命中，负向为峰值及之后的命中
+        leading = ranks[:peak[j] + 1] if es[j] >= 0 else ranks[peak[j]:]
+        results.append({
+            'gene_set': index.names[i],
+            'description': index.descriptions[i],
+            'collection': index.collections[i],
+            'set_size': int(set_sizes[i]),
+            'es': _json_value(es[j]),
+            'nes': _json_value(nes[j]),
+            'pvalue': _json_value(pvalue[j]),
+            'padj': _json_value(padj[j]),
+            'leading_edge': [index.universe_symbols[g] for g in positions[leading].tolist()]
+        })
+
+    return {
+        'status': 'completed',
+        'message': 'Enrichment analysis completed successfully',
+        'results': {
+            'method': 'gsea',
+            'gsea_results': results,
+            'total_gene_sets': int(tested.size),
+            'significant_count': int((padj < padj_cutoff).sum()),
+            'n_ranked_genes': n_genes,
+            'permutations': permutations,
+            'unmapped_genes': unmapped,
+            'engine': 'python',
+            'parameters': parameters or {}
+        }
+    }
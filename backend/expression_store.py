@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# 列式表达矩阵存储：每个数据集一个 float32 基因×样本 稠密矩阵（内存映射、只读）
+
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+# 允许写入矩阵的表达值列（对应 GeneExpression 模型字段）
+VALUE_COLUMNS = ('expression_value', 'log2_expression', 'normalized_value', 'percentile_rank')
+DEFAULT_VALUE_COLUMNS = ('expression_value', 'log2_expression')
+
+
+def prepare_rows(block, log_transform=True):
+    """把一块基因行转为 float64，可选 log2(x+1) 变换，并用行均值填补缺失值"""
+    block = np.asarray(block, dtype=np.float64)
+    if log_transform:
+        block = np.log2(np.clip(block, 0, None) + 1)
+    if np.isnan(block).any():
+        row_means = np.nanmean(block, axis=1, keepdims=True)
+        row_means = np.where(np.isnan(row_means), 0.0, row_means)
+        block = np.where(np.isnan(block), row_means, block)
+    return block
+
+
+class ExpressionMatrix:
+    """基因×样本表达矩阵及其行列索引
+
+    values 可以是 np.memmap（来自列式存储）或普通 ndarray（数据库回退），
+    调用方只读使用，切片得到的是视图而不是拷贝。
+    """
+
+    def __init__(self, values, gene_ids, gene_symbols, sample_ids, source='memory', data_version=None):
+        self.values = values
+        self.data_version = data_version
+        self.gene_ids = list(gene_ids)
+        self.gene_symbols = list(gene_symbols)
+        self.sample_ids = list(sample_ids)
+        self.source = source
+        self._gene_pos = None
+        self._sample_pos = None
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def gene_index(self, gene):
+        """按 gene_id 或基因符号查找行号，找不到返回 None"""
+        if self._gene_pos is None:
+            pos = {}
+            # 基因符号优先级低于 gene_id，先写符号再由 gene_id 覆盖
+            for i, symbol in enumerate(self.gene_symbols):
+                if symbol:
+                    pos.setdefault(symbol, i)
+            for i, gene_id in enumerate(self.gene_ids):
+                pos[gene_id] = i
+            self._gene_pos = pos
+        return self._gene_pos.get(gene)
+
+    def sample_indices(self, sample_ids):
+        """把样本ID列表映射为列号，忽略不存在的样本"""
+        if self._sample_pos is None:
+            self._sample_pos = {s: i for i, s in enumerate(self.sample_ids)}
+        return [self._sample_pos[s] for s in sample_ids if s in self._sample_pos]
+
+    def row(self, gene):
+        """返回单个基因在所有样本上的表达值（视图）"""
+        idx = self.gene_index(gene)
+        if idx is None:
+            return None
+        return self.values[idx]
+
+
+class ExpressionStore:
+    """按数据集保存的内存映射表达矩阵
+
+    目录结构::
+
+        <root>/<dataset_id>/meta.json
+        <root>/<dataset_id>/genes.tsv        gene_id \\t gene_symbol
+        <root>/<dataset_id>/samples.txt
+        <root>/<dataset_id>/<value_column>.f32
+
+    打开的 memmap 句柄使用 LRU 限制数量，矩阵页面由操作系统页缓存管理，
+    因此进程常驻内存不会随数据集数量增长。
+    """
+
+    def __init__(self, root='data/processed/expression_store', max_open=16):
+        self.root = Path(root)
+        self.max_open = max_open
+        self._handles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def dataset_dir(self, dataset_id):
+        return self.root / str(int(dataset_id))
+
+    def has_dataset(self, dataset_id, value_column='expression_value'):
+        return (self.dataset_dir(dataset_id) / f"{value_column}.f32").exists()
+
+    def list_datasets(self):
+        """列出已构建的数据集ID"""
+        if not self.root.exists():
+            return []
+        return sorted(int(p.name) for p in self.root.iterdir()
+                      if p.is_dir() and p.name.isdigit() and (p / 'meta.json').exists())
+
+    def read_meta(self, dataset_id):
+        meta_file = self.dataset_dir(dataset_id) / 'meta.json'
+        if not meta_file.exists():
+            return None
+        with open(meta_file, 'r') as f:
+            return json.load(f)
+
+    def open(self, dataset_id, value_column='expression_value', data_version=None):
+        """以只读方式打开数据集矩阵，不存在时返回 None
+
+        给出 data_version 时，构建时记录的数据版本与之不同（数据已更新）的矩阵视为不存在。
+        """
+        key = (int(dataset_id), value_column)
+        with self._lock:
+            matrix = self._handles.get(key)
+            if matrix is not None and (data_version is None or matrix.data_version == data_version):
+                self._handles.move_to_end(key)
+                return matrix
+
+        directory = self.dataset_dir(dataset_id)
+        matrix_file = directory / f"{value_column}.f32"
+        meta = self.read_meta(dataset_id)
+        if meta is None or not matrix_file.exists():
+            return None
+        if data_version is not None and meta.get('data_version') != data_version:
+            return None
+
+        gene_ids, gene_symbols = [], []
+        with open(directory / 'genes.tsv', 'r') as f:
+            for line in f:
+                gene_id, _, symbol = line.rstrip('\n').partition('\t')
+                gene_ids.append(gene_id)
+                gene_symbols.append(symbol)
+        with open(directory / 'samples.txt', 'r') as f:
+            sample_ids = [line.rstrip('\n') for line in f]
+
+        n_genes, n_samples = meta['shape']
+        if n_genes == 0 or n_samples == 0:
+            values = np.empty((n_genes, n_samples), dtype=np.float32)
+        else:
+            values = np.memmap(matrix_file, dtype=np.float32, mode='r', shape=(n_genes, n_samples))
+        matrix = ExpressionMatrix(values, gene_ids, gene_symbols, sample_ids, source='store',
+                                  data_version=meta.get('data_version'))
+
+        with self._lock:
+            self._handles[key] = matrix
+            self._handles.move_to_end(key)
+            while len(self._handles) > self.max_open:
+                self._handles.popitem(last=False)
+        return matrix
+
+    def evict(self, dataset_id):
+        """关闭某个数据集的所有已打开句柄"""
+        with self._lock:
+            for key in [k for k in self._handles if k[0] == int(dataset_id)]:
+                del self._handles[key]
+
+    def build(self, dataset_id, genes, sample_ids, rows, value_columns=DEFAULT_VALUE_COLUMNS,
+              chunk_size=50000, data_version=None):
+        """从长表行流构建数据集矩阵
+
+        genes: [(gene_id, gene_symbol), ...]，决定矩阵行顺序
+        sample_ids: 样本ID列表，决定矩阵列顺序
+        rows: 可迭代的 (gene_id, sample_id, value_1, value_2, ...)，
+              值的顺序与 value_columns 一致；缺失的单元格保持为 NaN
+        data_version: 构建时数据集的数据版本，open() 据此判断矩阵是否过期
+        """
+        for column in value_columns:
+            if column not in VALUE_COLUMNS:
+                raise ValueError(f"Unknown expression value column: {column}")
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        final_dir = self.dataset_dir(dataset_id)
+        tmp_dir = self.root / f".{int(dataset_id)}.tmp-{os.getpid()}"
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+
+        gene_pos = {gene_id: i for i, (gene_id, _) in enumerate(genes)}
+        sample_pos = {s: i for i, s in enumerate(sample_ids)}
+        shape = (len(genes), len(sample_ids))
+
+        matrices = []
+        for column in value_columns:
+            path = tmp_dir / f"{column}.f32"
+            if shape[0] and shape[1]:
+                mm = np.memmap(path, dtype=np.float32, mode='w+', shape=shape)
+                # 按行块填充 NaN，避免一次性分配整块内存
+                for start in range(0, shape[0], 4096):
+                    mm[start:start + 4096] = np.nan
+            else:
+                path.touch()
+                mm = None
+            matrices.append(mm)
+
+        n_values = len(value_columns)
+        row_idx, col_idx = [], []
+        vals = [[] for _ in range(n_values)]
+        n_cells = 0
+
+        def flush():
+            if not row_idx:
+                return
+            r = np.fromiter(row_idx, dtype=np.int64, count=len(row_idx))
+            c = np.fromiter(col_idx, dtype=np.int64, count=len(col_idx))
+            for k, mm in enumerate(matrices):
+                if mm is not None:
+                    mm[r, c] = np.array(vals[k], dtype=np.float64).astype(np.float32)
+                vals[k].clear()
+            row_idx.clear()
+            col_idx.clear()
+
+        for row in rows:
+            gi = gene_pos.get(row[0])
+            si = sample_pos.get(row[1])
+            if gi is None or si is None:
+                continue
+            row_idx.append(gi)
+            col_idx.append(si)
+            for k in range(n_values):
+                value = row[2 + k]
+                vals[k].append(np.nan if value is None else value)
+            n_cells += 1
+            if len(row_idx) >= chunk_size:
+                flush()
+        flush()
+
+        for mm in matrices:
+            if mm is not None:
+                mm.flush()
+                del mm
+        matrices.clear()
+
+        with open(tmp_dir / 'genes.tsv', 'w') as f:
+            for gene_id, symbol in genes:
+                f.write(f"{gene_id}\t{symbol or ''}\n")
+        with open(tmp_dir / 'samples.txt', 'w') as f:
+            for sample_id in sample_ids:
+                f.write(f"{sample_id}\n")
+
+        meta = {
+            'dataset_id': int(dataset_id),
+            'shape': list(shape),
+            'dtype': 'float32',
+            'order': 'C',
+            'value_columns': list(value_columns),
+            'n_cells': n_cells,
+            'data_version': data_version,
+            'built_at': datetime.utcnow().isoformat()
+        }
+        with open(tmp_dir / 'meta.json', 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        # 原子替换旧目录；已打开旧文件的读者在 POSIX 下不受影响
+        self.evict(dataset_id)
+        if final_dir.exists():
+            old_dir = self.root / f".{int(dataset_id)}.old-{os.getpid()}"
+            os.replace(final_dir, old_dir)
+            os.replace(tmp_dir, final_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        else:
+            os.replace(tmp_dir, final_dir)
+        return meta
+
+    def remove(self, dataset_id):
+        """删除数据集矩阵"""
+        self.evict(dataset_id)
+        directory = self.dataset_dir(dataset_id)
+        if directory.exists():
+            shutil.rmtree(directory)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# 进程内基因搜索索引：精确符号 > 精确ID > 符号前缀 > 名称词前缀 > 符号子串
+
+import gc
+import re
+import threading
+from array import array
+from collections import defaultdict
+from bisect import bisect_left
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+# 匹配等级（数值越小排名越前）
+RANK_EXACT_SYMBOL = 0
+RANK_EXACT_ID = 1
+RANK_SYMBOL_PREFIX = 2
+RANK_NAME_PREFIX = 3
+RANK_SYMBOL_SUBSTRING = 4
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class GeneSearchIndex:
+    """基因表的内存索引
+
+    - 符号、gene_id、Entrez、Ensembl（含去版本号）精确匹配使用字典
+    - 符号前缀与名称单词前缀使用排序数组二分查找
+    - 长度 >= 3 的查询再用符号三元组倒排表做子串匹配
+    """
+
+    def __init__(self):
+        self.version = None
+        self.size = 0
+        self._rows = []
+        self._exact_symbol = {}
+        self._exact_id = {}
+        self._symbol_keys = []
+        self._symbol_pos = array('i')
+        self._word_keys = []
+        self._word_pos = array('i')
+        self._trigrams = {}
+        self._lock = threading.Lock()
+
+    def build(self, rows, version=None):
+        """rows: 可迭代的 (id, gene_id, gene_symbol, gene_name, chromosome, gene_type, entrez_id, ensembl_id)"""
+        # 构建期间会创建数百万个小对象，暂停循环垃圾回收以避免反复全量扫描
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._build(rows, version)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def _build(self, rows, version):
+        genes = []
+        exact_symbol, exact_id = {}, {}
+        symbols, words = [], []
+        trigrams = defaultdict(list)
+
+        for row in rows:
+            pos = len(genes)
+            genes.append(tuple(row[:6]))
+            symbol = (row[2] or '').lower()
+            if symbol:
+                exact_symbol.setdefault(symbol, []).append(pos)
+                symbols.append((symbol, pos))
+                for tri in _trigrams(symbol):
+                    trigrams[tri].append(pos)
+            for identifier in (row[1], row[6], row[7]):
+                if not identifier:
+                    continue
+                identifier = str(identifier).lower()
+                exact_id.setdefault(identifier, []).append(pos)
+                # Ensembl ID 允许不带版本号查询（ENSG00000141510.16 -> ENSG00000141510）
+                if identifier.startswith('ens') and '.' in identifier:
+                    exact_id.setdefault(identifier.split('.', 1)[0], []).append(pos)
+            for word in set(_WORD_RE.findall((row[3] or '').lower())):
+                words.append((word, pos))
+
+        symbols.sort()
+        words.sort()
+
+        with self._lock:
+            self._rows = genes
+            self._exact_symbol = exact_symbol
+            self._exact_id = exact_id
+            self._symbol_keys = [s for s, _ in symbols]
+            self._symbol_pos = array('i', (p for _, p in symbols))
+            self._word_keys = [w for w, _ in words]
+            self._word_pos = array('i', (p for _, p in words))
+            self._trigrams = {tri: array('i', positions) for tri, positions in trigrams.items()}
+            self.size = len(genes)
+            self.version = version
+        return self
+
+    @staticmethod
+    def _prefix_range(keys, prefix):
+        lo = bisect_left(keys, prefix)
+        hi = bisect_left(keys, prefix + '\uffff', lo)
+        return lo, hi
+
+    @staticmethod
+    def _name_matches(name, words):
+        tokens = _WORD_RE.findall((name or '').lower())
+        return all(any(t.startswith(w) for t in tokens) for w in words)
+
+    def search(self, query, limit=50):
+        """返回 [(rank, row), ...]，row 为 (id, gene_id, gene_symbol, gene_name, chromosome, gene_type)"""
+        q = query.strip().lower()
+        with self._lock:
+            rows = self._rows
+            if not q:
+                return [(RANK_SYMBOL_PREFIX, r) for r in rows[:limit]]
+
+            seen = set()
+            results = []
+
+            def take(positions, rank):
+                for pos in positions:
+                    if len(results) >= limit:
+                        return True
+                    if pos not in seen:
+                        seen.add(pos)
+                        results.append((rank, rows[pos]))
+                return len(results) >= limit
+
+            if take(self._exact_symbol.get(q, ()), RANK_EXACT_SYMBOL):
+                return results
+            if take(self._exact_id.get(q, ()), RANK_EXACT_ID):
+                return results
+
+            lo, hi = self._prefix_range(self._symbol_keys, q)
+            if take(self._symbol_pos[lo:hi], RANK_SYMBOL_PREFIX):
+                return results
+
+            # 名称匹配：每个查询词都须是名称中某个单词的前缀，从命中最少的词开始验证
+            words = _WORD_RE.findall(q)
+            if words:
+                ranges = sorted((self._prefix_range(self._word_keys, w) for w in words), key=lambda r: r[1] - r[0])
+                lo, hi = ranges[0]
+                candidates = self._word_pos[lo:hi]
+                if len(words) > 1:
+                    candidates = (pos for pos in candidates if self._name_matches(rows[pos][3], words))
+                if take(candidates, RANK_NAME_PREFIX):
+                    return results
+
+            if len(q) >= 3:
+                postings = [self._trigrams.get(tri) for tri in _trigrams(q)]
+                if all(p is not None for p in postings):
+                    rarest = min(postings, key=len)
+                    take((pos for pos in rarest if q in (rows[pos][2] or '').lower()), RANK_SYMBOL_SUBSTRING)
+            return results
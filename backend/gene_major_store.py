@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# 基因优先（gene-major）表达存储：所有数据集的样本拼成一条列轴，每个基因符号一行，查询单个基因只读取一行
+
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+# 与导入脚本 is_expressed（原始值 > 10）一致的 log2(x+1) 阈值
+EXPRESSED_LOG2 = float(np.log2(11))
+
+# 各表达值列判定"表达"的默认阈值（取值大于阈值）
+EXPRESSED_THRESHOLDS = {
+    'expression_value': 10.0,
+    'log2_expression': EXPRESSED_LOG2,
+}
+
+
+def collapse_probes(symbols, values):
+    """同一基因符号对应多个探针时保留平均表达最高的一行
+
+    返回 {大写符号: 行号}；空符号被忽略。
+    """
+    with np.errstate(all='ignore'):
+        means = np.nanmean(values, axis=1) if values.shape[1] else np.zeros(values.shape[0])
+    means = np.where(np.isnan(means), -np.inf, means)
+    best = {}
+    for i, symbol in enumerate(symbols):
+        if not symbol:
+            continue
+        key = symbol.upper()
+        j = best.get(key)
+        if j is None or means[i] > means[j]:
+            best[key] = i
+    return best
+
+
+def _quantiles(values):
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return None
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    return values, float(q1), float(median), float(q3)
+
+
+def summarize(values, expressed_above):
+    """中位数、四分位距与表达比例；没有有效值时返回 None"""
+    stats = _quantiles(np.asarray(values, dtype=np.float64))
+    if stats is None:
+        return None
+    valid, q1, median, q3 = stats
+    return {
+        'n_values': int(valid.size),
+        'median': median,
+        'q1': q1,
+        'q3': q3,
+        'iqr': q3 - q1,
+        'mean': float(valid.mean()),
+        'fraction_expressed': float((valid > expressed_above).mean())
+    }
+
+
+def gene_expression_profile(values, dataset_ids, sample_ids, tumor_types, datasets, expressed_above=EXPRESSED_LOG2,
+                            include_samples=True):
+    """把单个基因在全部样本上的取值汇总为按数据集与按肿瘤类型的结果
+
+    values/dataset_ids/sample_ids/tumor_types 按列对齐；datasets 为 {dataset_id: 数据集信息字典}。
+    """
+    values = np.asarray(values, dtype=np.float64)
+    dataset_ids = np.asarray(dataset_ids)
+    present = ~np.isnan(values)
+
+    per_dataset = []
+    order = np.argsort(dataset_ids, kind='stable')
+    boundaries = np.flatnonzero(np.diff(dataset_ids[order])) + 1
+    for cols in np.split(order, boundaries) if order.size else []:
+        if not present[cols].any():
+            continue
+        dataset_id = int(dataset_ids[cols[0]])
+        item = dict(datasets.get(dataset_id) or {'dataset_id': dataset_id})
+        item.update(summarize(values[cols], expressed_above))
+        if include_samples:
+            item['samples'] = [
+                {'sample_id': sample_ids[c], 'tumor_type': tumor_types[c], 'value': float(values[c])}
+                for c in cols.tolist() if present[c]
+            ]
+        per_dataset.append(item)
+
+    by_type = {}
+    for c in np.flatnonzero(present).tolist():
+        by_type.setdefault(tumor_types[c] or 'Unknown', []).append(c)
+    per_type = []
+    for tumor_type, cols in by_type.items():
+        item = {'tumor_type': tumor_type, 'n_datasets': int(np.unique(dataset_ids[cols]).size)}
+        item.update(summarize(values[cols], expressed_above))
+        item['n_samples'] = item.pop('n_values')
+        per_type.append(item)
+    per_type.sort(key=lambda t: -t['median'])
+
+    overall = summarize(values, expressed_above) or {}
+    return {
+        'n_datasets': len(per_dataset),
+        'n_samples': int(present.sum()),
+        'overall': overall,
+        'tumor_types': per_type,
+        'datasets': per_dataset
+    }
+
+
+class GeneMajorStore:
+    """全部数据集的 基因符号×样本 float32 矩阵（内存映射、只读）
+
+    目录结构::
+
+        <root>/meta.json        形状、取值列、数据版本与各数据集的列范围
+        <root>/genes.txt        行对应的基因符号（大写）
+        <root>/samples.tsv      列对应的 dataset_id \\t sample_id \\t tumor_type
+        <root>/values.f32       行优先矩阵；数据集中不存在该基因时为 NaN
+
+    同一基因的所有样本在文件中连续存放，查询单个基因只需读取一行。
+    """
+
+    def __init__(self, root='data/processed/gene_major'):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._loaded = None
+
+    def read_meta(self):
+        meta_file = self.root / 'meta.json'
+        if not meta_file.exists():
+            return None
+        with open(meta_file, 'r') as f:
+            return json.load(f)
+
+    def _load(self):
+        """打开矩阵与行列索引；文件更新后（meta 的 built_at 变化）自动重新打开"""
+        meta = self.read_meta()
+        if meta is None:
+            return None
+        with self._lock:
+            if self._loaded is not None and self._loaded['meta']['built_at'] == meta['built_at']:
+                return self._loaded
+        with open(self.root / 'genes.txt', 'r') as f:
+            genes = {line.rstrip('\n'): i for i, line in enumerate(f)}
+        dataset_ids, sample_ids, tumor_types = [], [], []
+        with open(self.root / 'samples.tsv', 'r') as f:
+            for line in f:
+                dataset_id, sample_id, tumor_type = line.rstrip('\n').split('\t')
+                dataset_ids.append(int(dataset_id))
+                sample_ids.append(sample_id)
+                tumor_types.append(tumor_type or None)
+        n_genes, n_samples = meta['shape']
+        values = (np.memmap(self.root / 'values.f32', dtype=np.float32, mode='r', shape=(n_genes, n_samples))
+                  if n_genes and n_samples else np.empty((n_genes, n_samples), dtype=np.float32))
+        loaded = {
+            'meta': meta,
+            'genes': genes,
+            'values': values,
+            'dataset_ids': np.asarray(dataset_ids, dtype=np.int64),
+            'sample_ids': sample_ids,
+            'tumor_types': tumor_types
+        }
+        with self._lock:
+            self._loaded = loaded
+        return loaded
+
+    def data_version(self):
+        meta = self.read_meta()
+        return meta.get('data_version') if meta else None
+
+    def lookup(self, symbol):
+        """返回 (取值, 列 dataset_id, 列 sample_id, 列 tumor_type, meta)；存储不存在返回 None，基因不存在时取值为 None"""
+        loaded = self._load()
+        if loaded is None:
+            return None
+        row = loaded['genes'].get(symbol.upper())
+        values = np.array(loaded['values'][row]) if row is not None else None
+        return values, loaded['dataset_ids'], loaded['sample_ids'], loaded['tumor_types'], loaded['meta']
+
+    def build(self, datasets, load_symbols, load_matrix, value_column, data_version=0):
+        """构建存储
+
+        datasets: [(dataset_id, [(sample_id, tumor_type), ...])]，决定列顺序
+        load_symbols(dataset_id) -> 数据集矩阵各行的基因符号（第一遍，确定全部基因）
+        load_matrix(dataset_id) -> ExpressionMatrix（第二遍，逐个数据集写入）
+        """
+        symbols = set()
+        for dataset_id, _ in datasets:
+            symbols.update(s.upper() for s in load_symbols(dataset_id) if s)
+        genes = sorted(symbols)
+        gene_pos = {s: i for i, s in enumerate(genes)}
+
+        self.root.parent.mkdir(parents=True, exist_ok=True)
+        tmp_dir = self.root.parent / f".{self.root.name}.tmp-{os.getpid()}"
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+
+        columns = []
+        ranges = {}
+        for dataset_id, samples in datasets:
+            ranges[dataset_id] = (len(columns), len(columns) + len(samples))
+            columns.extend((dataset_id, sample_id, tumor_type) for sample_id, tumor_type in samples)
+        shape = (len(genes), len(columns))
+
+        n_cells = 0
+        if shape[0] and shape[1]:
+            mm = np.memmap(tmp_dir / 'values.f32', dtype=np.float32, mode='w+', shape=shape)
+            for start in range(0, shape[0], 4096):
+                mm[start:start + 4096] = np.nan
+            for dataset_id, samples in datasets:
+                matrix = load_matrix(dataset_id)
+                if matrix is None:
+                    continue
+                # samples 与矩阵列按样本ID对齐，矩阵中缺少的样本保持 NaN
+                start, _ = ranges[dataset_id]
+                sample_pos = {s: i for i, s in enumerate(matrix.sample_ids)}
+                pairs = [(start + i, sample_pos[s]) for i, (s, _) in enumerate(samples) if s in sample_pos]
+                target = np.asarray([t for t, _ in pairs], dtype=np.int64)
+                cols = np.asarray([c for _, c in pairs], dtype=np.int64)
+                best = collapse_probes(matrix.gene_symbols, matrix.values)
+                if not best or not cols.size:
+                    continue
+                rows = np.fromiter((gene_pos[s] for s in best), dtype=np.int64, count=len(best))
+                source_rows = np.fromiter(best.values(), dtype=np.int64, count=len(best))
+                block = np.asarray(matrix.values[source_rows][:, cols], dtype=np.float32)
+                mm[rows[:, None], target[None, :]] = block
+                n_cells += int(np.count_nonzero(~np.isnan(block)))
+            mm.flush()
+            del mm
+        else:
+            (tmp_dir / 'values.f32').touch()
+
+        with open(tmp_dir / 'genes.txt', 'w') as f:
+            for symbol in genes:
+                f.write(f"{symbol}\n")
+        with open(tmp_dir / 'samples.tsv', 'w') as f:
+            for dataset_id, sample_id, tumor_type in columns:
+                f.write(f"{dataset_id}\t{sample_id}\t{tumor_type or ''}\n")
+        meta = {
+            'shape': list(shape),
+            'dtype': 'float32',
+            'order': 'C',
+            'value_column': value_column,
+            'data_version': data_version,
+            'datasets': {str(k): list(v) for k, v in ranges.items()},
+            'n_cells': n_cells,
+            'built_at': datetime.utcnow().isoformat()
+        }
+        with open(tmp_dir / 'meta.json', 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        # 原子替换旧目录
+        if self.root.exists():
+            old_dir = self.root.parent / f".{self.root.name}.old-{os.getpid()}"
+            os.replace(self.root, old_dir)
+            os.replace(tmp_dir, self.root)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        else:
+            os.replace(tmp_dir, self.root)
+        return meta
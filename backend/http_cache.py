@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# HTTP 条件缓存：由数据版本号生成 ETag/Last-Modified，支持 304 与进程内响应缓存
+
+from datetime import timezone
+from functools import wraps
+
+from flask import Response, make_response, request
+
+from result_cache import ResultCache
+from streaming import wants_ndjson
+
+
+class HTTPCache:
+    """只读接口的条件请求与响应缓存
+
+    - 缓存键为 (endpoint, URL 参数, 规范化查询参数, 数据版本)，数据版本变化后旧条目自然失效
+    - ETag 由缓存键派生，无需生成响应体即可回答 If-None-Match
+    - Cache-Control: public, max-age 让前置 nginx 直接命中；Vary: Accept 区分 JSON 与 NDJSON 表示
+    """
+
+    def __init__(self, max_entries=512, max_bytes=64 * 1024 * 1024, max_age=60):
+        self.max_age = max_age
+        self._cache = ResultCache(max_entries=max_entries, max_bytes=max_bytes, ttl=0)
+        self._version_lookup = None
+        self._not_modified = 0
+
+    def init_app(self, app, version_lookup, max_age=None):
+        """version_lookup(dataset_id) -> (version, updated_at)；dataset_id 为 0 表示全局"""
+        self._version_lookup = version_lookup
+        if max_age is not None:
+            self.max_age = max_age
+
+    def cached(self, dataset_arg=None):
+        """视图装饰器；dataset_arg 为 URL 参数名时使用该数据集的版本，否则使用全局版本"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # 流式响应不缓存
+                if wants_ndjson():
+                    return view(*args, **kwargs)
+                dataset_id = kwargs.get(dataset_arg, 0) if dataset_arg else 0
+                version, updated_at = self._version_lookup(dataset_id)
+                self._cache.note_data_version(dataset_id, version)
+                # 其余 URL 参数（如基因符号）区分不同资源，与查询参数一起进入缓存键
+                params = sorted((f'<{k}>', str(v)) for k, v in kwargs.items() if k != dataset_arg)
+                params += sorted(request.args.items(multi=True))
+                key = self._cache.make_key(f'{request.endpoint}:{dataset_id}', params, version)
+                etag = key[:32]
+                last_modified = updated_at.replace(tzinfo=timezone.utc) if updated_at else None
+
+                if self._is_not_modified(etag, last_modified):
+                    self._not_modified += 1
+                    return self._with_headers(Response(status=304), etag, last_modified)
+
+                entry = self._cache.get(key)
+                if entry is None:
+                    response = make_response(view(*args, **kwargs))
+                    # 视图可用 Cache-Control: no-store 声明本次结果不可缓存（例如索引仍在重建）
+                    if response.status_code != 200 or response.is_streamed or response.cache_control.no_store:
+                        return response
+                    body = response.get_data()
+                    self._cache.put(key, (body, response.mimetype), dataset_id=dataset_id, size=len(body))
+                else:
+                    body, mimetype = entry
+                    response = Response(body, mimetype=mimetype)
+                return self._with_headers(response, etag, last_modified)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def _is_not_modified(etag, last_modified):
+        # If-None-Match 优先于 If-Modified-Since
+        if request.if_none_match:
+            return request.if_none_match.contains(etag)
+        if last_modified is not None and request.if_modified_since is not None:
+            return last_modified.replace(microsecond=0) <= request.if_modified_since
+        return False
+
+    def _with_headers(self, response, etag, last_modified):
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        response.cache_control.public = True
+        response.cache_control.max_age = self.max_age
+        # 同一 URL 按 Accept 返回 JSON 或 NDJSON，共享缓存需按 Accept 区分
+        response.vary.add('Accept')
+        return response
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        stats = self._cache.stats()
+        stats['not_modified'] = self._not_modified
+        stats['max_age'] = self.max_age
+        return stats
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# 请求指标：按路由的延迟直方图、SQL 语句计数与耗时、R 进程耗时，以 Prometheus 文本格式导出
+
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 秒；覆盖从毫秒级的只读接口到分钟级的R分析
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5)
+R_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+# 多进程模式下各进程把自身数值写入共享目录的间隔（秒）
+FLUSH_INTERVAL = 1.0
+
+# 慢请求日志中每个请求最多保留的语句数与单条语句长度
+SLOW_LOG_MAX_STATEMENTS = 200
+SLOW_LOG_MAX_SQL_CHARS = 2000
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _Metric:
+    kind = None
+    # 多进程合并方式：'sum' 累加所有进程（含已退出的进程），'livesum' 只累加存活进程，'local' 只导出本进程
+    multiprocess = 'sum'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def current(self):
+        """本进程的 {标签值元组: 值} 副本"""
+        with self._lock:
+            return {k: list(v) if isinstance(v, list) else v for k, v in self._values.items()}
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    @staticmethod
+    def _combine(total, value):
+        return total + value
+
+    def render(self, others=()):
+        """others 为其他进程的 {标签值元组: 值}，与本进程的值合并后导出"""
+        values = self.current()
+        for other in others:
+            for key, value in other.items():
+                values[key] = self._combine(values[key], value) if key in values else value
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples(sorted(values.items())))
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self, items):
+        return [f'{self.name}{_labels(self.labelnames, k)} {_number(v)}' for k, v in items]
+
+
+class Gauge(_Metric):
+    """取值可增减；也可传入 collect() 在导出时计算 {标签元组: 值}
+
+    多进程模式下默认累加存活进程的值；collect() 读取的是共享数据（如数据库）时用 multiprocess='local'。
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), collect=None, multiprocess='livesum'):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+        self.multiprocess = multiprocess
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def current(self):
+        if self.collect is not None:
+            return dict(self.collect())
+        return super().current()
+
+    def _samples(self, items):
+        return [f'{self.name}{_labels(self.labelnames, k)} {_number(v)}' for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        # 每个标签组合保存 [各桶非累计计数..., +Inf 计数, 总和]
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    @staticmethod
+    def _combine(total, value):
+        return [a + b for a, b in zip(total, value)]
+
+    def _samples(self, items):
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state[:-1]):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_number(state[-1])}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+
+class Registry:
+    """指标集合
+
+    设置 directory 后进入多进程模式（gunicorn 多个 worker 共享同一目录）：每个进程每隔 flush_interval 秒
+    及退出时把自身数值写入 <directory>/<pid>-<启动时间>.json，导出时合并目录中所有进程的文件，
+    计数器与直方图在任一 worker 上都单调递增。目录应在服务启动前清空（容器内的临时目录即可）。
+    """
+
+    def __init__(self, directory=None, flush_interval=FLUSH_INTERVAL):
+        self._metrics = []
+        self.directory = None
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pid = None
+        self._file = None
+        if directory:
+            self.set_directory(directory)
+
+    def set_directory(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        atexit.register(self.flush)
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def ensure_process(self):
+        """多进程模式下确定本进程的文件并启动定期写入线程；fork 出的子进程清空继承自父进程的数值"""
+        if self.directory is None or self._pid == os.getpid():
+            return
+        with self._lock:
+            pid = os.getpid()
+            if self._pid == pid:
+                return
+            if self._pid is not None:
+                for metric in self._metrics:
+                    metric.reset()
+            self._pid = pid
+            self._file = self.directory / f'{pid}-{time.time_ns()}.json'
+        threading.Thread(target=self._flush_loop, args=(pid,), name='neta-metrics', daemon=True).start()
+
+    def _flush_loop(self, pid):
+        while self._pid == pid:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """把本进程的数值原子写入自身文件（'local' 指标不写入）"""
+        if self.directory is None or self._pid != os.getpid():
+            return
+        snapshot = {m.name: [[list(k), v] for k, v in m.current().items()]
+                    for m in self._metrics if m.multiprocess != 'local'}
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp, self._file)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    def _other_processes(self):
+        """{指标名: [其他进程的 {标签值元组: 值}]}；'livesum' 指标跳过已退出的进程"""
+        modes = {m.name: m.multiprocess for m in self._metrics}
+        others = {}
+        for path in self.directory.glob('*.json'):
+            if path == self._file:
+                continue
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+                pid = int(path.name.split('-', 1)[0])
+            except (OSError, ValueError):
+                continue
+            # 同一 pid 的其他文件来自已退出的旧进程
+            alive = pid != os.getpid() and _pid_alive(pid)
+            for name, items in data.items():
+                mode = modes.get(name)
+                if mode is None or mode == 'local' or (mode == 'livesum' and not alive):
+                    continue
+                others.setdefault(name, []).append({tuple(k): v for k, v in items})
+        return others
+
+    def render(self):
+        others = {}
+        if self.directory is not None:
+            self.ensure_process()
+            others = self._other_processes()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(others.get(metric.name, ())))
+        return '\n'.join(lines) + '\n'
+
+
+def sql_operation(statement):
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    return word if word in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'PRAGMA') else 'OTHER'
+
+
+class RequestStats:
+    """单个请求内累计的 SQL 统计；慢请求日志开启时保留语句文本"""
+    __slots__ = ('started', 'sql_count', 'sql_seconds', 'statements')
+
+    def __init__(self, keep_statements):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.statements = [] if keep_statements else None
+
+
+class Metrics:
+    """Flask 应用的请求、SQL、R 进程与任务指标
+
+    - 请求延迟按 (method, 路由模板, status) 记录；流式响应在响应体发送完毕后计时
+    - SQL 耗时来自 SQLAlchemy 引擎的 before/after_cursor_execute 事件，工作线程中的语句只计入全局指标
+    - slow_request_ms > 0 时，超过阈值的请求连同其 SQL 写入 neta.slow_requests 日志
+    - multiprocess_dir 非空时合并同一目录下所有进程（gunicorn worker）的指标，见 Registry
+    """
+
+    def __init__(self):
+        self.registry = Registry()
+        self.http_duration = self.registry.register(Histogram(
+            'neta_http_request_duration_seconds', 'HTTP request latency by route template',
+            ('method', 'route', 'status')))
+        self.http_sql_statements = self.registry.register(Histogram(
+            'neta_http_request_sql_statements', 'SQL statements executed per HTTP request',
+            ('method', 'route'), buckets=COUNT_BUCKETS))
+        self.http_sql_duration = self.registry.register(Histogram(
+            'neta_http_request_sql_seconds', 'Total SQL time per HTTP request',
+            ('method', 'route')))
+        self.sql_duration = self.registry.register(Histogram(
+            'neta_sql_statement_duration_seconds', 'SQL statement execution time',
+            ('operation',), buckets=SQL_BUCKETS))
+        self.sql_errors = self.registry.register(Counter(
+            'neta_sql_errors_total', 'SQL statements that raised', ('operation',)))
+        self.r_duration = self.registry.register(Histogram(
+            'neta_r_run_duration_seconds', 'R analysis wall time',
+            ('analysis_type', 'mode', 'status'), buckets=R_BUCKETS))
+        self.r_runs = self.registry.register(Counter(
+            'neta_r_runs_total', 'R analysis runs by exit status',
+            ('analysis_type', 'mode', 'exit_status')))
+        self.slow_requests = self.registry.register(Counter(
+            'neta_slow_requests_total', 'Requests slower than the slow-request threshold', ('route',)))
+        self.slow_request_ms = 0
+        self.slow_logger = logging.getLogger('neta.slow_requests')
+        self._listening = False
+
+    def init_app(self, app, slow_request_ms=0, slow_request_log=None, multiprocess_dir=None):
+        self.slow_request_ms = slow_request_ms
+        if multiprocess_dir:
+            self.registry.set_directory(multiprocess_dir)
+        if slow_request_log:
+            handler = logging.FileHandler(slow_request_log)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.slow_logger.addHandler(handler)
+            self.slow_logger.setLevel(logging.WARNING)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(Engine, 'handle_error', self._handle_error)
+            self._listening = True
+
+    def gauge(self, name, documentation, labelnames, collect, multiprocess='livesum'):
+        """注册导出时计算的 gauge，collect() 返回 {标签值元组: 值}"""
+        return self.registry.register(Gauge(name, documentation, labelnames, collect=collect, multiprocess=multiprocess))
+
+    def response(self):
+        return Response(self.registry.render(), content_type=PROMETHEUS_MIMETYPE)
+
+    def observe_r_run(self, analysis_type, mode, seconds, exit_status):
+        """RRunner 的回调；exit_status 为进程退出码、'timeout' 或 'error'"""
+        status = 'success' if exit_status == '0' else ('timeout' if exit_status == 'timeout' else 'failed')
+        self.r_duration.observe(seconds, analysis_type=analysis_type, mode=mode, status=status)
+        self.r_runs.inc(analysis_type=analysis_type, mode=mode, exit_status=exit_status)
+
+    # --- 请求 ---
+
+    def _before_request(self):
+        self.registry.ensure_process()
+        g.neta_request_stats = RequestStats(keep_statements=self.slow_request_ms > 0)
+
+    def _after_request(self, response):
+        stats = g.get('neta_request_stats')
+        if stats is None:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        method, path, status = request.method, request.full_path.rstrip('?'), response.status_code
+        if response.is_streamed:
+            # 流式响应的 SQL 与序列化发生在生成响应体期间，关闭时再记录
+            response.call_on_close(lambda: self._finish(stats, method, route, path, status))
+        else:
+            self._finish(stats, method, route, path, status)
+        return response
+
+    def _finish(self, stats, method, route, path, status):
+        elapsed = time.perf_counter() - stats.started
+        self.http_duration.observe(elapsed, method=method, route=route, status=status)
+        self.http_sql_statements.observe(stats.sql_count, method=method, route=route)
+        self.http_sql_duration.observe(stats.sql_seconds, method=method, route=route)
+        if self.slow_request_ms and elapsed * 1000 >= self.slow_request_ms:
+            self.slow_requests.inc(route=route)
+            self.slow_logger.warning(json.dumps({
+                'method': method,
+                'path': path,
+                'route': route,
+                'status': status,
+                'duration_ms': round(elapsed * 1000, 3),
+                'sql_count': stats.sql_count,
+                'sql_ms': round(stats.sql_seconds * 1000, 3),
+                'sql': stats.statements
+            }, ensure_ascii=False, default=str))
+
+    # --- SQLAlchemy 事件 ---
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('neta_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('neta_query_start')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        self.sql_duration.observe(elapsed, operation=sql_operation(statement))
+        if has_request_context():
+            stats = g.get('neta_request_stats')
+            if stats is not None:
+                stats.sql_count += 1
+                stats.sql_seconds += elapsed
+                if stats.statements is not None and len(stats.statements) < SLOW_LOG_MAX_STATEMENTS:
+                    stats.statements.append({
+                        'ms': round(elapsed * 1000, 3),
+                        'sql': statement[:SLOW_LOG_MAX_SQL_CHARS],
+                        'executemany': executemany
+                    })
+
+    def _handle_error(self, context):
+        starts = context.connection.info.get('neta_query_start') if context.connection is not None else None
+        if starts:
+            starts.pop()
+        self.sql_errors.inc(operation=sql_operation(context.statement or ''))
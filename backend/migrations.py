@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# 版本化结构迁移：按编号顺序对已有的 neta_data.sqlite 应用结构变更，已应用的版本记录在 schema_migrations 表
+
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+MIGRATIONS_TABLE = 'schema_migrations'
+
+# (版本号, 名称, SQL 语句)；已发布的迁移不可修改，结构变化只追加新版本。
+# 语句为 (方言名, SQL) 时只在该数据库方言上执行（如 SQLite 专有的 PRAGMA），其他方言跳过。
+# 表由 db.create_all() 或 R 导入脚本创建，迁移只负责其上的索引、新增列等增量变化；
+# 可调用的语句接收连接自行执行（如 add_column 只在列缺失时添加）。
+
+
+def add_column(table, column, ddl):
+    """只在列不存在时添加：db.create_all() 新建的表已按模型包含该列"""
+    def statement(connection):
+        if column not in {c['name'] for c in inspect(connection).get_columns(table)}:
+            connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+    return statement
+
+
+MIGRATIONS = [
+    (1, 'gene_expression_indexes', [
+        # 按数据集读取基因×样本矩阵、按基因分组；前缀 (dataset_id) 覆盖所有按数据集过滤的查询
+        'CREATE INDEX IF NOT EXISTS ix_gene_expression_dataset_gene_sample '
+        'ON gene_expression (dataset_id, gene_id, sample_id)',
+        # 数据集的样本列表（DISTINCT sample_id），只读索引即可完成
+        'CREATE INDEX IF NOT EXISTS ix_gene_expression_dataset_sample '
+        'ON gene_expression (dataset_id, sample_id)',
+        # 按基因符号跨数据集查询表达
+        'CREATE INDEX IF NOT EXISTS ix_gene_expression_symbol_dataset '
+        'ON gene_expression (gene_symbol, dataset_id)',
+    ]),
+    (2, 'sample_dataset_lookup_indexes', [
+        'CREATE INDEX IF NOT EXISTS ix_samples_dataset_sample ON samples (dataset_id, sample_id)',
+        'CREATE INDEX IF NOT EXISTS ix_datasets_tissue_type ON datasets (tissue_type)',
+        'CREATE INDEX IF NOT EXISTS ix_datasets_tumor_type ON datasets (tumor_type)',
+        'CREATE INDEX IF NOT EXISTS ix_datasets_data_source ON datasets (data_source)',
+    ]),
+    (3, 'analysis_task_indexes', [
+        # 结果复用查找（类型 + 状态 + 数据集）与任务列表过滤
+        'CREATE INDEX IF NOT EXISTS ix_analysis_tasks_type_status_dataset '
+        'ON analysis_tasks (task_type, status, dataset_id)',
+        'CREATE INDEX IF NOT EXISTS ix_analysis_tasks_status ON analysis_tasks (status)',
+        'CREATE INDEX IF NOT EXISTS ix_analysis_tasks_dataset ON analysis_tasks (dataset_id)',
+    ]),
+    (4, 'planner_statistics', [
+        # 采样统计，让查询规划器在大表上选择上述索引；analysis_limit 限制每个索引的采样行数
+        ('sqlite', 'PRAGMA analysis_limit = 1000'),
+        ('sqlite', 'ANALYZE'),
+    ]),
+    (5, 'keyset_sort_indexes', [
+        # 键集分页按 (排序列, id) 排序与定位游标，每个可选排序键一个复合索引
+        'CREATE INDEX IF NOT EXISTS ix_datasets_publication_year_id ON datasets (publication_year, id)',
+        'CREATE INDEX IF NOT EXISTS ix_datasets_n_samples_id ON datasets (n_samples, id)',
+        'CREATE INDEX IF NOT EXISTS ix_datasets_n_genes_id ON datasets (n_genes, id)',
+        'CREATE INDEX IF NOT EXISTS ix_datasets_created_at_id ON datasets (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_analysis_tasks_created_at_id ON analysis_tasks (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_analysis_tasks_completed_at_id ON analysis_tasks (completed_at, id)',
+    ]),
+    (6, 'analysis_task_started_at', [
+        # 任务被认领开始执行的时间，遗留任务恢复按执行时长而非排队时间判断
+        add_column('analysis_tasks', 'started_at', 'DATETIME'),
+    ]),
+]
+
+
+def ensure_migrations_table(connection):
+    connection.execute(text(
+        f'CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ('
+        'version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at DATETIME NOT NULL)'
+    ))
+
+
+def applied_migrations(engine):
+    """返回 {版本号: (名称, 应用时间)}"""
+    with engine.begin() as connection:
+        ensure_migrations_table(connection)
+        rows = connection.execute(text(f'SELECT version, name, applied_at FROM {MIGRATIONS_TABLE}'))
+        return {r[0]: (r[1], r[2]) for r in rows}
+
+
+def current_version(engine):
+    return max(applied_migrations(engine), default=0)
+
+
+def pending_migrations(engine, target=None):
+    applied = applied_migrations(engine)
+    return [m for m in MIGRATIONS if m[0] not in applied and (target is None or m[0] <= target)]
+
+
+def apply_migrations(engine, target=None, log=None):
+    """依次应用未执行的迁移，每个版本一个事务；返回已应用的 [(版本号, 名称)]"""
+    done = []
+    for version, name, statements in pending_migrations(engine, target):
+        started = datetime.utcnow()
+        with engine.begin() as connection:
+            for statement in statements:
+                if callable(statement):
+                    statement(connection)
+                    continue
+                if isinstance(statement, tuple):
+                    dialect, statement = statement
+                    if dialect != connection.dialect.name:
+                        continue
+                connection.execute(text(statement))
+            connection.execute(text(
+                f'INSERT INTO {MIGRATIONS_TABLE} (version, name, applied_at) VALUES (:version, :name, :applied_at)'
+            ), {'version': version, 'name': name, 'applied_at': started})
+        if log is not None:
+            log(f'Applied migration {version:04d} {name} ({(datetime.utcnow() - started).total_seconds():.1f}s)')
+        done.append((version, name))
+    return done
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# 键集（游标）分页：按 (排序键, id) 定位下一页，深页与首页开销相同
+
+import base64
+import json
+
+from sqlalchemy import DateTime, String, and_, or_, type_coerce
+
+
+def encode_cursor(state):
+    raw = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """解析游标，格式错误时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        state = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(state, dict) or 's' not in state or 'id' not in state:
+        raise ValueError('Invalid cursor')
+    return state
+
+
+def parse_sort(sort, sort_keys, default):
+    """解析 sort 参数（'-' 前缀表示降序），返回 (规范化的 sort 字符串, 键名, 是否降序)"""
+    sort = (sort or default).strip()
+    descending = sort.startswith('-')
+    name = sort.lstrip('-+')
+    if name not in sort_keys:
+        raise ValueError(f"Unsupported sort key: {name}; expected one of {', '.join(sort_keys)}")
+    return ('-' if descending else '') + name, name, descending
+
+
+def _raw(expr):
+    # 日期时间列按库中保存的原始文本比较并写入游标：ORM 写入与 R 导入（CURRENT_TIMESTAMP）的格式不同，
+    # 转换为 datetime 再绑定会与原值失配；type_coerce 不生成 CAST，排序与比较仍可使用索引
+    return type_coerce(expr, String) if isinstance(expr.type, DateTime) else expr
+
+
+def _segments(expr, id_column, value, last_id, descending):
+    """排在游标 (value, last_id) 之后的行，按页内顺序拆成若干段条件；NULL 视为最小值（SQLite 升序在前、降序在后）
+
+    NULL 段与非空段分开查询：合并成一个 OR 条件时 SQLite 只能从索引开头扫描，深页开销随位置增长。
+    """
+    if descending:
+        if value is None:
+            return [and_(expr.is_(None), id_column < last_id)]
+        return [or_(expr < value, and_(expr == value, id_column < last_id)), expr.is_(None)]
+    if value is None:
+        return [and_(expr.is_(None), id_column > last_id), expr.isnot(None)]
+    return [or_(expr > value, and_(expr == value, id_column > last_id))]
+
+
+def keyset_page(query, sort_keys, id_column, sort=None, default_sort='id', cursor=None, limit=20,
+                include_total=False):
+    """对 query 做键集分页
+
+    sort_keys: {键名: 列}，应直接使用列（不要包装函数）以便 (列, id) 索引覆盖排序；列可以为 NULL
+    返回 (items, next_cursor, total)；没有下一页时 next_cursor 为 None，
+    include_total 为 False 时 total 为 None。
+    """
+    sort, name, descending = parse_sort(sort, sort_keys, default_sort)
+    expr = _raw(sort_keys[name])
+    total = query.order_by(None).count() if include_total else None
+
+    segments = [None]
+    if cursor:
+        state = decode_cursor(cursor)
+        if state['s'] != sort:
+            raise ValueError('Cursor does not match the requested sort order')
+        last_id = state['id']
+        if expr is id_column:
+            segments = [id_column < last_id if descending else id_column > last_id]
+        else:
+            segments = _segments(expr, id_column, state.get('v'), last_id, descending)
+
+    order = (expr.desc(), id_column.desc()) if descending else (expr.asc(), id_column.asc())
+    # 多取一行判断是否还有下一页；排序键值随行一起取出，直接写入游标
+    rows = []
+    for condition in segments:
+        segment = query if condition is None else query.filter(condition)
+        rows += segment.add_columns(expr.label('_sort_value')).order_by(*order).limit(limit + 1 - len(rows)).all()
+        if len(rows) > limit:
+            break
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more and rows:
+        last_item, last_value = rows[-1]
+        next_cursor = encode_cursor({'s': sort, 'v': last_value, 'id': getattr(last_item, id_column.key)})
+    return [row[0] for row in rows], next_cursor, total
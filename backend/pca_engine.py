@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# 进程内PCA引擎：NumPy 随机化/截断 SVD，输出与 pca_analysis.R 相同的 JSON 结构
+
+import numpy as np
+
+from expression_store import prepare_rows
+
+# 计算基因方差时每次读取的行数，控制内存映射矩阵的工作集
+ROW_BLOCK = 2048
+
+
+def gene_variances(values, log_transform=True):
+    """分块计算每个基因在样本间的方差（常数基因为 0），不复制整个矩阵"""
+    n_genes = values.shape[0]
+    variances = np.empty(n_genes, dtype=np.float64)
+    for start in range(0, n_genes, ROW_BLOCK):
+        block = prepare_rows(values[start:start + ROW_BLOCK], log_transform)
+        if block.shape[1] > 1:
+            # 常数行的方差因求均值的舍入误差可能不为 0，按极差置为精确的 0
+            variances[start:start + ROW_BLOCK] = np.where(np.ptp(block, axis=1) > 0, block.var(axis=1, ddof=1), 0.0)
+        else:
+            variances[start:start + ROW_BLOCK] = 0.0
+    return variances
+
+
+def randomized_svd(a, n_components, oversamples=10, n_iter=4, random_state=0):
+    """Halko 等人的随机化截断 SVD，返回 (U, S, Vt)"""
+    rng = np.random.default_rng(random_state)
+    n_random = min(n_components + oversamples, min(a.shape))
+    q = a @ rng.standard_normal((a.shape[1], n_random)).astype(a.dtype)
+    q, _ = np.linalg.qr(q)
+    for _ in range(n_iter):
+        q, _ = np.linalg.qr(a.T @ q)
+        q, _ = np.linalg.qr(a @ q)
+    u_small, s, vt = np.linalg.svd(q.T @ a, full_matrices=False)
+    u = q @ u_small
+    return u[:, :n_components], s[:n_components], vt[:n_components]
+
+
+def run_pca(matrix, n_components=2, top_genes=500, log_transform=True, center=True, scale=False,
+            method='auto', groups=None, n_loadings=100, random_state=0, parameters=None):
+    """对 ExpressionMatrix 做样本 PCA
+
+    top_genes: 按方差选择的基因数，0/None 表示使用全部基因
+    method: 'full'（精确 SVD）、'randomized' 或 'auto'（矩阵较大时使用随机化）
+    groups: {sample_id: group}，用于 pca_data 中的 group 字段
+    """
+    values = matrix.values
+    n_genes_total, n_samples = values.shape
+    if n_samples < 2:
+        raise ValueError('PCA requires at least 2 samples')
+
+    variances = None
+    if top_genes and top_genes < n_genes_total:
+        variances = gene_variances(values, log_transform)
+        selected = np.sort(np.argpartition(variances, -top_genes)[-top_genes:])
+    else:
+        selected = np.arange(n_genes_total)
+    if scale:
+        # 标准化时剔除常数基因：物化前按方差过滤，之后原地除以标准差，不再复制矩阵
+        if variances is None:
+            variances = gene_variances(values, log_transform)
+        selected = selected[variances[selected] > 0]
+
+    # 只物化所选基因（全部基因时与原矩阵同样大小，使用 float32）
+    dtype = np.float64 if selected.size * n_samples <= 50_000_000 else np.float32
+    x = np.empty((n_samples, selected.size), dtype=dtype)
+    for start in range(0, selected.size, ROW_BLOCK):
+        rows = selected[start:start + ROW_BLOCK]
+        x[:, start:start + rows.size] = prepare_rows(values[rows], log_transform).T
+
+    if center:
+        x -= x.mean(axis=0)
+    if scale:
+        x /= np.sqrt(variances[selected]).astype(dtype)
+
+    n_components = max(1, min(int(n_components or 2), min(x.shape)))
+    if method == 'auto':
+        method = 'randomized' if min(x.shape) > 1000 and n_components < min(x.shape) // 4 else 'full'
+    if method == 'randomized':
+        u, s, vt = randomized_svd(x, n_components, random_state=random_state)
+    else:
+        u, s, vt = np.linalg.svd(x, full_matrices=False)
+        u, s, vt = u[:, :n_components], s[:n_components], vt[:n_components]
+
+    # 解释方差比例以全部成分的总方差为分母，与 prcomp 一致
+    explained_variance = s ** 2 / (n_samples - 1)
+    total_variance = float(np.einsum('ij,ij->', x, x, dtype=np.float64)) / (n_samples - 1)
+    explained_ratio = explained_variance / total_variance if total_variance > 0 else np.zeros_like(s)
+    scores = u * s
+
+    pc_names = [f'PC{i + 1}' for i in range(n_components)]
+    groups = groups or {}
+    pca_data = []
+    for i, sample_id in enumerate(matrix.sample_ids):
+        row = {name: float(scores[i, k]) for k, name in enumerate(pc_names)}
+        row['sample_id'] = sample_id
+        row['group'] = groups.get(sample_id) or 'All'
+        pca_data.append(row)
+
+    # 返回对前几个主成分贡献最大的基因载荷
+    weights = np.sqrt((vt ** 2).sum(axis=0))
+    top = np.argsort(weights)[::-1][:n_loadings]
+    loadings = []
+    for j in top:
+        gene_row = int(selected[j])
+        item = {'gene_id': matrix.gene_ids[gene_row], 'gene_symbol': matrix.gene_symbols[gene_row]}
+        item.update({name: float(vt[k, j]) for k, name in enumerate(pc_names)})
+        loadings.append(item)
+
+    return {
+        'status': 'completed',
+        'message': 'PCA analysis completed successfully',
+        'results': {
+            'pca_data': pca_data,
+            'explained_variance_ratio': [float(v) for v in explained_ratio],
+            'loadings': loadings,
+            'n_components': n_components,
+            'n_samples': n_samples,
+            'n_genes': int(selected.size),
+            'engine': 'python',
+            'svd_method': method,
+            'parameters': parameters or {}
+        }
+    }
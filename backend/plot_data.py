@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# 绘图数据服务：把分析结果转换为与显示分辨率相称的精简绘图数据，并在服务端渲染、缓存 PNG/SVG
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from expression_store import prepare_rows
+from pca_engine import gene_variances
+from result_cache import canonical_json
+
+# 默认画布大小（像素）与密度格大小（像素/格）
+DEFAULT_WIDTH = 800
+DEFAULT_HEIGHT = 600
+DEFAULT_CELL = 4
+# 点数不超过该值时不做密度汇总
+DEFAULT_MAX_POINTS = 2000
+# 火山图默认标注的最显著基因数
+DEFAULT_LABEL_TOP = 20
+# 热图默认基因数与样本数上限
+DEFAULT_HEATMAP_GENES = 50
+DEFAULT_HEATMAP_SAMPLES = 200
+# 热图行 z-score 截断范围
+ZSCORE_LIMIT = 3.0
+
+IMAGE_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+
+def _round(values, digits=4):
+    return [None if v != v else round(v, digits) for v in np.asarray(values, dtype=np.float64).tolist()]
+
+
+def _axis_range(values):
+    lo, hi = float(values.min()), float(values.max())
+    pad = (hi - lo) * 0.02 or 1.0
+    return [lo - pad, hi + pad]
+
+
+def density_bins(x, y, x_range, y_range, shape):
+    """把点落入 shape=(nx, ny) 的网格，返回非空格的 (格序号, 点数, x 均值, y 均值)"""
+    nx, ny = shape
+    ix = np.clip(((x - x_range[0]) / (x_range[1] - x_range[0]) * nx).astype(np.int64), 0, nx - 1)
+    iy = np.clip(((y - y_range[0]) / (y_range[1] - y_range[0]) * ny).astype(np.int64), 0, ny - 1)
+    cell = ix * ny + iy
+    counts = np.bincount(cell, minlength=nx * ny)
+    occupied = np.flatnonzero(counts)
+    sum_x = np.bincount(cell, weights=x, minlength=nx * ny)
+    sum_y = np.bincount(cell, weights=y, minlength=nx * ny)
+    n = counts[occupied]
+    return cell, occupied, n, sum_x[occupied] / n, sum_y[occupied] / n
+
+
+def scatter_payload(x, y, keep, groups=None, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, cell=DEFAULT_CELL,
+                    max_points=DEFAULT_MAX_POINTS):
+    """散点的精简表示：keep 中的点与稀疏区域的点原样保留，其余点按屏幕网格汇总为密度格
+
+    返回 (逐点输出的下标, 密度格, 坐标范围)；密度格为列式字典 {x, y, count[, group]}，
+    x/y 为格内点的均值。groups 不为空时按组分别汇总，保留颜色信息。
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = np.isfinite(x) & np.isfinite(y)
+    keep = np.asarray(keep, dtype=bool) & valid
+    rest = valid & ~keep
+    if not valid.any():
+        return np.flatnonzero(keep), None, None
+    x_range = _axis_range(x[valid])
+    y_range = _axis_range(y[valid])
+    if valid.sum() <= max_points:
+        return np.flatnonzero(valid), None, {'x': x_range, 'y': y_range}
+
+    shape = (max(1, int(width) // max(1, int(cell))), max(1, int(height) // max(1, int(cell))))
+    grouped = groups is not None
+    groups = np.asarray(groups if grouped else [''] * x.size, dtype=object)
+    points = [np.flatnonzero(keep)]
+    bins = {'x': [], 'y': [], 'count': [], 'group': []}
+    for group in dict.fromkeys(groups[rest].tolist()):
+        idx = np.flatnonzero(rest & (groups == group))
+        cells, occupied, n, mean_x, mean_y = density_bins(x[idx], y[idx], x_range, y_range, shape)
+        # 只有一个点的格直接输出该点（稀疏区域的离群点保持原位）
+        single = np.isin(cells, occupied[n == 1])
+        points.append(idx[single])
+        dense = n > 1
+        bins['x'].extend(_round(mean_x[dense]))
+        bins['y'].extend(_round(mean_y[dense]))
+        bins['count'].extend(n[dense].tolist())
+        bins['group'].extend([group] * int(dense.sum()))
+    if not grouped:
+        bins.pop('group')
+    return np.sort(np.concatenate(points)), bins, {'x': x_range, 'y': y_range}
+
+
+def volcano_payload(table, labels=(), label_top=DEFAULT_LABEL_TOP, pvalue_cutoff=0.05, logfc_cutoff=1.0,
+                    **resolution):
+    """火山图数据：显著基因与标注基因全部保留，其余基因汇总为密度格
+
+    table 为 volcano_data 结果表（ResultTable），列与 deseq2_analysis.R 输出一致。
+    """
+    fc = table.column('log2FoldChange')[1].astype(np.float64)
+    y = table.column('negLog10Pvalue')[1].astype(np.float64)
+    symbols = table.column('gene_symbol')[1]
+    if 'significant' in table.columns:
+        _, significant, nulls = table.column('significant')
+        significant = significant.astype(bool) & (~nulls if nulls is not None else True)
+    else:
+        with np.errstate(invalid='ignore'):
+            significant = (y > -np.log10(pvalue_cutoff)) & (np.abs(fc) > logfc_cutoff)
+
+    wanted = {str(label).upper() for label in labels}
+    labeled = np.fromiter((str(s).upper() in wanted for s in symbols.tolist()), dtype=bool, count=len(symbols))
+    ranked = np.flatnonzero(significant & np.isfinite(y))
+    if label_top and ranked.size:
+        labeled[ranked[np.argsort(-y[ranked], kind='stable')[:label_top]]] = True
+
+    points, bins, ranges = scatter_payload(fc, y, significant | labeled, **resolution)
+    return {
+        'plot': 'volcano',
+        'total_points': int(fc.size),
+        'n_significant': int(significant.sum()),
+        'n_points': int(points.size),
+        'n_binned': int(sum(bins['count'])) if bins else 0,
+        'ranges': ranges,
+        'points': [{
+            'gene_symbol': symbol,
+            'log2FoldChange': x_value,
+            'negLog10Pvalue': y_value,
+            'significant': bool(sig),
+            'label': bool(lab)
+        } for symbol, x_value, y_value, sig, lab in zip(
+            symbols[points].tolist(), _round(fc[points]), _round(y[points]),
+            significant[points].tolist(), labeled[points].tolist()
+        )],
+        'bins': bins
+    }
+
+
+def pca_payload(table, x='PC1', y='PC2', labels=(), **resolution):
+    """PCA 散点数据：样本较多时按组汇总为密度格，labels 中的样本始终保留"""
+    if x not in table.columns or y not in table.columns:
+        raise ValueError(f"Unknown principal components: {x}, {y}")
+    xs = table.column(x)[1].astype(np.float64)
+    ys = table.column(y)[1].astype(np.float64)
+    sample_ids = table.column('sample_id')[1] if 'sample_id' in table.columns else np.array([''] * table.rows)
+    groups = table.column('group')[1] if 'group' in table.columns else None
+    wanted = {str(label) for label in labels}
+    keep = np.fromiter((s in wanted for s in sample_ids.tolist()), dtype=bool, count=len(sample_ids))
+
+    points, bins, ranges = scatter_payload(xs, ys, keep, groups=groups, **resolution)
+    return {
+        'plot': 'pca',
+        'x': x,
+        'y': y,
+        'total_points': int(xs.size),
+        'n_points': int(points.size),
+        'n_binned': int(sum(bins['count'])) if bins else 0,
+        'ranges': ranges,
+        'points': [{'sample_id': s, x: a, y: b, 'group': g} for s, a, b, g in zip(
+            sample_ids[points].tolist(), _round(xs[points]), _round(ys[points]),
+            groups[points].tolist() if groups is not None else [None] * points.size
+        )],
+        'bins': bins
+    }
+
+
+def _pick_samples(groups, max_samples):
+    """按组排列样本，超过上限时在各组内按比例等间隔抽取"""
+    order = sorted(range(len(groups)), key=lambda i: str(groups[i]))
+    if len(order) <= max_samples:
+        return order
+    picked = []
+    by_group = {}
+    for i in order:
+        by_group.setdefault(groups[i], []).append(i)
+    for members in by_group.values():
+        n = max(1, round(len(members) * max_samples / len(order)))
+        picked.extend(members[j] for j in np.unique(np.linspace(0, len(members) - 1, n).round().astype(int)))
+    return picked
+
+
+def heatmap_payload(matrix, candidates=None, groups=None, max_genes=DEFAULT_HEATMAP_GENES,
+                    max_samples=DEFAULT_HEATMAP_SAMPLES, log_transform=True, cluster=True):
+    """热图数据：候选基因（默认全部）中方差最大的 max_genes 个基因的行 z-score
+
+    groups: {sample_id: 组}；给出时只包含这些样本并按组排列，否则包含全部样本并对样本聚类。
+    """
+    from scipy.cluster.hierarchy import leaves_list, linkage
+
+    rows = np.arange(matrix.values.shape[0]) if candidates is None else np.asarray(candidates, dtype=np.int64)
+    if rows.size == 0:
+        raise ValueError('No genes to plot')
+    if groups:
+        columns = [i for i, s in enumerate(matrix.sample_ids) if s in groups]
+        labels = [groups[matrix.sample_ids[i]] for i in columns]
+        picked = _pick_samples(labels, max_samples)
+        columns, labels = [columns[i] for i in picked], [labels[i] for i in picked]
+    else:
+        n_samples = len(matrix.sample_ids)
+        columns = (np.unique(np.linspace(0, n_samples - 1, max_samples).round().astype(int)).tolist()
+                   if n_samples > max_samples else list(range(n_samples)))
+        labels = [None] * len(columns)
+    if len(columns) < 2:
+        raise ValueError('Heatmap needs at least 2 samples with expression data')
+
+    values = matrix.values if candidates is None else matrix.values[rows]
+    variances = np.nan_to_num(gene_variances(values, log_transform), nan=-1.0)
+    if rows.size > max_genes:
+        top = np.argpartition(variances, -max_genes)[-max_genes:]
+        top = top[np.argsort(-variances[top], kind='stable')]
+    else:
+        top = np.argsort(-variances, kind='stable')
+    selected = rows[top]
+
+    block = prepare_rows(matrix.values[selected][:, columns], log_transform)
+    sd = block.std(axis=1, ddof=1, keepdims=True)
+    z = np.clip((block - block.mean(axis=1, keepdims=True)) / np.where(sd > 0, sd, 1.0), -ZSCORE_LIMIT, ZSCORE_LIMIT)
+    gene_order = np.arange(z.shape[0])
+    sample_order = np.arange(z.shape[1])
+    if cluster and z.shape[0] > 2:
+        gene_order = leaves_list(linkage(z, 'average'))
+    if cluster and not groups and z.shape[1] > 2:
+        sample_order = leaves_list(linkage(z.T, 'average'))
+    z = z[gene_order][:, sample_order]
+    selected = selected[gene_order]
+
+    return {
+        'plot': 'heatmap',
+        'scale': 'row_zscore',
+        'n_genes_total': int(rows.size),
+        'n_samples_total': len(matrix.sample_ids) if not groups else sum(s in groups for s in matrix.sample_ids),
+        'genes': [matrix.gene_symbols[i] or matrix.gene_ids[i] for i in selected.tolist()],
+        'gene_ids': [matrix.gene_ids[i] for i in selected.tolist()],
+        'samples': [matrix.sample_ids[columns[j]] for j in sample_order.tolist()],
+        'groups': [labels[j] for j in sample_order.tolist()] if groups else None,
+        'values': [_round(row, 3) for row in z]
+    }
+
+
+def _figure(width, height, dpi=100):
+    # 直接使用 Figure + Agg 画布，不经过 pyplot 的全局图形管理器：请求线程并发渲染时互不影响，也无需关闭图形
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+def _draw_bins(ax, bins, color='#9e9e9e'):
+    if not bins:
+        return
+    counts = np.asarray(bins['count'], dtype=np.float64)
+    ax.scatter(bins['x'], bins['y'], s=4 + 6 * np.log2(counts), c=color, alpha=0.35, linewidths=0)
+
+
+def render(payload, fmt='png', width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, dpi=100):
+    """用 matplotlib 把绘图数据渲染为 PNG/SVG 字节"""
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported image format: {fmt}")
+    fig, ax = _figure(width, height, dpi)
+    if payload['plot'] == 'volcano':
+        _draw_bins(ax, payload['bins'])
+        points = payload['points']
+        colors = ['#d62728' if p['significant'] and p['log2FoldChange'] > 0 else
+                  '#1f77b4' if p['significant'] else '#9e9e9e' for p in points]
+        ax.scatter([p['log2FoldChange'] for p in points], [p['negLog10Pvalue'] for p in points],
+                   s=6, c=colors, linewidths=0)
+        for p in points:
+            if p['label']:
+                ax.annotate(p['gene_symbol'], (p['log2FoldChange'], p['negLog10Pvalue']), fontsize=7)
+        ax.set_xlabel('log2 fold change')
+        ax.set_ylabel('-log10 p-value')
+    elif payload['plot'] == 'pca':
+        groups = list(dict.fromkeys([p['group'] for p in payload['points']] + (payload['bins'] or {}).get('group', [])))
+        from matplotlib import colormaps
+        cmap = colormaps['tab10']
+        for k, group in enumerate(groups):
+            color = cmap(k % 10)
+            bins = payload['bins']
+            if bins and 'group' in bins:
+                mask = [g == group for g in bins['group']]
+                _draw_bins(ax, {key: [v for v, m in zip(bins[key], mask) if m] for key in ('x', 'y', 'count')},
+                           color=[color])
+            points = [p for p in payload['points'] if p['group'] == group]
+            ax.scatter([p[payload['x']] for p in points], [p[payload['y']] for p in points], s=12,
+                       color=color, label=group, linewidths=0)
+        if any(groups):
+            ax.legend(fontsize=7, loc='best')
+        ax.set_xlabel(payload['x'])
+        ax.set_ylabel(payload['y'])
+    elif payload['plot'] == 'heatmap':
+        image = ax.imshow(np.array(payload['values'], dtype=np.float64), aspect='auto', cmap='RdBu_r',
+                          vmin=-ZSCORE_LIMIT, vmax=ZSCORE_LIMIT, interpolation='nearest')
+        if len(payload['genes']) <= 80:
+            ax.set_yticks(range(len(payload['genes'])))
+            ax.set_yticklabels(payload['genes'], fontsize=6)
+        else:
+            ax.set_yticks([])
+        ax.set_xticks([])
+        fig.colorbar(image, ax=ax, label='row z-score')
+    else:
+        raise ValueError(f"Unknown plot: {payload['plot']}")
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+class PlotCache:
+    """渲染结果的文件缓存：<root>/<task_id // 1000>/<task_id>/<参数摘要>.<格式>"""
+
+    def __init__(self, root='data/processed/plots'):
+        self.root = Path(root)
+
+    def remove(self, task_id):
+        shutil.rmtree(self.root / str(task_id // 1000) / str(task_id), ignore_errors=True)
+
+    def path(self, task_id, plot, params, fmt):
+        digest = hashlib.sha1(canonical_json({'plot': plot, **params}).encode('utf-8')).hexdigest()[:20]
+        return self.root / str(task_id // 1000) / str(task_id) / f"{plot}-{digest}.{fmt}"
+
+    def get_or_render(self, task_id, plot, params, fmt, make_payload, width, height):
+        """返回缓存的图像字节，不存在时生成绘图数据并渲染"""
+        path = self.path(task_id, plot, params, fmt)
+        if path.exists():
+            return path.read_bytes()
+        data = render(make_payload(), fmt, width, height)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 同一图像可能被多个线程/进程同时渲染：各自写入唯一的临时文件再原子替换
+        with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp', delete=False) as f:
+            f.write(data)
+        os.replace(f.name, path)
+        return data
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# 查询计划检查：记录接口实际执行的 SELECT，用 EXPLAIN QUERY PLAN 确认大表都通过索引查找
+
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# 行数随数据规模增长的表；这些表上出现 SCAN（含全索引扫描）视为回归
+LARGE_TABLES = ('gene_expression', 'samples', 'analysis_tasks')
+
+_SCAN_RE = re.compile(r'^SCAN (\w+)')
+_LIMIT_RE = re.compile(r'\bLIMIT\b', re.IGNORECASE)
+_SOURCE_RE = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!(?:WHERE|JOIN|ON|GROUP|ORDER|LIMIT|LEFT|INNER|CROSS|UNION)\b)(\w+))?',
+                        re.IGNORECASE)
+_WHERE_RE = re.compile(r'\bWHERE\b(.*?)(?=\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|\bHAVING\b|$)', re.IGNORECASE | re.DOTALL)
+_ORDER_RE = re.compile(r'\bORDER BY\s+(?:(\w+)\.)?(\w+)', re.IGNORECASE)
+_QUALIFIED_RE = re.compile(r'\b\w+\.\w+')
+_ORDERED_SCAN = ('USING INTEGER PRIMARY KEY', 'USING INDEX', 'USING COVERING INDEX')
+
+
+@contextmanager
+def record_statements(engine):
+    """在上下文内记录引擎执行的 SELECT 语句，返回 {语句: 参数}（同一语句只保留第一次的参数）"""
+    statements = {}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            statements.setdefault(statement, parameters)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def explain(connection, statement, parameters=()):
+    """返回 EXPLAIN QUERY PLAN 的各行说明"""
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters or ()).fetchall()
+    return [row[-1] for row in rows]
+
+
+def _sources(statement):
+    """FROM/JOIN 中的 {名称或别名: 表名}"""
+    sources = {}
+    for table, alias in _SOURCE_RE.findall(statement):
+        sources[table] = table
+        if alias:
+            sources[alias] = table
+    return sources
+
+
+def _filtered(statement, name):
+    """WHERE 条件是否可能作用于 name（限定列名包含 name.，或存在未限定的列名时都算）"""
+    for clause in _WHERE_RE.findall(statement):
+        qualified = _QUALIFIED_RE.findall(clause)
+        if not qualified or any(q.startswith(name + '.') for q in qualified):
+            return True
+    return False
+
+
+def _bounded(detail, name, statement):
+    """带 LIMIT、不过滤该表、按主键或索引顺序读取的 SCAN 只读前几行（如任务列表按 ID 倒序），读取量有界"""
+    if not _LIMIT_RE.search(statement) or _filtered(statement, name):
+        return False
+    if any(using in detail for using in _ORDERED_SCAN):
+        return True
+    # 按 rowid（id INTEGER PRIMARY KEY）顺序扫描时计划里只有 "SCAN 表名"
+    order = _ORDER_RE.search(statement)
+    return bool(order) and order.group(1) in (None, name) and order.group(2).lower() in ('id', 'rowid')
+
+
+def full_scans(plan, tables=LARGE_TABLES, statement=''):
+    """计划中对大表的 SCAN 步骤（别名按语句中的 FROM/JOIN 还原为表名）
+
+    需要临时排序的计划会读完整张表；否则带 LIMIT、不过滤该表且按主键或索引顺序的 SCAN 不计入。
+    """
+    needs_sort = any('TEMP B-TREE FOR ORDER BY' in d for d in plan)
+    sources = _sources(statement)
+    scans = []
+    for detail in plan:
+        match = _SCAN_RE.match(detail)
+        if not match:
+            continue
+        name = match.group(1)
+        if sources.get(name, name) not in tables:
+            continue
+        if not needs_sort and _bounded(detail, name, statement):
+            continue
+        scans.append(detail)
+    return scans
+
+def check_statements(connection, statements, tables=LARGE_TABLES):
+    """对记录的语句逐条 EXPLAIN，返回 [(语句, 计划, 全表扫描步骤)]"""
+    results = []
+    for statement, parameters in statements.items():
+        plan = explain(connection, statement, parameters)
+        results.append((statement, plan, full_scans(plan, tables, statement)))
+    return results
@@ -4,12 +4,22 @@
 import subprocess
 import json
 import os
+import shutil
+import tempfile
+import time
 from pathlib import Path
 
+from r_worker_pool import RWorkerTimeout
+
 class RRunner:
-    def __init__(self, r_scripts_dir="R_scripts", data_dir="data"):
+    def __init__(self, r_scripts_dir="R_scripts", data_dir="data", worker_pool=None, timeout=None, observer=None):
         self.r_scripts_dir = Path(r_scripts_dir)
         self.data_dir = Path(data_dir)
+        # 配置常驻R进程池时复用已加载依赖的进程，否则每次启动新的 Rscript
+        self.worker_pool = worker_pool
+        self.timeout = timeout
+        # observer(analysis_type, mode, seconds, exit_status) 在每次运行结束后调用，用于记录指标
+        self.observer = observer
         self.results_dir = self.data_dir / "processed" / "analysis_results"
         
         # 创建目录（如果不存在）
@@ -37,15 +47,48 @@ class RRunner:
         if not script_path.exists():
             raise FileNotFoundError(f"R script not found: {script_path}")
         
-        # 准备输入和输出文件
-        input_file = self.results_dir / f"{analysis_type}_input.json"
-        output_file = self.results_dir / f"{analysis_type}_output.json"
-        
-        # 写入输入参数
-        with open(input_file, 'w') as f:
-            json.dump(parameters, f, indent=2)
+        # 每次运行使用独立的临时目录，并发任务之间不会互相覆盖输入输出文件
+        job_dir = Path(tempfile.mkdtemp(prefix=f"{analysis_type}_", dir=self.results_dir))
+        input_file = job_dir / "input.json"
+        output_file = job_dir / "output.json"
         
-        # 运行R脚本
+        mode = 'pool' if self.worker_pool is not None else 'rscript'
+        exit_status = 'error'
+        started = time.perf_counter()
+        try:
+            # 写入输入参数
+            with open(input_file, 'w') as f:
+                json.dump(parameters, f)
+            
+            # 使用常驻R进程池
+            if self.worker_pool is not None:
+                stdout = self.worker_pool.run(script_path, input_file, output_file, self.timeout)
+                exit_status = '0'
+                return self._read_output(output_file, stdout)
+            
+            result = self._run_script(script_path, input_file, output_file)
+            exit_status = '0'
+            return result
+        except RuntimeError as e:
+            exit_status = self._exit_status(e)
+            raise
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            if self.observer is not None:
+                self.observer(analysis_type, mode, time.perf_counter() - started, exit_status)
+    
+    @staticmethod
+    def _exit_status(error):
+        """失败原因：R进程退出码、'timeout' 或 'error'"""
+        cause = error.__cause__
+        if isinstance(error, RWorkerTimeout) or isinstance(cause, subprocess.TimeoutExpired):
+            return 'timeout'
+        if isinstance(cause, subprocess.CalledProcessError):
+            return str(cause.returncode)
+        return 'error'
+    
+    def _run_script(self, script_path, input_file, output_file):
+        """启动新的 Rscript 进程运行脚本"""
         cmd = [
             'Rscript', str(script_path),
             '--input', str(input_file),
@@ -58,24 +101,29 @@ class RRunner:
                 capture_output=True, 
                 text=True, 
                 check=True,
-                cwd=os.getcwd()
+                cwd=os.getcwd(),
+                timeout=self.timeout
             )
             
-            # 读取结果
-            if output_file.exists():
-                with open(output_file, 'r') as f:
-                    return json.load(f)
-            else:
-                return {
-                    'status': 'completed',
-                    'message': 'Analysis completed successfully',
-                    'stdout': result.stdout
-                }
+            return self._read_output(output_file, result.stdout)
                 
         except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"R script failed: {e.stderr}")
+            raise RuntimeError(f"R script failed: {e.stderr}") from e
+        except subprocess.TimeoutExpired as e:
+            raise RuntimeError(f"R script timed out after {self.timeout} seconds") from e
         except Exception as e:
-            raise RuntimeError(f"Error running R script: {str(e)}")
+            raise RuntimeError(f"Error running R script: {str(e)}") from e
+    
+    def _read_output(self, output_file, stdout):
+        """读取R脚本写出的结果文件"""
+        if output_file.exists():
+            with open(output_file, 'r') as f:
+                return json.load(f)
+        return {
+            'status': 'completed',
+            'message': 'Analysis completed successfully',
+            'stdout': stdout
+        }
     
     def test_r_environment(self):
         """测试R环境是否可用"""
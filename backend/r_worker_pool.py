@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# 常驻R工作进程池：依赖包只在每个进程启动时加载一次
+
+import json
+import os
+import select
+import subprocess
+import threading
+import time
+from pathlib import Path
+from queue import Empty, LifoQueue
+
+
+class RWorkerError(RuntimeError):
+    """R工作进程崩溃或协议错误，该进程需要重启"""
+
+
+class RWorkerTimeout(RWorkerError):
+    """任务超过单任务超时时间"""
+
+
+class RWorker:
+    """单个常驻 Rscript 进程，通过 stdin/stdout 按行交换 JSON"""
+
+    def __init__(self, worker_script, preload=(), rscript='Rscript', startup_timeout=300):
+        self.worker_script = Path(worker_script)
+        self.preload = list(preload)
+        self.rscript = rscript
+        self.startup_timeout = startup_timeout
+        self.proc = None
+        self.jobs_done = 0
+        self._buffer = b''
+        self._next_id = 0
+
+    def start(self):
+        cmd = [self.rscript, str(self.worker_script)]
+        if self.preload:
+            cmd += ['--preload', ','.join(self.preload)]
+        self.proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=os.getcwd()
+        )
+        message = self._read_message(self.startup_timeout)
+        if not message.get('ready'):
+            self.kill()
+            raise RWorkerError(f"R worker failed to start: {message}")
+        return self
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def _read_message(self, timeout):
+        """读取一行JSON响应；超时或进程退出时抛出 RWorkerError"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        fd = self.proc.stdout.fileno()
+        while b'\n' not in self._buffer:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise RWorkerTimeout(f"R worker timed out after {timeout} seconds")
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise RWorkerError(f"R worker exited with code {self.proc.poll()}")
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        return json.loads(line.decode('utf-8'))
+
+    def run(self, script, input_file, output_file, timeout=None):
+        """在该进程中执行一个分析脚本，返回脚本的标准输出"""
+        self._next_id += 1
+        job = {
+            'id': self._next_id,
+            'script': str(Path(script).resolve()),
+            'input': str(Path(input_file).resolve()),
+            'output': str(Path(output_file).resolve())
+        }
+        try:
+            self.proc.stdin.write((json.dumps(job) + '\n').encode('utf-8'))
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise RWorkerError(f"R worker is not accepting jobs: {e}")
+
+        response = self._read_message(timeout)
+        self.jobs_done += 1
+        if response.get('id') != job['id']:
+            raise RWorkerError('R worker protocol out of sync')
+        if not response.get('ok'):
+            # 脚本错误不影响进程本身，工作进程可继续复用
+            raise RuntimeError(f"R script failed: {response.get('error')}")
+        return response.get('stdout', '')
+
+    def kill(self):
+        if self.proc is None:
+            return
+        if self.proc.poll() is None:
+            self.proc.kill()
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+        for stream in (self.proc.stdin, self.proc.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+    def stop(self):
+        """通知进程正常退出"""
+        if self.alive():
+            try:
+                self.proc.stdin.write(b'{"command": "quit"}\n')
+                self.proc.stdin.flush()
+                self.proc.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        self.kill()
+
+
+class RWorkerPool:
+    """固定大小的常驻R进程池
+
+    - 进程按需启动（或调用 warm() 预热），启动成本每个进程只付一次
+    - 任务超时或进程崩溃时杀掉该进程，下次取用时重新启动
+    - 每个进程执行 max_jobs_per_worker 个任务后回收，防止R会话内存持续增长
+    """
+
+    def __init__(self, size=2, worker_script='R_scripts/r_worker.R', preload=(), rscript='Rscript',
+                 job_timeout=600, max_jobs_per_worker=200):
+        self.size = size
+        self.worker_script = worker_script
+        self.preload = preload
+        self.rscript = rscript
+        self.job_timeout = job_timeout
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self._idle = LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._stats = {'started': 0, 'restarted': 0, 'timeouts': 0, 'jobs': 0}
+
+    def _spawn(self):
+        worker = RWorker(self.worker_script, self.preload, self.rscript).start()
+        with self._lock:
+            self._stats['started'] += 1
+        return worker
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            try:
+                worker = self._idle.get_nowait()
+            except Empty:
+                worker = None
+            if worker is None or not worker.alive():
+                if worker is not None:
+                    worker.kill()
+                    with self._lock:
+                        self._stats['restarted'] += 1
+                worker = self._spawn()
+            return worker
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, worker, healthy):
+        if healthy and worker.alive() and worker.jobs_done < self.max_jobs_per_worker:
+            self._idle.put(worker)
+        elif healthy:
+            worker.stop()
+        else:
+            worker.kill()
+        self._slots.release()
+
+    def warm(self):
+        """预先启动所有工作进程"""
+        workers = [self._acquire() for _ in range(self.size)]
+        for worker in workers:
+            self._release(worker, True)
+
+    def run(self, script, input_file, output_file, timeout=None):
+        """执行一个分析脚本，返回脚本标准输出"""
+        worker = self._acquire()
+        healthy = True
+        try:
+            return worker.run(script, input_file, output_file, timeout or self.job_timeout)
+        except RWorkerError as e:
+            healthy = False
+            with self._lock:
+                if isinstance(e, RWorkerTimeout):
+                    self._stats['timeouts'] += 1
+                self._stats['restarted'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._stats['jobs'] += 1
+            self._release(worker, healthy)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({'size': self.size, 'idle': self._idle.qsize()})
+        return stats
+
+    def close(self):
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except Empty:
+                break
+            worker.stop()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# 分析结果缓存：按 (分析类型, 规范化参数, 数据版本) 的哈希寻址
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def canonical_json(parameters):
+    """参数的规范化JSON表示（键排序、无多余空白），用于哈希与持久化比对"""
+    return json.dumps(parameters or {}, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+class ResultCache:
+    """进程内 LRU 结果缓存
+
+    - 按条目数、总字节数和存活时间淘汰
+    - 同一数据集的数据版本变化时，丢弃该数据集的旧条目
+    - get_or_compute 合并相同键的并发请求，只执行一次计算
+    """
+
+    def __init__(self, max_entries=256, max_bytes=256 * 1024 * 1024, ttl=24 * 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._dataset_versions = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'store_hits': 0, 'merged': 0, 'evictions': 0, 'invalidations': 0}
+
+    @staticmethod
+    def make_key(analysis_type, parameters, data_version):
+        payload = f"{analysis_type}\n{canonical_json(parameters)}\n{data_version}"
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def note_data_version(self, dataset_id, version):
+        """记录数据集当前版本；版本前进时清除该数据集的旧结果"""
+        with self._lock:
+            previous = self._dataset_versions.get(dataset_id)
+            self._dataset_versions[dataset_id] = version
+            if previous is not None and previous != version:
+                self._drop_dataset(dataset_id)
+
+    def invalidate_dataset(self, dataset_id):
+        with self._lock:
+            self._dataset_versions.pop(dataset_id, None)
+            self._drop_dataset(dataset_id)
+
+    def _drop_dataset(self, dataset_id):
+        for key in [k for k, e in self._entries.items() if e['dataset_id'] == dataset_id]:
+            self._remove(key)
+            self._stats['invalidations'] += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry['size']
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl and time.time() - entry['stored_at'] > self.ttl:
+            self._remove(key)
+            self._stats['evictions'] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key, record_miss=True):
+        """返回缓存结果，未命中返回 None
+
+        提交阶段的预检查可传 record_miss=False，未命中留给随后的 get_or_compute 计数。
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                if record_miss:
+                    self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            return entry['result']
+
+    def put(self, key, result, dataset_id=None, size=None):
+        if size is None:
+            size = len(json.dumps(result))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                'result': result,
+                'dataset_id': dataset_id,
+                'size': size,
+                'stored_at': time.time()
+            }
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def replace(self, result, replacement, size=None):
+        """把缓存中就是 result 这个对象的条目改存 replacement（例如结果写入任务后改存精简结果），返回替换条目数
+
+        按对象身份匹配，数据版本变化后以新键缓存的其他结果不会被替换。
+        """
+        if size is None:
+            size = len(json.dumps(replacement))
+        replaced = 0
+        with self._lock:
+            for entry in self._entries.values():
+                if entry['result'] is result:
+                    self._bytes += size - entry['size']
+                    entry['result'], entry['size'] = replacement, size
+                    replaced += 1
+        return replaced
+
+    def get_or_compute(self, key, compute, dataset_id=None, loader=None):
+        """命中则直接返回，否则执行 compute()；相同键的并发调用等待同一次计算
+
+        loader() 可选，用于在计算前查找持久化的历史结果（如 AnalysisTask.results）。
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                self._stats['hits'] += 1
+                return entry['result']
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+                self._stats['misses'] += 1
+            else:
+                self._stats['merged'] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = loader() if loader is not None else None
+            if result is not None:
+                with self._lock:
+                    self._stats['store_hits'] += 1
+            else:
+                result = compute()
+            self.put(key, result, dataset_id)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'inflight': len(self._inflight),
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl
+            })
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# 分析结果列式存储：结果中的大表按列写入压缩 npz 文件，AnalysisTask.results 只保留标量字段、小表与文件引用
+
+import json
+import os
+import re
+import shutil
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+from streaming import split_tables, project
+
+# 结果查询接口的默认与最大每页行数
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 10000
+# NDJSON 流式输出时每次从列式文件读取的行数
+STREAM_CHUNK_ROWS = 5000
+
+_FILTER_RE = re.compile(r'^\s*(abs\()?\s*([A-Za-z_][\w.]*)\s*(\))?\s*(<=|>=|!=|==|=|<|>)\s*(.+?)\s*$')
+_OPERATORS = {
+    '<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal,
+    '=': np.equal, '==': np.equal, '!=': np.not_equal
+}
+
+
+def _kind(values):
+    """列类型：bool / int / float / str / json（嵌套值以 JSON 文本保存）"""
+    present = [v for v in values if v is not None]
+    if all(isinstance(v, bool) for v in present):
+        return 'bool'
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        return 'int'
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        return 'float'
+    if all(isinstance(v, str) for v in present):
+        return 'str'
+    return 'json'
+
+
+def encode_column(values):
+    """把一列 Python 值编码为 (类型, 数组, 空值掩码或 None)"""
+    kind = _kind(values)
+    nulls = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+    if kind == 'bool':
+        array = np.fromiter((bool(v) for v in values), dtype=bool, count=len(values))
+    elif kind == 'int':
+        array = np.fromiter((v if v is not None else 0 for v in values), dtype=np.int64, count=len(values))
+    elif kind == 'float':
+        array = np.fromiter((v if v is not None else np.nan for v in values), dtype=np.float64, count=len(values))
+    elif kind == 'str':
+        array = np.array([v if v is not None else '' for v in values], dtype=str)
+    else:
+        array = np.array([json.dumps(v, ensure_ascii=False, separators=(',', ':')) for v in values], dtype=str)
+    return kind, array, (nulls if nulls.any() else None)
+
+
+def decode_values(kind, array, nulls=None):
+    """把列数组（或其切片）还原为 Python 值列表"""
+    if kind == 'float':
+        values = [None if v != v else v for v in array.tolist()]
+    elif kind == 'json':
+        values = [json.loads(v) for v in array.tolist()]
+    else:
+        values = array.tolist()
+    if nulls is not None:
+        values = [None if n else v for v, n in zip(values, nulls.tolist())]
+    return values
+
+
+def _uniform_table(rows):
+    # 每行的键完全相同才能按列保存并无损还原
+    keys = list(rows[0])
+    key_set = set(keys)
+    return keys if all(len(row) == len(keys) and row.keys() == key_set for row in rows) else None
+
+
+def parse_filter(expression):
+    """解析过滤条件，如 'padj<0.05'、'abs(log2FoldChange)>=1'、'gene=TP53'，返回 (列, 运算符, 值, 取绝对值)"""
+    match = _FILTER_RE.match(expression or '')
+    if not match or bool(match.group(1)) != bool(match.group(3)):
+        raise ValueError(f"Invalid filter: {expression}")
+    raw = match.group(5).strip('\'"')
+    try:
+        value = float(raw)
+    except ValueError:
+        value = {'true': True, 'false': False}.get(raw.lower(), raw)
+    return match.group(2), match.group(4), value, bool(match.group(1))
+
+
+class ResultTable:
+    """结果中的一个表：列按需读取（来自 npz 时只解压被访问的列）"""
+
+    def __init__(self, name, rows, columns, loader):
+        self.name = name
+        self.rows = rows
+        self.columns = columns
+        self._loader = loader
+        self._cache = {}
+
+    def column(self, name):
+        """返回 (类型, 数组, 空值掩码或 None)"""
+        if name not in self.columns:
+            raise ValueError(f"Unknown column in {self.name}: {name}")
+        if name not in self._cache:
+            self._cache[name] = self._loader(name)
+        return self._cache[name]
+
+    def mask(self, filters):
+        """满足全部过滤条件的行（布尔数组）；空值不满足任何条件"""
+        keep = np.ones(self.rows, dtype=bool)
+        for column, op, value, absolute in filters:
+            kind, array, nulls = self.column(column)
+            if kind in ('int', 'float'):
+                if not isinstance(value, float):
+                    raise ValueError(f"Column {column} is numeric; filter value must be a number")
+                array = np.abs(array) if absolute else array
+            elif absolute:
+                raise ValueError(f"abs() needs a numeric column: {column}")
+            elif kind == 'bool':
+                if not isinstance(value, bool):
+                    raise ValueError(f"Column {column} is boolean; filter value must be true or false")
+            elif kind == 'str':
+                value = str(value) if not isinstance(value, float) else (str(int(value)) if value.is_integer() else str(value))
+            else:
+                raise ValueError(f"Column {column} cannot be filtered")
+            with np.errstate(invalid='ignore'):
+                matched = _OPERATORS[op](array, value)
+            if nulls is not None:
+                matched &= ~nulls
+            keep &= matched
+        return keep
+
+    def query(self, fields=None, filters=(), sort=None, offset=0, limit=DEFAULT_PAGE_SIZE):
+        """过滤、排序、分页后返回 (匹配行数, 行列表)；只读取 fields、过滤与排序涉及的列"""
+        fields = [f for f in fields if f in self.columns] if fields else self.columns
+        index = np.flatnonzero(self.mask(filters)) if filters else np.arange(self.rows)
+        if sort:
+            descending = sort.startswith('-')
+            kind, array, nulls = self.column(sort.lstrip('-+'))
+            if kind == 'json':
+                raise ValueError(f"Column {sort.lstrip('-+')} cannot be sorted")
+            keys = array[index]
+            order = np.argsort(keys, kind='stable')
+            if descending:
+                order = order[::-1]
+            # 空值（及 NaN）始终排在最后
+            missing = (nulls[index] if nulls is not None else np.zeros(index.size, dtype=bool))
+            if kind == 'float':
+                missing = missing | np.isnan(keys)
+            order = np.concatenate([order[~missing[order]], order[missing[order]]])
+            index = index[order]
+        page = index[offset:offset + limit]
+        columns = {}
+        for name in fields:
+            kind, array, nulls = self.column(name)
+            columns[name] = decode_values(kind, array[page], nulls[page] if nulls is not None else None)
+        rows = [dict(zip(fields, values)) for values in zip(*columns.values())] if fields else [{} for _ in page]
+        return int(index.size), rows
+
+    def to_rows(self):
+        return self.query(limit=self.rows)[1]
+
+
+def _memory_table(name, rows):
+    keys = list(rows[0]) if rows else []
+    encoded = {}
+
+    def loader(column):
+        if column not in encoded:
+            encoded[column] = encode_column([row.get(column) for row in rows])
+        return encoded[column]
+    return ResultTable(name, len(rows), keys, loader)
+
+
+class ResultStore:
+    """AnalysisTask 结果的列式文件存储
+
+    超过 min_rows 行、且每行键相同的表写入 <root>/<task_id // 1000>/<task_id>.npz，每列一个压缩成员，
+    读取时只解压被访问的列。数据库中保存的 JSON 为原结果去掉这些表后加上::
+
+        "artifact": {"file": "0/123.npz", "tables": {"volcano_data": {"rows": 20000, "columns": [...]}}}
+    """
+
+    def __init__(self, root='data/processed/task_results', min_rows=100):
+        self.root = Path(root)
+        self.min_rows = min_rows
+
+    def path(self, stored):
+        return self.root / stored['artifact']['file']
+
+    @staticmethod
+    def relative_path(task_id):
+        return f"{task_id // 1000}/{task_id}.npz"
+
+    def save(self, task_id, result):
+        """写入结果的大表，返回应保存到 AnalysisTask.results 的精简结果
+
+        result 已是另一任务保存的精简结果（引用其列式文件）时不重新编码，直接链接该文件。
+        """
+        if not isinstance(result, dict) or not isinstance(result.get('results'), dict):
+            return result
+        if 'artifact' in result:
+            return self.link(task_id, result)
+        _, tables = split_tables(result['results'])
+        large = {}
+        for name, rows in tables.items():
+            columns = _uniform_table(rows) if len(rows) >= self.min_rows else None
+            if columns:
+                large[name] = columns
+        if not large:
+            return result
+
+        members = {}
+        meta = {}
+        for t, (name, columns) in enumerate(large.items()):
+            rows = tables[name]
+            kinds = []
+            for c, column in enumerate(columns):
+                kind, array, nulls = encode_column([row[column] for row in rows])
+                members[f't{t}_c{c}'] = array
+                if nulls is not None:
+                    members[f't{t}_c{c}_null'] = nulls
+                kinds.append(kind)
+            meta[name] = {'rows': len(rows), 'columns': columns, 'kinds': kinds, 'member': f't{t}'}
+
+        relative = self.relative_path(task_id)
+        path = self.root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp-{os.getpid()}")
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, **members)
+        os.replace(tmp, path)
+
+        stored = {k: v for k, v in result.items() if k != 'results'}
+        stored['results'] = {k: v for k, v in result['results'].items() if k not in large}
+        stored['artifact'] = {'file': relative, 'tables': meta}
+        return stored
+
+    def tables(self, stored):
+        """结果中所有表（行内与文件中的）{表名: ResultTable}"""
+        body = stored.get('results') if isinstance(stored, dict) else None
+        _, inline = split_tables(body)
+        tables = {name: _memory_table(name, rows) for name, rows in inline.items()}
+        artifact = stored.get('artifact') if isinstance(stored, dict) else None
+        if artifact:
+            path = self.path(stored)
+            for name, meta in artifact['tables'].items():
+                tables[name] = ResultTable(name, meta['rows'], meta['columns'], self._npz_loader(path, meta))
+        return tables
+
+    @staticmethod
+    def _npz_loader(path, meta):
+        positions = {column: c for c, column in enumerate(meta['columns'])}
+
+        def loader(column):
+            c = positions[column]
+            key = f"{meta['member']}_c{c}"
+            try:
+                with np.load(path, allow_pickle=False) as npz:
+                    nulls = npz[f'{key}_null'] if f'{key}_null' in npz.files else None
+                    return meta['kinds'][c], npz[key], nulls
+            except (OSError, KeyError, zipfile.BadZipFile) as e:
+                raise FileNotFoundError(f"Result artifact is missing or damaged: {path}") from e
+        return loader
+
+    def stream_rows(self, header, stored, fields=None, table=None, chunk_size=STREAM_CHUNK_ROWS):
+        """与 streaming.result_rows 相同的 NDJSON 行，列式文件中的表按 chunk_size 行分块读取，不还原完整结果"""
+        body = stored.get('results') if isinstance(stored, dict) else None
+        scalars, inline = split_tables(body)
+        artifact = stored.get('artifact') if isinstance(stored, dict) else None
+        stored_tables = {name: table_ for name, table_ in self.tables(stored).items() if name not in inline} if artifact else {}
+        outer = {k: v for k, v in stored.items() if k not in ('results', 'artifact')} if isinstance(stored, dict) else {}
+        counts = {name: len(rows) for name, rows in inline.items()}
+        counts.update({name: t.rows for name, t in stored_tables.items()})
+        yield {'type': 'header', **header, **outer, 'results': scalars, 'tables': counts}
+        for name, rows in inline.items():
+            if table and name != table:
+                continue
+            for row in rows:
+                yield {'type': 'row', 'table': name, **project(row, fields)}
+        for name, result_table in stored_tables.items():
+            if table and name != table:
+                continue
+            for offset in range(0, result_table.rows, chunk_size):
+                for row in result_table.query(fields, offset=offset, limit=chunk_size)[1]:
+                    yield {'type': 'row', 'table': name, **row}
+
+    def materialize(self, stored):
+        """还原完整结果（与写入前相同的结构）"""
+        if not isinstance(stored, dict) or 'artifact' not in stored:
+            return stored
+        result = {k: v for k, v in stored.items() if k not in ('artifact', 'results')}
+        results = dict(stored['results'])
+        for name, table in self.tables(stored).items():
+            if name not in results:
+                results[name] = table.to_rows()
+        result['results'] = results
+        return result
+
+    def link(self, task_id, stored):
+        """让 task_id 复用 stored 的列式文件：硬链接（文件系统不支持时复制），返回指向新文件的精简结果
+
+        每个任务各有一个文件名，删除任一任务的文件不影响其他任务。源文件不存在时抛出 FileNotFoundError。
+        """
+        relative = self.relative_path(task_id)
+        source, path = self.path(stored), self.root / relative
+        if source != path:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.unlink(missing_ok=True)
+            try:
+                os.link(source, path)
+            except FileNotFoundError:
+                raise
+            except OSError:
+                shutil.copyfile(source, path)
+        return {**stored, 'artifact': {**stored['artifact'], 'file': relative}}
+
+    def remove(self, stored):
+        if isinstance(stored, dict) and 'artifact' in stored:
+            self.path(stored).unlink(missing_ok=True)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# 平台统计快照：按数据集贡献增量维护 /api/statistics/overview 的聚合结果
+
+CATEGORY_FIELDS = ('tissue_type', 'tumor_type', 'data_source', 'publication_year', 'priority')
+
+
+def empty_snapshot():
+    return {
+        'total_datasets': 0,
+        'total_samples': 0,
+        'total_genes': 0,
+        'total_expressions': 0,
+        'non_zero_records': 0,
+        'sum_values': 0.0,
+        'categories': {field: {} for field in CATEGORY_FIELDS},
+        # 每个数据集的贡献，移除或更新时按原值扣减
+        'datasets': {}
+    }
+
+
+def dataset_contribution(dataset, summary, n_samples):
+    """计算单个数据集对快照的贡献
+
+    dataset: Dataset 行；summary: DatasetSummary 行（可为 None）；n_samples: 样本表中的样本数
+    """
+    rows = summary.expression_rows if summary else 0
+    return {
+        'samples': n_samples,
+        'expressions': rows,
+        'non_zero': summary.non_zero_rows if summary else 0,
+        'sum_values': (summary.mean_value or 0.0) * rows if summary else 0.0,
+        'min_value': summary.min_value if summary and rows else None,
+        'max_value': summary.max_value if summary and rows else None,
+        'categories': {field: _category_key(getattr(dataset, field, None)) for field in CATEGORY_FIELDS}
+    }
+
+
+def _category_key(value):
+    # JSON 对象的键只能是字符串，None 单独记为 "null"
+    return 'null' if value is None else str(value)
+
+
+def _category_value(key):
+    return None if key == 'null' else key
+
+
+def add_dataset(snapshot, dataset_id, contribution):
+    key = str(dataset_id)
+    if key in snapshot['datasets']:
+        remove_dataset(snapshot, dataset_id)
+    snapshot['datasets'][key] = contribution
+    _apply(snapshot, contribution, 1)
+
+
+def remove_dataset(snapshot, dataset_id):
+    contribution = snapshot['datasets'].pop(str(dataset_id), None)
+    if contribution is not None:
+        _apply(snapshot, contribution, -1)
+
+
+def _apply(snapshot, contribution, sign):
+    snapshot['total_datasets'] += sign
+    snapshot['total_samples'] += sign * contribution['samples']
+    snapshot['total_expressions'] += sign * contribution['expressions']
+    snapshot['non_zero_records'] += sign * contribution['non_zero']
+    snapshot['sum_values'] += sign * contribution['sum_values']
+    for field, key in contribution['categories'].items():
+        counts = snapshot['categories'][field]
+        counts[key] = counts.get(key, 0) + sign
+        if counts[key] <= 0:
+            del counts[key]
+
+
+def render(snapshot):
+    """把快照转换为 /api/statistics/overview 的响应结构"""
+    categories = snapshot['categories']
+
+    def counts(field):
+        return [(_category_value(k), v) for k, v in sorted(categories[field].items(), key=lambda kv: (-kv[1], kv[0]))]
+
+    # 最小/最大值从各数据集的贡献中合并，数据集数量级为数百，开销可忽略
+    mins = [c['min_value'] for c in snapshot['datasets'].values() if c['min_value'] is not None]
+    maxs = [c['max_value'] for c in snapshot['datasets'].values() if c['max_value'] is not None]
+    total_records = snapshot['total_expressions']
+    non_zero = snapshot['non_zero_records']
+    mean_value = snapshot['sum_values'] / total_records if total_records else 0
+
+    tissue_stats = counts('tissue_type')
+    tumor_stats = counts('tumor_type')
+    total_datasets = snapshot['total_datasets']
+    total_samples = snapshot['total_samples']
+    total_genes = snapshot['total_genes']
+
+    # 计算数据质量评分
+    completeness_score = min(100, (total_datasets * 10 + total_samples * 0.1 + total_genes * 0.01))
+    coverage_score = (non_zero / total_records * 100) if total_records > 0 else 0
+    diversity_score = min(100, len(tissue_stats) * 20 + len(tumor_stats) * 10)
+    overall_score = (completeness_score + coverage_score + diversity_score) / 3
+
+    return {
+        'total_datasets': total_datasets,
+        'total_samples': total_samples,
+        'total_genes': total_genes,
+        'total_expressions': total_records,
+        'tissue_types': [{'name': t[0], 'count': t[1]} for t in tissue_stats],
+        'tumor_types': [{'name': t[0], 'count': t[1]} for t in tumor_stats],
+        'data_sources': [{'name': s[0], 'count': s[1]} for s in counts('data_source')],
+        'publication_years': [{'name': y[0], 'count': y[1]} for y in counts('publication_year') if y[0]],
+        'priority_levels': [{'name': f'Priority {p[0]}', 'count': p[1]} for p in counts('priority')],
+        'expression_statistics': {
+            'min_value': float(min(mins)) if mins else 0,
+            'max_value': float(max(maxs)) if maxs else 0,
+            'mean_value': float(mean_value),
+            'total_records': total_records,
+            'non_zero_records': non_zero
+        },
+        'quality_metrics': {
+            'data_completeness': round(completeness_score, 2),
+            'expression_coverage': round(coverage_score, 2),
+            'dataset_diversity': round(diversity_score, 2),
+            'overall_score': round(overall_score, 2)
+        }
+    }
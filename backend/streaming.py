@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# NDJSON 流式响应与字段投影工具
+
+import json
+
+from flask import Response, request, stream_with_context
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def wants_ndjson():
+    """客户端是否请求流式输出（Accept: application/x-ndjson 或 ?stream=1）"""
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+
+def ndjson_response(items, status=200):
+    """把可迭代对象逐条序列化为 NDJSON 行并流式返回"""
+    def generate():
+        for item in items:
+            yield json.dumps(item, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+    return Response(stream_with_context(generate()), status=status, mimetype=NDJSON_MIMETYPE)
+
+
+def requested_fields():
+    """解析 ?fields=a,b,c；未指定时返回 None（不做投影）"""
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    return fields or None
+
+
+def project(item, fields):
+    """只保留 fields 中的键，fields 为 None 时原样返回"""
+    if fields is None:
+        return item
+    return {f: item[f] for f in fields if f in item}
+
+
+def _is_table(value):
+    return isinstance(value, list) and bool(value) and all(isinstance(row, dict) for row in value)
+
+
+def split_tables(results):
+    """把分析结果中的行表（由字典组成的列表）与其余标量字段分开，返回 (scalars, tables)"""
+    if not isinstance(results, dict):
+        return results, {}
+    scalars, tables = {}, {}
+    for key, value in results.items():
+        if _is_table(value):
+            tables[key] = value
+        else:
+            scalars[key] = value
+    return scalars, tables
+
+
+def project_tables(result, fields):
+    """对分析结果 {status, message, results} 中每个行表做列投影"""
+    if fields is None or not isinstance(result, dict) or not isinstance(result.get('results'), dict):
+        return result
+    scalars, tables = split_tables(result['results'])
+    scalars.update({name: [project(row, fields) for row in rows] for name, rows in tables.items()})
+    return {**result, 'results': scalars}
+
+
+def result_rows(header, result, fields=None, table=None):
+    """把分析结果展开为 NDJSON 行：首行为任务信息与标量结果，其后每个表行一行
+
+    table 指定时只输出该表的行。
+
+    首行 {"type": "header", ..., "results": {标量字段}, "tables": {表名: 行数}}
+    表行 {"type": "row", "table": 表名, ...列}
+    """
+    body = result.get('results') if isinstance(result, dict) else None
+    scalars, tables = split_tables(body)
+    outer = {k: v for k, v in (result or {}).items() if k != 'results'} if isinstance(result, dict) else {}
+    yield {'type': 'header', **header, **outer, 'results': scalars,
+           'tables': {name: len(rows) for name, rows in tables.items()}}
+    for name, rows in tables.items():
+        if table and name != table:
+            continue
+        for row in rows:
+            yield {'type': 'row', 'table': name, **project(row, fields)}
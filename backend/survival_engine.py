@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# 进程内生存分析引擎：Kaplan–Meier 曲线、log-rank 检验，按表达高低分组时全基因一次向量化计算
+
+import numpy as np
+from scipy import stats
+
+from de_engine import bh_adjust
+from expression_store import prepare_rows
+
+# 每次计算的基因行数，控制 基因×样本 中间矩阵的内存
+ROW_BLOCK = 2048
+
+# 生存状态文本到事件（1 = 死亡/事件，0 = 删失）；其他取值（如 Unknown）的样本不参与分析
+EVENT_VALUES = {'1', 'dead', 'deceased', 'died', 'death', 'event', 'yes', 'true', 'recurrence', 'progression'}
+CENSORED_VALUES = {'0', 'alive', 'living', 'censored', 'no', 'false', 'disease free', 'no recurrence'}
+
+CUTPOINTS = ('median', 'optimal')
+
+
+def parse_event(status):
+    """把 Sample.survival_status 转为 1/0，无法识别时返回 None"""
+    if status is None:
+        return None
+    value = str(status).strip().lower()
+    if value in EVENT_VALUES:
+        return 1
+    if value in CENSORED_VALUES:
+        return 0
+    return None
+
+
+def event_design(times, events):
+    """不同事件时间上的风险集与事件指示矩阵
+
+    返回 (design, 总风险数, 总事件数)：design 为 样本×(2m) 矩阵，前 m 列表示样本在第 j 个事件时间仍处于风险中，
+    后 m 列表示样本在该时间发生事件。分组矩阵与之相乘即得各组每个事件时间的风险数与事件数（一次矩阵乘法）。
+    """
+    times = np.asarray(times, dtype=np.float64)
+    events = np.asarray(events, dtype=bool)
+    event_times = np.unique(times[events])
+    at_risk = times[:, None] >= event_times[None, :]
+    died = events[:, None] & (times[:, None] == event_times[None, :])
+    design = np.concatenate([at_risk, died], axis=1).astype(np.float64)
+    return design, at_risk.sum(axis=0).astype(np.float64), died.sum(axis=0).astype(np.float64)
+
+
+def _logrank_terms(n_risk, n_death):
+    # 结校正因子 (n - d) / (n - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(n_risk > 1, (n_risk - n_death) / (n_risk - 1), 0.0)
+
+
+def logrank_matrix(high, design, n_risk, n_death):
+    """两组 log-rank 检验，high 为 基因×样本 的布尔分组矩阵（高表达组为 True）
+
+    返回 (观察-期望 事件数, 方差, 卡方, p 值, log-rank 风险比估计 exp((O-E)/V))，均为每个基因一个值。
+    """
+    m = n_risk.size
+    counts = high.astype(np.float64) @ design
+    risk_high, death_high = counts[:, :m], counts[:, m:]
+    frac = risk_high / n_risk
+    observed_minus_expected = (death_high - n_death * frac).sum(axis=1)
+    variance = (n_death * frac * (1 - frac) * _logrank_terms(n_risk, n_death)).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        chisq = np.where(variance > 0, observed_minus_expected ** 2 / variance, np.nan)
+        hazard_ratio = np.where(variance > 0, np.exp(observed_minus_expected / variance), np.nan)
+    pvalue = stats.chi2.sf(chisq, 1)
+    return observed_minus_expected, variance, chisq, pvalue, hazard_ratio
+
+
+def logrank_groups(times, events, labels):
+    """k 组 log-rank 检验（labels 为每个样本的分组），返回 (卡方, 自由度, p 值)"""
+    groups = sorted(set(labels))
+    if len(groups) < 2:
+        return None, 0, None
+    design, n_risk, n_death = event_design(times, events)
+    m = n_risk.size
+    labels = np.asarray(labels, dtype=object)
+    counts = np.stack([labels == g for g in groups]).astype(np.float64) @ design
+    frac = counts[:, :m] / n_risk
+    u = (counts[:, m:] - n_death * frac).sum(axis=1)
+    w = n_death * _logrank_terms(n_risk, n_death)
+    # 超几何协方差：V_gh = sum d (n-d)/(n-1) * frac_g (delta_gh - frac_h)
+    v = np.diag((w * frac).sum(axis=1)) - np.einsum('t,gt,ht->gh', w, frac, frac)
+    # 去掉最后一组，剩余 k-1 维满秩
+    u, v = u[:-1], v[:-1, :-1]
+    chisq = float(u @ np.linalg.pinv(v) @ u)
+    df = len(groups) - 1
+    return chisq, df, float(stats.chi2.sf(chisq, df))
+
+
+def kaplan_meier(times, events):
+    """Kaplan–Meier 估计，置信区间为 Greenwood 方差的 log 变换（与 R survfit 默认 conf.type = "log" 一致）"""
+    times = np.asarray(times, dtype=np.float64)
+    events = np.asarray(events, dtype=np.float64)
+    if times.size == 0:
+        return {'n': 0, 'events': 0, 'median_survival': None, 'curve': []}
+    unique_times, inverse = np.unique(times, return_inverse=True)
+    n_event = np.bincount(inverse, weights=events, minlength=unique_times.size)
+    n_total = np.bincount(inverse, minlength=unique_times.size)
+    n_risk = times.size - np.concatenate([[0], np.cumsum(n_total)[:-1]])
+    survival = np.cumprod(1 - n_event / n_risk)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        greenwood = np.cumsum(np.where(n_risk > n_event, n_event / (n_risk * (n_risk - n_event)), np.inf))
+        se_log = np.sqrt(greenwood)
+        lower = np.clip(survival * np.exp(-1.96 * se_log), 0, 1)
+        upper = np.clip(survival * np.exp(1.96 * se_log), 0, 1)
+    reached = np.flatnonzero(survival <= 0.5)
+    curve = [{
+        'time': float(t),
+        'n_risk': int(r),
+        'n_event': int(d),
+        'n_censor': int(n - d),
+        'survival': float(s),
+        'lower': float(lo) if np.isfinite(lo) and s > 0 else None,
+        'upper': float(up) if np.isfinite(up) and s > 0 else None
+    } for t, r, d, n, s, lo, up in zip(unique_times, n_risk, n_event, n_total, survival, lower, upper)]
+    return {
+        'n': int(times.size),
+        'events': int(events.sum()),
+        'median_survival': float(unique_times[reached[0]]) if reached.size else None,
+        'curve': curve
+    }
+
+
+def _median_split(values):
+    # 高表达组：表达值大于该基因的中位数
+    thresholds = np.median(values, axis=1)
+    return thresholds, values > thresholds[:, None]
+
+
+def _optimal_split(values, design, n_risk, n_death, min_fraction, max_cutpoints):
+    """最大选择 log-rank 统计量：在两组样本比例不低于 min_fraction 的候选切点中选卡方最大的一个
+
+    切点逐个候选、所有基因同时计算；返回的 p 值未对切点选择做校正，偏乐观。
+    """
+    n = values.shape[1]
+    lo = max(int(np.ceil(n * min_fraction)), 1)
+    hi = min(int(np.floor(n * (1 - min_fraction))), n - 1)
+    if hi < lo:
+        return _median_split(values)
+    positions = np.unique(np.linspace(lo, hi, min(max_cutpoints, hi - lo + 1)).round().astype(int))
+    sorted_values = np.sort(values, axis=1)
+    best_chisq = np.full(values.shape[0], -np.inf)
+    best_threshold = np.median(values, axis=1)
+    for k in positions:
+        # 低表达组至少包含排序后的前 k 个样本；与阈值相同的样本都归入低表达组
+        thresholds = sorted_values[:, k - 1]
+        high = values > thresholds[:, None]
+        n_high = high.sum(axis=1)
+        chisq = logrank_matrix(high, design, n_risk, n_death)[2]
+        valid = (n_high >= lo) & (n - n_high >= lo) & np.isfinite(chisq)
+        better = valid & (chisq > best_chisq)
+        best_chisq[better] = chisq[better]
+        best_threshold[better] = thresholds[better]
+    return best_threshold, values > best_threshold[:, None]
+
+
+def scan_genes(values, times, events, cutpoint='median', min_fraction=0.1, max_cutpoints=50):
+    """对 基因×样本 表达矩阵逐基因按高/低表达分组做 log-rank 检验（分块向量化）
+
+    cutpoint: 'median'、'optimal'（最大选择 log-rank）或 (0, 1) 内的分位数。
+    返回每个基因的 (切点, 高表达组样本数, 风险比, 卡方, p 值) 数组。
+    """
+    design, n_risk, n_death = event_design(times, events)
+    n_genes = values.shape[0]
+    out = {name: np.full(n_genes, np.nan) for name in ('cutpoint', 'n_high', 'hazard_ratio', 'chisq', 'pvalue')}
+    for start in range(0, n_genes, ROW_BLOCK):
+        block = values[start:start + ROW_BLOCK]
+        if cutpoint == 'median':
+            thresholds, high = _median_split(block)
+        elif cutpoint == 'optimal':
+            thresholds, high = _optimal_split(block, design, n_risk, n_death, min_fraction, max_cutpoints)
+        else:
+            thresholds = np.quantile(block, float(cutpoint), axis=1)
+            high = block > thresholds[:, None]
+        _, _, chisq, pvalue, hazard_ratio = logrank_matrix(high, design, n_risk, n_death)
+        n_high = high.sum(axis=1)
+        # 某一组为空时检验无意义
+        degenerate = (n_high == 0) | (n_high == block.shape[1])
+        end = start + block.shape[0]
+        out['cutpoint'][start:end] = thresholds
+        out['n_high'][start:end] = n_high
+        out['hazard_ratio'][start:end] = np.where(degenerate, np.nan, hazard_ratio)
+        out['chisq'][start:end] = np.where(degenerate, np.nan, chisq)
+        out['pvalue'][start:end] = np.where(degenerate, np.nan, pvalue)
+    return out
+
+
+def _json_value(v):
+    return None if v is None or v != v or v in (np.inf, -np.inf) else float(v)
+
+
+def _check_cutpoint(cutpoint):
+    if cutpoint in CUTPOINTS:
+        return cutpoint
+    try:
+        q = float(cutpoint)
+    except (TypeError, ValueError):
+        raise ValueError(f"Unknown survival cutpoint: {cutpoint}") from None
+    if not 0 < q < 1:
+        raise ValueError('Survival cutpoint quantile must be between 0 and 1')
+    return q
+
+
+def _gene_curves(values, times, events, threshold, sample_ids):
+    high = values > threshold
+    groups = {}
+    for name, mask in (('high', high), ('low', ~high)):
+        groups[name] = kaplan_meier(times[mask], events[mask])
+    survival_data = [{
+        'sample_id': s, 'time': float(t), 'status': int(e), 'expression': float(v), 'group': 'High' if h else 'Low'
+    } for s, t, e, v, h in zip(sample_ids, times.tolist(), events.tolist(), values.tolist(), high.tolist())]
+    return groups, survival_data
+
+
+def run_survival(matrix, clinical, genes=None, all_genes=False, cutpoint='median', group_by=None,
+                 log_transform=True, min_fraction=0.1, max_cutpoints=50, n_curves=10, parameters=None):
+    """生存分析
+
+    clinical: {sample_id: (survival_time, survival_status, 分组值)}；matrix 可为 None（只按临床分组）。
+    - 指定 genes（或 all_genes）时按每个基因的表达高/低分组做 log-rank，结果按 p 值排序，
+      前 n_curves 个基因给出 KM 曲线；只有一个基因时输出与 survival_analysis.R 相同的字段
+    - 否则按 group_by 的临床分组（未指定时为全部样本）给出 KM 曲线与 k 组 log-rank 检验
+    """
+    sample_ids, times, events, labels = [], [], [], []
+    for sample_id, (time, status, label) in clinical.items():
+        event = parse_event(status)
+        if time is None or event is None:
+            continue
+        if matrix is not None and (genes or all_genes) and not matrix.sample_indices([sample_id]):
+            continue
+        sample_ids.append(sample_id)
+        times.append(float(time))
+        events.append(event)
+        labels.append(label)
+    if len(sample_ids) < 4:
+        raise ValueError('At least 4 samples with survival time and status are required')
+    times = np.asarray(times)
+    events = np.asarray(events, dtype=np.int64)
+    if not events.any():
+        raise ValueError('No events (deaths) among samples with survival data')
+
+    results = {
+        'n_samples': len(sample_ids),
+        'n_events': int(events.sum()),
+        'engine': 'python',
+        'parameters': parameters or {}
+    }
+
+    if not genes and not all_genes:
+        group_labels = [str(label) if label is not None else 'Unknown' for label in labels] if group_by else ['All'] * len(sample_ids)
+        results['groups'] = {
+            g: kaplan_meier(times[[i for i, l in enumerate(group_labels) if l == g]],
+                            events[[i for i, l in enumerate(group_labels) if l == g]])
+            for g in sorted(set(group_labels))
+        }
+        chisq, df, pvalue = logrank_groups(times, events, group_labels)
+        results.update({'group_by': group_by, 'logrank_chisq': chisq, 'logrank_df': df, 'logrank_pvalue': pvalue})
+        return {'status': 'completed', 'message': 'Survival analysis completed successfully', 'results': results}
+
+    cutpoint = _check_cutpoint(cutpoint)
+    columns = matrix.sample_indices(sample_ids)
+    if all_genes:
+        rows = np.arange(matrix.shape[0])
+    else:
+        rows = [matrix.gene_index(g) for g in genes]
+        missing = [g for g, r in zip(genes, rows) if r is None]
+        if len(missing) == len(genes):
+            raise ValueError(f"Genes not found in dataset: {', '.join(missing[:10])}")
+        results['missing_genes'] = missing
+        rows = np.asarray([r for r in rows if r is not None])
+
+    values = np.empty((len(rows), len(columns)), dtype=np.float64)
+    for start in range(0, len(rows), ROW_BLOCK):
+        chunk = rows[start:start + ROW_BLOCK]
+        values[start:start + len(chunk)] = prepare_rows(matrix.values[chunk][:, columns], log_transform)
+    scan = scan_genes(values, times, events, cutpoint, min_fraction, max_cutpoints)
+    padj = bh_adjust(scan['pvalue'])
+
+    pvalue = scan['pvalue']
+    order = np.argsort(np.where(np.isnan(pvalue), np.inf, pvalue), kind='stable')
+    symbols = [matrix.gene_symbols[r] or matrix.gene_ids[r] for r in rows.tolist()]
+    gene_results = []
+    for i in order.tolist():
+        n_high = int(scan['n_high'][i]) if scan['n_high'][i] == scan['n_high'][i] else 0
+        gene_results.append({
+            'gene': symbols[i],
+            'gene_id': matrix.gene_ids[rows[i]],
+            'cutpoint': _json_value(scan['cutpoint'][i]),
+            'n_high': n_high,
+            'n_low': len(sample_ids) - n_high,
+            'hazard_ratio': _json_value(scan['hazard_ratio'][i]),
+            'chisq': _json_value(scan['chisq'][i]),
+            'pvalue': _json_value(pvalue[i]),
+            'padj': _json_value(padj[i])
+        })
+
+    curves = []
+    for i in order[:max(int(n_curves), 1)].tolist():
+        if np.isnan(scan['cutpoint'][i]):
+            continue
+        groups, survival_data = _gene_curves(values[i], times, events, scan['cutpoint'][i], sample_ids)
+        curves.append({'gene': symbols[i], 'cutpoint': float(scan['cutpoint'][i]), 'groups': groups,
+                       'survival_data': survival_data})
+
+    results.update({
+        'cutpoint_method': cutpoint,
+        'total_genes': len(gene_results),
+        'significant_count': int(np.nansum(padj < 0.05)),
+        'gene_results': gene_results,
+        'curves': curves
+    })
+    if len(gene_results) == 1 and curves:
+        # 单基因：与 survival_analysis.R 的输出字段一致
+        top = curves[0]
+        results.update({
+            'survival_data': top['survival_data'],
+            'high_group_median': top['groups']['high']['median_survival'],
+            'low_group_median': top['groups']['low']['median_survival'],
+            'logrank_pvalue': gene_results[0]['pvalue'],
+            'hazard_ratio': gene_results[0]['hazard_ratio']
+        })
+    return {'status': 'completed', 'message': 'Survival analysis completed successfully', 'results': results}
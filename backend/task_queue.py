@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# 本地分析任务队列：请求线程只写入 AnalysisTask，由工作线程池异步执行
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+
+
+class TaskQueue:
+    """基于线程池的 AnalysisTask 执行队列
+
+    分析本身在 R 子进程中运行，工作线程只负责等待和回写结果，因此线程池即可并行。
+    任务状态保存在数据库中：pending -> running -> completed/failed。
+    认领任务使用条件更新（status='pending'），多个 gunicorn 进程共享同一数据库时
+    同一任务也只会被执行一次。
+    """
+
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self._app = None
+        self._db = None
+        self._model = None
+        self._handler = None
+        self._executor = None
+        self._progress = {}
+        self._running = set()
+        self._lock = threading.Lock()
+        self._recovered = False
+
+    def init_app(self, app, db, model, handler, store_result=None):
+        """绑定 Flask 应用、数据库、任务模型与执行函数
+
+        handler(task, report_progress) 返回可 JSON 序列化的结果；
+        report_progress(percent) 用于上报 0-100 的进度。
+        store_result(task, result) 负责把结果写入任务，默认整体 JSON 序列化到 results 列。
+        """
+        self._app = app
+        self._db = db
+        self._model = model
+        self._handler = handler
+        self._store_result = store_result or (lambda task, result: setattr(task, 'results', json.dumps(result)))
+        self.max_workers = app.config.get('ANALYSIS_WORKERS', self.max_workers)
+        self.stale_after = app.config.get('TASK_STALE_SECONDS', 3600)
+        # 每个进程（gunicorn worker、flask run、测试客户端）处理第一个请求前恢复上次退出时遗留的任务
+        if app.config.get('TASK_RECOVERY', True):
+            app.before_request(self._recover_once)
+
+    def _recover_once(self):
+        if not self._recovered:
+            self.recover()
+
+    def _get_executor(self):
+        # 延迟创建线程池，避免 gunicorn fork 之前启动的线程在子进程中丢失
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max(1, self.max_workers),
+                    thread_name_prefix='neta-task'
+                )
+            return self._executor
+
+    def submit(self, task_id):
+        """将已提交到数据库的任务放入工作线程池"""
+        with self._lock:
+            self._progress[task_id] = 0
+        self._get_executor().submit(self._run, task_id)
+
+    def recover(self):
+        """把开始执行已超过 stale_after 秒仍为 running、且不在本进程执行的任务（进程崩溃遗留）改回 pending，
+        再重新排队全部 pending 任务，返回排队数量
+
+        按 started_at 而非 created_at 判断：排队很久才被其他进程认领的任务仍在正常执行，不能重复运行。
+        started_at 为空的 running 任务来自迁移之前，视为遗留。
+        """
+        with self._lock:
+            self._recovered = True
+        with self._app.app_context():
+            model = self._model
+            with self._lock:
+                running = set(self._running)
+            cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+            query = self._db.session.query(model).filter(
+                model.status == 'running', or_(model.started_at.is_(None), model.started_at < cutoff)
+            )
+            if running:
+                query = query.filter(model.id.notin_(running))
+            query.update({'status': 'pending'}, synchronize_session=False)
+            self._db.session.commit()
+        return self.requeue_pending()
+
+    def requeue_pending(self):
+        """重新排队数据库中仍为 pending 的任务（例如进程重启后），返回数量"""
+        with self._app.app_context():
+            ids = [r[0] for r in self._db.session.query(self._model.id).filter(
+                self._model.status == 'pending'
+            ).order_by(self._model.id)]
+        with self._lock:
+            # 已在本进程排队或执行的任务不重复提交
+            ids = [task_id for task_id in ids if task_id not in self._progress]
+        for task_id in ids:
+            self.submit(task_id)
+        return len(ids)
+
+    def progress(self, task_id, status=None):
+        """返回任务进度（0-100）；本进程未执行该任务时按状态推断"""
+        with self._lock:
+            value = self._progress.get(task_id)
+        if value is not None:
+            return value
+        if status in ('completed', 'failed'):
+            return 100
+        if status == 'pending':
+            return 0
+        return None
+
+    def counts(self):
+        """本进程中排队等待与正在执行的任务数"""
+        with self._lock:
+            running = len(self._running)
+            return {'queued': len(self._progress) - running, 'running': running}
+
+    def _set_progress(self, task_id, value):
+        with self._lock:
+            if task_id in self._progress:
+                self._progress[task_id] = max(0, min(100, int(value)))
+
+    def _claim(self, task_id):
+        model = self._model
+        claimed = self._db.session.query(model).filter(
+            model.id == task_id, model.status == 'pending'
+        ).update({'status': 'running', 'started_at': datetime.utcnow()}, synchronize_session=False)
+        self._db.session.commit()
+        return claimed == 1
+
+    def _run(self, task_id):
+        try:
+            with self._app.app_context():
+                if not self._claim(task_id):
+                    return
+                with self._lock:
+                    self._running.add(task_id)
+                task = self._db.session.get(self._model, task_id)
+                self._set_progress(task_id, 5)
+                try:
+                    result = self._handler(task, lambda value: self._set_progress(task_id, value))
+                    task.status = 'completed'
+                    self._store_result(task, result)
+                except Exception as e:
+                    self._db.session.rollback()
+                    task = self._db.session.get(self._model, task_id)
+                    task.status = 'failed'
+                    task.results = json.dumps({'error': str(e)})
+                task.completed_at = datetime.utcnow()
+                self._db.session.commit()
+        finally:
+            with self._lock:
+                self._progress.pop(task_id, None)
+                self._running.discard(task_id)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
@@ -0,0 +1,88 @@
+# 测试环境：导入 app 之前把数据库与各类文件存储指向临时目录，并构建一个已迁移的小型数据库
+
+import os
+import random
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+TMP_DIR = Path(tempfile.mkdtemp(prefix='neta-tests-'))
+os.environ.update({
+    'NETA_DATABASE_URL': f"sqlite:///{TMP_DIR / 'neta.sqlite'}",
+    'NETA_EXPRESSION_STORE': str(TMP_DIR / 'expression_store'),
+    'NETA_GENE_MAJOR_STORE': str(TMP_DIR / 'gene_major'),
+    'NETA_COEXPRESSION_DIR': str(TMP_DIR / 'coexpression'),
+    'NETA_RESULT_STORE': str(TMP_DIR / 'task_results'),
+    'NETA_PLOT_CACHE': str(TMP_DIR / 'plots'),
+    'NETA_GENE_SET_DIR': str(TMP_DIR / 'gene_sets'),
+    'NETA_TASK_RECOVERY': '0',
+    'NETA_R_WORKERS': '0',
+})
+
+TISSUES = [('Pancreas', 'PNET'), ('Lung', 'SCLC'), ('Prostate', 'NEPC')]
+
+
+def seed(neta, n_datasets=12, n_expression=3, n_samples=20, n_genes=100, n_tasks=30):
+    """写入数据集、样本、基因、表达记录与分析任务；前 n_expression 个数据集有表达数据"""
+    rng = random.Random(0)
+    db = neta.db
+    for d in range(1, n_datasets + 1):
+        tissue, tumor = TISSUES[d % len(TISSUES)]
+        db.session.add(neta.Dataset(
+            id=d, geo_id=f'GSE{d:05d}', title=f'{tumor} neuroendocrine tumor study {d}', description='transcriptome',
+            tissue_type=tissue, tumor_type=tumor, platform='RNA-seq', n_samples=n_samples, n_genes=n_genes,
+            publication_year=2010 + d % 12, data_source='GEO'
+        ))
+        for s in range(n_samples):
+            db.session.add(neta.Sample(
+                dataset_id=d, sample_id=f'GSM{d:03d}{s:03d}', tissue_type=tissue, tumor_type=tumor,
+                survival_status=rng.choice(['Dead', 'Alive']), survival_time=rng.randint(5, 100)
+            ))
+    for g in range(n_genes):
+        db.session.add(neta.Gene(gene_id=f'ENSG{g:05d}', gene_symbol=f'GENE{g}', gene_name=f'gene number {g}',
+                                 entrez_id=str(1000 + g), ensembl_id=f'ENSG{g:05d}'))
+    rows = []
+    for d in range(1, n_expression + 1):
+        for g in range(n_genes):
+            for s in range(n_samples):
+                value = rng.lognormvariate(3, 1)
+                rows.append(dict(dataset_id=d, sample_id=f'GSM{d:03d}{s:03d}', gene_id=f'ENSG{g:05d}',
+                                 gene_symbol=f'GENE{g}', expression_value=value, log2_expression=value / 10,
+                                 normalized_value=value, percentile_rank=50, is_expressed=value > 10))
+    db.session.execute(neta.GeneExpression.__table__.insert(), rows)
+    started = datetime(2024, 1, 1)
+    for t in range(n_tasks):
+        completed = t % 4 != 0
+        db.session.add(neta.AnalysisTask(
+            task_type=rng.choice(['pca', 'differential_expression']), dataset_id=1 + t % n_expression,
+            parameters=neta.canonical_json({'dataset_id': 1 + t % n_expression, 'run': t}),
+            status='completed' if completed else 'failed', results='{"status": "success", "results": {}}',
+            created_at=started + timedelta(hours=t), completed_at=started + timedelta(hours=t, minutes=5)
+        ))
+    db.session.commit()
+    neta.refresh_dataset_summary()
+    db.session.commit()
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+@pytest.fixture(scope='session')
+def neta():
+    import app as neta
+    with neta.app.app_context():
+        # 先迁移再导入数据，与部署顺序一致：迁移时的 ANALYZE 面对空表，查询规划按大表假设选择索引
+        neta.upgrade_schema()
+        seed(neta)
+    yield neta
+    neta.task_queue.shutdown()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
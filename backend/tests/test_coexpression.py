@@ -0,0 +1,78 @@
+# 共表达：标准化、分块 top-k 近邻与相关系数 p 值和完整相关矩阵一致，离线索引的查找与重建检测
+
+import json
+
+import numpy as np
+import pytest
+from scipy import stats
+
+import coexpression
+from expression_store import ExpressionMatrix, prepare_rows
+
+
+def test_standardize_matches_corrcoef(rng):
+    values = rng.lognormal(2, 1, (60, 25))
+    z = coexpression.standardize(values, 'pearson')
+    np.testing.assert_allclose(z @ z.T, np.corrcoef(prepare_rows(values)), atol=1e-5)
+    z = coexpression.standardize(values, 'spearman')
+    np.testing.assert_allclose(z @ z.T, stats.spearmanr(prepare_rows(values), axis=1).statistic, atol=1e-5)
+
+
+def test_top_k_neighbors_match_full_correlation(rng):
+    values = rng.lognormal(2, 1, (300, 30))
+    z = coexpression.standardize(values, 'pearson')
+    pos_idx, pos_r, neg_idx, neg_r = coexpression.top_k_neighbors(z, k=10, workers=2, block=64)
+    r = np.corrcoef(prepare_rows(values))
+    np.fill_diagonal(r, np.nan)
+    for g in range(300):
+        row = np.where(np.isnan(r[g]), -np.inf, r[g])
+        np.testing.assert_allclose(pos_r[g], np.sort(row)[::-1][:10], atol=1e-5)
+        np.testing.assert_allclose(r[g, pos_idx[g]], pos_r[g], atol=1e-5)
+        row = np.where(np.isnan(r[g]), np.inf, r[g])
+        np.testing.assert_allclose(neg_r[g], np.sort(row)[:10], atol=1e-5)
+        assert g not in pos_idx[g] and g not in neg_idx[g]
+
+
+def test_correlation_pvalues_match_pearsonr(rng):
+    x = rng.normal(size=(12, 40))
+    for i in range(1, 12):
+        expected = stats.pearsonr(x[0], x[i])
+        assert coexpression.correlation_pvalues(expected.statistic, 40) == pytest.approx(expected.pvalue, rel=1e-8)
+
+
+def _matrix(values, symbols):
+    gene_ids = [f'PROBE{i}' for i in range(len(symbols))]
+    return ExpressionMatrix(values, gene_ids, symbols, [f'S{j}' for j in range(values.shape[1])])
+
+
+def test_index_lookup_matches_symbol_rows_and_detects_rebuild(tmp_path, rng):
+    values = rng.lognormal(2, 1, (80, 20)).astype(np.float32)
+    symbols = [f'SYM{i // 2}' for i in range(80)]  # 每个符号两个探针
+    matrix = _matrix(values, symbols)
+    index = coexpression.CoexpressionIndex(tmp_path)
+    assert index.lookup(1, 'SYM0') is None
+    index.build(1, matrix, k=5)
+
+    expected = coexpression.symbol_rows(matrix)
+    for gene in ('SYM0', 'sym7', 'PROBE3', 'SYM39'):
+        loaded, row = index.lookup(1, gene)
+        assert row == expected[gene.upper()]
+    assert index.lookup(1, 'MISSING')[1] is None
+    z = coexpression.standardize(values, 'pearson')
+    np.testing.assert_allclose(loaded['pos_r'][row], coexpression.top_k_neighbors(z, k=5)[1][row], atol=1e-6)
+
+    # 重建后（目录被替换）返回新索引而不是缓存的旧索引
+    index.build(1, _matrix(values[:40], symbols[:40]), k=5)
+    loaded, row = index.lookup(1, 'SYM0')
+    assert loaded['meta']['n_genes'] == 40 and len(loaded['gene_ids']) == 40
+
+
+def test_index_ignores_older_format(tmp_path, rng):
+    values = rng.lognormal(2, 1, (30, 10)).astype(np.float32)
+    index = coexpression.CoexpressionIndex(tmp_path)
+    index.build(3, _matrix(values, [f'SYM{i}' for i in range(30)]), k=3)
+    meta_file = tmp_path / '3' / 'meta.json'
+    meta = json.loads(meta_file.read_text())
+    meta['format'] = coexpression.INDEX_FORMAT - 1
+    meta_file.write_text(json.dumps(meta))
+    assert coexpression.CoexpressionIndex(tmp_path).lookup(3, 'SYM1') is None
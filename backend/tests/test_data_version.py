@@ -0,0 +1,18 @@
+# 数据版本递增后列式矩阵在事务提交后删除；回滚时保留
+
+def test_expression_store_removed_only_after_commit(neta):
+    with neta.app.app_context():
+        neta.build_expression_store(2)
+        assert neta.expression_store.has_dataset(2)
+        version = neta.get_data_version(2)
+
+        neta.bump_data_version(2)
+        assert neta.expression_store.has_dataset(2)
+        neta.db.session.rollback()
+        assert neta.get_data_version(2) == version
+        assert neta.expression_store.has_dataset(2)
+
+        neta.bump_data_version(2)
+        neta.db.session.commit()
+        assert neta.get_data_version(2) == version + 1
+        assert not neta.expression_store.has_dataset(2)
@@ -0,0 +1,55 @@
+# 富集分析：超几何上尾概率、ORA 结果与 Fisher 精确检验一致，ES 与逐基因累加一致
+
+import numpy as np
+import pytest
+from scipy import stats
+
+import enrichment_engine
+
+
+def test_hypergeom_sf_matches_scipy():
+    total, draws = 20000, 300
+    n = np.array([10, 15, 50, 120, 500, 500, 2000, 5, 300, 40])
+    k = np.array([0, 1, 3, 2, 8, 40, 30, 5, 1, 41])  # 含下尾分支、上尾分支与 k 超出可能范围的情况
+    np.testing.assert_allclose(enrichment_engine.hypergeom_sf(k, total, n, draws),
+                               stats.hypergeom.sf(k - 1, total, n, draws), rtol=1e-8, atol=1e-300)
+
+
+def test_hypergeom_sf_many_sets(rng):
+    total, draws = 15000, 800
+    n = rng.integers(10, 500, 2000)
+    k = np.minimum(rng.integers(0, 60, 2000), n)
+    np.testing.assert_allclose(enrichment_engine.hypergeom_sf(k, total, n, draws),
+                               stats.hypergeom.sf(k - 1, total, n, draws), rtol=1e-7, atol=1e-300)
+
+
+def test_run_ora_matches_fisher_exact(tmp_path, rng):
+    universe = [(f'ENSG{i:05d}', f'GENE{i}', str(1000 + i), None) for i in range(400)]
+    sets = {f'SET{s}': rng.choice(400, rng.integers(10, 60), replace=False) for s in range(20)}
+    (tmp_path / 'test.gmt').write_text(''.join(
+        f'{name}\tdesc\t' + '\t'.join(f'GENE{g}' for g in genes) + '\n' for name, genes in sets.items()
+    ))
+    library = enrichment_engine.GeneSetLibrary(tmp_path)
+    index = library.build(universe)
+    query = rng.choice(400, 40, replace=False)
+    result = enrichment_engine.run_ora(index, [f'GENE{g}' for g in query], min_size=1, max_results=0)['results']
+    assert result['total_gene_sets'] == 20 and result['n_background_genes'] == 400
+    for row in result['enrichment_results']:
+        members = set(sets[row['gene_set']].tolist())
+        overlap = len(members & set(query.tolist()))
+        table = [[overlap, 40 - overlap], [len(members) - overlap, 400 - 40 - len(members) + overlap]]
+        assert row['overlap'] == overlap
+        assert row['pvalue'] == pytest.approx(stats.fisher_exact(table, alternative='greater').pvalue, rel=1e-8)
+
+
+def test_enrichment_scores_match_running_sum(rng):
+    n_genes = 200
+    weights = np.sort(rng.uniform(0, 3, n_genes))[::-1]
+    hit_ranks = np.sort(np.stack([rng.choice(n_genes, 15, replace=False) for _ in range(30)]), axis=1)
+    es, _ = enrichment_engine.enrichment_scores(hit_ranks, weights, n_genes)
+    for b in range(30):
+        hit = np.zeros(n_genes, dtype=bool)
+        hit[hit_ranks[b]] = True
+        running = np.cumsum(np.where(hit, weights / weights[hit].sum(), -1.0 / (n_genes - 15)))
+        expected = running.max() if running.max() >= -running.min() else running.min()
+        assert es[b] == pytest.approx(expected, rel=1e-12)
@@ -0,0 +1,50 @@
+# scripts/import_geo_series.py 在 db.create_all() 建出的表结构上导入与 --replace 重新导入
+
+import sqlite3
+import sys
+from pathlib import Path
+
+from sqlalchemy import create_engine
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'scripts'))
+import import_geo_series  # noqa: E402
+
+SAMPLES = ['GSM0001', 'GSM0002', 'GSM0003']
+
+
+def write_series(path, values):
+    lines = [
+        '!Series_title\t"Test series"',
+        '!Series_geo_accession\t"GSE99999"',
+        '!Sample_title\t' + '\t'.join(f'"{s}"' for s in SAMPLES),
+        '!Sample_characteristics_ch1\t"gender: female"\t"gender: male"\t"gender: female"',
+        '!series_matrix_table_begin',
+        '"ID_REF"\t' + '\t'.join(f'"{s}"' for s in SAMPLES),
+    ]
+    lines += [f'"PROBE{i}"\t' + '\t'.join(str(v) for v in row) for i, row in enumerate(values)]
+    lines.append('!series_matrix_table_end')
+    path.write_text('\n'.join(lines) + '\n')
+    return path
+
+
+def test_replace_on_orm_schema(neta, tmp_path):
+    db_path = tmp_path / 'orm.sqlite'
+    engine = create_engine(f'sqlite:///{db_path}')
+    neta.db.metadata.create_all(engine)
+    engine.dispose()
+
+    conn = sqlite3.connect(db_path)
+    store = tmp_path / 'expression_store'
+    (store / '1').mkdir(parents=True)
+    importer = import_geo_series.GeoImporter(conn, expression_store=store)
+    first = importer.import_series(write_series(tmp_path / 'a.txt', [[5, 6, 7], [8, 9, 10]]))
+    assert first['expression_rows'] == 6
+
+    second = importer.import_series(write_series(tmp_path / 'b.txt', [[1, 2, 3], [4, 5, 6], [7, 8, 9]]), replace=True)
+    assert second['dataset_id'] == first['dataset_id']
+    assert second['expression_rows'] == 9
+    assert conn.execute('SELECT n_samples, n_genes FROM datasets').fetchall() == [(3, 3)]
+    assert conn.execute('SELECT COUNT(*) FROM gene_expression').fetchone()[0] == 9
+    assert conn.execute('SELECT version FROM data_version WHERE dataset_id = ?', (first['dataset_id'],)).fetchone()[0] == 2
+    assert not (store / '1').exists()
+    conn.close()
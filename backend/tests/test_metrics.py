@@ -0,0 +1,61 @@
+# 多进程指标：gunicorn 各 worker 的计数器与直方图经共享目录合并导出
+
+import multiprocessing
+
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def _registry(directory):
+    registry = Registry(directory, flush_interval=60)
+    requests = registry.register(Counter('requests_total', 'requests', ('route',)))
+    latency = registry.register(Histogram('latency_seconds', 'latency', buckets=(0.1, 1)))
+    busy = registry.register(Gauge('busy', 'busy workers'))
+    database = registry.register(Gauge('db_rows', 'rows', collect=lambda: {(): 7}, multiprocess='local'))
+    return registry, requests, latency, busy, database
+
+
+def _worker(registry, requests, latency, busy, done):
+    registry.ensure_process()
+    requests.inc(2, route='/a')
+    latency.observe(0.5)
+    busy.inc()
+    registry.flush()
+    done.set()
+
+
+def _sample(text, name):
+    return [line.split()[-1] for line in text.splitlines() if line.startswith(name + ' ') or line.startswith(name + '{')]
+
+
+def test_render_merges_worker_processes(tmp_path):
+    registry, requests, latency, busy, _ = _registry(tmp_path)
+    registry.ensure_process()
+    requests.inc(route='/a')
+    requests.inc(route='/b')
+    latency.observe(0.05)
+    busy.inc()
+
+    # fork 出的 worker 继承了父进程的数值，启动时必须清空，否则会被重复计入
+    context = multiprocessing.get_context('fork')
+    done = context.Event()
+    worker = context.Process(target=_worker, args=(registry, requests, latency, busy, done))
+    worker.start()
+    worker.join()
+    assert done.is_set() and worker.exitcode == 0
+
+    text = registry.render()
+    assert 'requests_total{route="/a"} 3' in text
+    assert 'requests_total{route="/b"} 1' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert _sample(text, 'latency_seconds_count') == ['2']
+    # 已退出 worker 的 gauge 不再计入；读取共享数据的 gauge 只导出一次
+    assert _sample(text, 'busy') == ['1']
+    assert _sample(text, 'db_rows') == ['7']
+
+
+def test_single_process_without_directory():
+    registry, requests, *_ = _registry(None)
+    requests.inc(route='/a')
+    assert 'requests_total{route="/a"} 1' in registry.render()
+    assert registry.directory is None
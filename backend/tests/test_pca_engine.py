@@ -0,0 +1,82 @@
+# 进程内 PCA：得分、解释方差与载荷和中心化/标准化矩阵的精确 SVD 一致
+
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import pca_engine
+from expression_store import ExpressionMatrix, prepare_rows
+
+
+def _matrix(values):
+    n_genes, n_samples = values.shape
+    return ExpressionMatrix(values, [f'G{i}' for i in range(n_genes)], [f'SYM{i}' for i in range(n_genes)],
+                            [f'S{j}' for j in range(n_samples)])
+
+
+def _reference(x, n_components):
+    u, s, vt = np.linalg.svd(x, full_matrices=False)
+    ratio = s ** 2 / (x ** 2).sum()
+    return (u * s)[:, :n_components], vt[:n_components], ratio[:n_components]
+
+
+def _scores(result, n_components):
+    return np.array([[row[f'PC{k + 1}'] for k in range(n_components)] for row in result['pca_data']])
+
+
+@pytest.mark.parametrize('scale', [False, True])
+def test_run_pca_matches_exact_svd(rng, scale):
+    values = rng.lognormal(3, 1, (200, 12)).astype(np.float32)
+    values[5] = 7.0  # 常数基因在标准化时被剔除
+    result = pca_engine.run_pca(_matrix(values), n_components=3, top_genes=0, scale=scale, method='full')['results']
+    x = prepare_rows(values).T.astype(np.float64)
+    x -= x.mean(axis=0)
+    if scale:
+        std = x.std(axis=0, ddof=1)
+        x = x[:, std > 0] / std[std > 0]
+    scores, vt, ratio = _reference(x, 3)
+    assert result['n_genes'] == x.shape[1]
+    # 奇异向量只确定到符号
+    signs = np.sign((_scores(result, 3) * scores).sum(axis=0))
+    np.testing.assert_allclose(_scores(result, 3) * signs, scores, rtol=1e-6, atol=1e-6)
+    np.testing.assert_allclose(result['explained_variance_ratio'], ratio, rtol=1e-6)
+    loading = result['loadings'][0]
+    j = int(loading['gene_id'][1:])
+    column = j - (scale and j > 5)
+    assert loading['PC1'] * signs[0] == pytest.approx(vt[0, column], rel=1e-5)
+
+
+def test_randomized_svd_matches_full(rng):
+    # 两个强成分加噪声，保证前两个奇异值与其余分离
+    signal = rng.normal(0, 3, (3000, 2)) @ rng.normal(0, 1, (2, 40))
+    values = np.exp2(5 + signal + rng.normal(0, 0.3, (3000, 40))).astype(np.float32)
+    full = pca_engine.run_pca(_matrix(values), n_components=2, top_genes=0, method='full')['results']
+    randomized = pca_engine.run_pca(_matrix(values), n_components=2, top_genes=0, method='randomized')['results']
+    a, b = _scores(full, 2), _scores(randomized, 2)
+    np.testing.assert_allclose(np.abs(a), np.abs(b), rtol=1e-3, atol=1e-3)
+    np.testing.assert_allclose(full['explained_variance_ratio'], randomized['explained_variance_ratio'], rtol=1e-4)
+
+
+def test_top_genes_selects_highest_variance(rng):
+    values = rng.lognormal(3, 1, (500, 10)).astype(np.float32)
+    variances = prepare_rows(values).var(axis=1, ddof=1)
+    np.testing.assert_allclose(pca_engine.gene_variances(values), variances, rtol=1e-6)
+    result = pca_engine.run_pca(_matrix(values), top_genes=50, n_loadings=500)['results']
+    assert result['n_genes'] == 50
+    expected = {f'G{i}' for i in np.argsort(variances)[-50:]}
+    assert {item['gene_id'] for item in result['loadings']} == expected
+
+
+def test_scaling_does_not_copy_the_matrix(rng):
+    values = rng.lognormal(3, 1, (20000, 60)).astype(np.float32)
+    values[::100] = 5.0
+    tracemalloc.start()
+    try:
+        result = pca_engine.run_pca(_matrix(values), top_genes=0, scale=True, method='randomized')['results']
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert result['n_genes'] == 19800
+    # 物化的样本×基因矩阵之外只有分块与随机化 SVD 的小型临时数组
+    assert peak < 2 * 60 * result['n_genes'] * 8
@@ -0,0 +1,56 @@
+# 接口与数据加载查询在大表上都应走索引（与 flask check-query-plans 相同的检查）
+
+import pytest
+from sqlalchemy import create_engine
+
+import query_plans
+
+
+def test_no_full_scans_of_large_tables(neta):
+    with neta.app.app_context():
+        statements = neta.query_plan_probes()
+        neta.db.session.rollback()
+        with neta.db.engine.connect() as connection:
+            results = query_plans.check_statements(connection, statements)
+    assert len(results) > 20
+    scans = [(' '.join(statement.split()), plan) for statement, plan, found in results if found]
+    assert not scans, '\n\n'.join(f'{statement}\n    ' + '\n    '.join(plan) for statement, plan in scans)
+
+
+def test_migrations_are_recorded(neta):
+    import migrations
+    with neta.app.app_context():
+        assert migrations.current_version(neta.db.engine) == migrations.MIGRATIONS[-1][0]
+        assert not migrations.pending_migrations(neta.db.engine)
+
+
+@pytest.fixture
+def connection():
+    engine = create_engine('sqlite://')
+    with engine.connect() as connection:
+        connection.exec_driver_sql('CREATE TABLE analysis_tasks (id INTEGER PRIMARY KEY, status TEXT, results TEXT, created_at DATETIME)')
+        connection.exec_driver_sql('CREATE INDEX ix_analysis_tasks_created_at ON analysis_tasks (created_at)')
+        yield connection
+
+
+@pytest.mark.parametrize('statement, parameters', [
+    # 带过滤条件的 LIMIT 扫描可能读完整张表
+    ('SELECT id FROM analysis_tasks WHERE results LIKE ? LIMIT 20', ('%x%',)),
+    ('SELECT * FROM analysis_tasks AS t WHERE t.status = ? ORDER BY t.id DESC LIMIT 20', ('running',)),
+    # 需要临时排序
+    ('SELECT * FROM analysis_tasks ORDER BY results LIMIT 20', ()),
+    ('SELECT * FROM analysis_tasks', ()),
+])
+def test_unbounded_scans_are_reported(connection, statement, parameters):
+    plan = query_plans.explain(connection, statement, parameters)
+    assert query_plans.full_scans(plan, statement=statement)
+
+
+@pytest.mark.parametrize('statement', [
+    'SELECT * FROM analysis_tasks ORDER BY analysis_tasks.id DESC LIMIT 20',
+    'SELECT * FROM analysis_tasks ORDER BY created_at DESC LIMIT 20',
+])
+def test_unfiltered_ordered_limit_scans_are_allowed(connection, statement):
+    plan = query_plans.explain(connection, statement)
+    assert plan[0].startswith('SCAN analysis_tasks')
+    assert not query_plans.full_scans(plan, statement=statement)
@@ -0,0 +1,36 @@
+# 遗留任务恢复：按开始执行的时间判断 running 任务是否遗留
+
+from datetime import datetime, timedelta
+
+from task_queue import TaskQueue
+
+
+def test_recover_judges_staleness_on_started_at(neta):
+    app, db, model = neta.app, neta.db, neta.AnalysisTask
+    ran = []
+    queue = TaskQueue()
+    queue.init_app(app, db, model, lambda task, report: ran.append(task.id) or {'status': 'success'})
+    queue.stale_after = 60
+    now = datetime.utcnow()
+    with app.app_context():
+        # 排队很久后刚被其他进程认领：仍在执行，不能重置
+        claimed_late = model(task_type='pca', status='running', created_at=now - timedelta(hours=5),
+                             started_at=now - timedelta(seconds=5))
+        # 开始执行后超过 stale_after：进程崩溃遗留
+        abandoned = model(task_type='pca', status='running', created_at=now - timedelta(hours=5),
+                          started_at=now - timedelta(hours=1))
+        db.session.add_all([claimed_late, abandoned])
+        db.session.commit()
+        ids = claimed_late.id, abandoned.id
+    try:
+        assert queue.recover() == 1
+        queue.shutdown()
+        assert ran == [ids[1]]
+        with app.app_context():
+            late, done = (db.session.get(model, i) for i in ids)
+            assert late.status == 'running'
+            assert done.status == 'completed' and done.started_at > now
+    finally:
+        with app.app_context():
+            model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
@@ -15,6 +15,38 @@ async function fetchWithFallback(primaryUrl, fallbackUrl, init) {
   return fetch(fallbackUrl, init);
 }
 
+// 分析接口异步执行：提交后轮询任务状态，完成后返回与原同步接口相同结构的响应
+// （include=tables 让任务接口返回完整结果表，而不是摘要与分页地址）
+async function submitAndWait(url, data, interval = 1000) {
+  const res = await fetch(`${url}?include=tables`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(data)
+  });
+  if (!res.ok) return res;
+  const submitted = await res.json();
+  // 结果缓存命中时提交接口直接返回已完成的任务
+  if (submitted.status === 'completed') {
+    return new Response(JSON.stringify(submitted), {
+      status: 200,
+      headers: { 'Content-Type': 'application/json' }
+    });
+  }
+  const taskId = submitted.task_id;
+  for (;;) {
+    await new Promise((resolve) => setTimeout(resolve, interval));
+    const taskRes = await fetch(`${API_BASE_URL}/tasks/${taskId}?include=tables`);
+    if (!taskRes.ok) return taskRes;
+    const task = await taskRes.json();
+    if (task.status === 'completed' || task.status === 'failed') {
+      return new Response(JSON.stringify(task), {
+        status: task.status === 'completed' ? 200 : 500,
+        headers: { 'Content-Type': 'application/json' }
+      });
+    }
+  }
+}
+
 // API调用函数
 export const api = {
   // 健康检查
@@ -29,8 +61,14 @@ export const api = {
           `${FALLBACK_BASE}/datasets.json`
         ),
   
-  getDatasetDetail: (id) => 
-    fetch(`${API_BASE_URL}/datasets/${id}`),
+  // 静态部署时按需加载单个数据集分片（scripts/export_to_frontend.py 生成）
+  getDatasetDetail: (id) =>
+    IS_GITHUB_PAGES
+      ? fetch(`${FALLBACK_BASE}/datasets/${id}.json`)
+      : fetchWithFallback(
+          `${API_BASE_URL}/datasets/${id}`,
+          `${FALLBACK_BASE}/datasets/${id}.json`
+        ),
   
   // 数据集筛选和搜索
   filterDatasets: (params) => 
@@ -72,25 +110,17 @@ export const api = {
   
   // 分析功能
   runDifferentialExpression: (data) => 
-    fetch(`${API_BASE_URL}/analysis/differential_expression`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify(data)
-    }),
+    submitAndWait(`${API_BASE_URL}/analysis/differential_expression`, data),
   
   runPCAAnalysis: (data) => 
-    fetch(`${API_BASE_URL}/analysis/pca`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify(data)
-    }),
+    submitAndWait(`${API_BASE_URL}/analysis/pca`, data),
   
   runEnrichmentAnalysis: (data) => 
-    fetch(`${API_BASE_URL}/analysis/enrichment`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify(data)
-    }),
+    submitAndWait(`${API_BASE_URL}/analysis/enrichment`, data),
+  
+  // 任务查询
+  getTask: (taskId) => 
+    fetch(`${API_BASE_URL}/tasks/${taskId}`),
   
   // 批量分析
   runBatchAnalysis: (data) => 
@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+# Synthetic-scale benchmark for the backend API and ingestion
+#
+# Generates a NETA database of the requested size with the Dataset/Sample/Gene/GeneExpression
+# schema, drives every route in backend/app.py through the Flask test client (RRunner is stubbed,
+# so analysis routes measure the backend rather than R), and reports p50/p95/p99 latency,
+# throughput and peak RSS as JSON. Save the output and pass it as --baseline to a later run to
+# flag regressions.
+#
+#   python scripts/benchmark_api.py --rows 4M --output data/benchmark/api-4M.json
+#   python scripts/benchmark_api.py --rows 4M --baseline data/benchmark/api-4M.json --fail-on-regression
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import numpy as np
+from werkzeug.exceptions import HTTPException
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'backend'))
+sys.path.insert(0, str(ROOT / 'scripts'))
+
+from benchmark_gene_search import NAME_WORDS, synthetic_genes  # noqa: E402
+from benchmark_geo_import import bench_python, write_series_matrix  # noqa: E402
+from import_geo_series import SCHEMA, GeoImporter, configure_bulk_load, derived_values  # noqa: E402
+
+TISSUES = [('Pancreas', 'PNET'), ('Lung', 'SCLC'), ('Prostate', 'NEPC'), ('Small intestine', 'SI-NET'),
+           ('Skin', 'MCC'), ('Adrenal', 'Pheochromocytoma')]
+TITLE_WORDS = ['neuroendocrine', 'carcinoma', 'tumor', 'transcriptome', 'profiling', 'pancreatic',
+               'small cell', 'metastatic', 'high-grade', 'expression', 'subtypes', 'resistance']
+SUBTYPES = ('NET', 'NEC')
+
+
+def parse_count(value):
+    """'4M' -> 4000000, '250k' -> 250000"""
+    value = value.strip().lower()
+    multiplier = {'k': 10 ** 3, 'm': 10 ** 6, 'g': 10 ** 9}.get(value[-1:], 1)
+    return int(float(value[:-1] if multiplier != 1 else value) * multiplier)
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+# --- synthetic database -------------------------------------------------------------------------
+
+def generate_database(db_path, rows, genes, samples, metadata_datasets, seed=0):
+    """Write a synthetic database holding about `rows` expression values
+
+    Expression datasets have `genes` x `samples` values each; `metadata_datasets` more datasets have
+    samples but no expression rows, like GEO records imported without a series matrix.
+    """
+    rng = np.random.default_rng(seed)
+    pick = random.Random(seed)
+    n_expression = max(1, round(rows / (genes * samples)))
+    n_datasets = n_expression + metadata_datasets
+
+    conn = sqlite3.connect(db_path)
+    conn.isolation_level = None
+    for ddl in SCHEMA:
+        conn.execute(ddl)
+    configure_bulk_load(conn)
+    started = time.perf_counter()
+    conn.execute('BEGIN')
+
+    gene_rows = list(synthetic_genes(genes, seed=seed))
+    conn.executemany("""
+        INSERT INTO genes (id, gene_id, gene_symbol, gene_name, chromosome, gene_type, entrez_id, ensembl_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, gene_rows)
+    gene_ids = [g[1] for g in gene_rows]
+    symbols = [g[2] for g in gene_rows]
+
+    expression_rows = 0
+    for dataset_id in range(1, n_datasets + 1):
+        tissue, tumor = TISSUES[dataset_id % len(TISSUES)]
+        has_expression = dataset_id <= n_expression
+        conn.execute("""
+            INSERT INTO datasets (id, geo_id, title, description, tissue_type, tumor_type, platform, n_samples,
+                                  n_genes, publication_year, data_source, priority, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'GEO', ?, 'active')
+        """, (
+            dataset_id, f'GSE{100000 + dataset_id}',
+            ' '.join(pick.sample(TITLE_WORDS, 4)).capitalize() + f' ({tumor})',
+            ' '.join(pick.choices(TITLE_WORDS + NAME_WORDS, k=30)),
+            tissue, tumor, pick.choice(['GPL570', 'GPL6244', 'GPL20301']), samples,
+            genes if has_expression else None, pick.randint(2005, 2024), pick.randint(1, 3)
+        ))
+        sample_records = [{'sample_id': f'GSM{dataset_id:05d}{s:04d}'} for s in range(samples)]
+        conn.executemany("""
+            INSERT INTO samples (dataset_id, sample_id, sample_name, tissue_type, tumor_type, tumor_subtype,
+                                 grade, age, gender, survival_status, survival_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(dataset_id, r['sample_id'], f'Sample {s}', tissue, tumor, SUBTYPES[s % 2], f'G{1 + s % 3}',
+               pick.randint(30, 85), pick.choice(['male', 'female']), pick.choice(['Alive', 'Dead']),
+               pick.randint(1, 120)) for s, r in enumerate(sample_records)])
+        if not has_expression:
+            continue
+
+        matrix = rng.lognormal(4, 1.5, size=(genes, samples)).astype(np.float32)
+        # 5% of the genes shift between subtypes so differential expression has something to find
+        matrix[: genes // 20, 1::2] *= 4
+        log2, normalized, percentile = derived_values(matrix)
+        expression_rows += conn.executemany("""
+            INSERT INTO gene_expression (dataset_id, sample_id, gene_id, gene_symbol, expression_value,
+                                         log2_expression, normalized_value, percentile_rank, is_expressed)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, GeoImporter._expression_rows(dataset_id, sample_records, gene_ids, symbols, matrix,
+                                          log2, normalized, percentile)).rowcount
+        conn.execute("INSERT OR REPLACE INTO data_version (dataset_id, version, updated_at) "
+                     "VALUES (?, 1, CURRENT_TIMESTAMP)", (dataset_id,))
+
+    conn.execute("INSERT OR REPLACE INTO data_version (dataset_id, version, updated_at) "
+                 "VALUES (0, 1, CURRENT_TIMESTAMP)")
+    conn.execute('COMMIT')
+    loaded = time.perf_counter() - started
+    conn.close()
+    return {
+        'datasets': n_datasets,
+        'expression_datasets': n_expression,
+        'genes': genes,
+        'samples_per_dataset': samples,
+        'expression_rows': expression_rows,
+        'load_s': round(loaded, 3),
+        'rows_per_s': round(expression_rows / loaded) if loaded else None,
+    }
+
+
+def prepare_app(neta, build_store, migrate=True):
+    """Create the app-only tables, apply migrations, build the dataset summary and statistics snapshot"""
+    timings = {}
+    with neta.app.app_context():
+        start = time.perf_counter()
+        if migrate:
+            neta.upgrade_schema()
+        else:
+            neta.db.create_all()
+        timings['migrate_s'] = round(time.perf_counter() - start, 3)
+        start = time.perf_counter()
+        neta.refresh_dataset_summary()
+        neta.rebuild_statistics_snapshot()
+        neta.db.session.commit()
+        timings['summary_s'] = round(time.perf_counter() - start, 3)
+        if build_store:
+            start = time.perf_counter()
+            ids = [r[0] for r in neta.db.session.query(neta.DatasetSummary.dataset_id).filter(
+                neta.DatasetSummary.has_expression.is_(True))]
+            for dataset_id in ids:
+                neta.build_expression_store(dataset_id)
+            timings['expression_store_s'] = round(time.perf_counter() - start, 3)
+            start = time.perf_counter()
+            neta.build_gene_major_store()
+            timings['gene_major_store_s'] = round(time.perf_counter() - start, 3)
+            start = time.perf_counter()
+            for dataset_id in ids:
+                neta.build_coexpression_index(dataset_id)
+            timings['coexpression_index_s'] = round(time.perf_counter() - start, 3)
+    return timings
+
+
+def write_gene_sets(directory, symbols, n_sets, seed=0):
+    """Write a GMT library of `n_sets` random gene sets (sizes 10-500) over the database's gene symbols"""
+    rng = np.random.default_rng(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    symbols = np.asarray(symbols)
+    with open(directory / 'synthetic.gmt', 'w') as f:
+        for i in range(n_sets):
+            size = int(rng.integers(10, min(500, len(symbols)) + 1))
+            genes = symbols[rng.choice(len(symbols), size, replace=False)]
+            f.write(f'SET_{i:05d}\tsynthetic\t' + '\t'.join(genes) + '\n')
+
+
+# --- stubbed R ----------------------------------------------------------------------------------
+
+def stub_runner_class(base):
+    class StubRRunner(base):
+        """Returns canned results shaped like the R scripts' output after a fixed delay"""
+
+        def __init__(self, latency_ms=0, result_rows=1000):
+            self.latency = latency_ms / 1000
+            self.result_rows = result_rows
+            self.calls = 0
+
+        def run_analysis(self, analysis_type, parameters):
+            self.calls += 1
+            if self.latency:
+                time.sleep(self.latency)
+            n = self.result_rows
+            rng = random.Random(canonical_seed(parameters))
+            if analysis_type == 'differential_expression':
+                rows = [{'gene': f'GENE{i}', 'log2FoldChange': rng.gauss(0, 2), 'pvalue': rng.random(),
+                         'padj': rng.random(), 'baseMean': rng.random() * 1000} for i in range(n)]
+                results = {'de_results': rows, 'volcano_data': rows, 'total_genes': n}
+            elif analysis_type == 'pca_analysis':
+                results = {'pca_data': [{'PC1': rng.gauss(0, 1), 'PC2': rng.gauss(0, 1), 'sample_id': f'S{i}'}
+                                        for i in range(min(n, 500))],
+                           'explained_variance_ratio': [0.4, 0.2]}
+            elif analysis_type == 'enrichment_analysis':
+                results = {'enrichment_results': [{'term': f'GO:{i:07d}', 'pvalue': rng.random(),
+                                                   'padj': rng.random(), 'count': rng.randint(3, 200)}
+                                                  for i in range(min(n, 300))]}
+            else:
+                results = {'survival_data': [{'time': rng.randint(1, 120), 'status': rng.randint(0, 1)}
+                                             for _ in range(min(n, 500))]}
+            return {'status': 'success', 'message': 'stub', 'results': results}
+
+    return StubRRunner
+
+
+def canonical_seed(parameters):
+    return zlib.crc32(json.dumps(parameters, sort_keys=True, default=str).encode('utf-8'))
+
+
+# --- request plans ------------------------------------------------------------------------------
+
+class Plan:
+    """One benchmarked request shape; make(i) returns (method, url, json_body)"""
+
+    def __init__(self, name, make, kind='read', poll=False):
+        self.name = name
+        self.make = make
+        self.kind = kind
+        self.poll = poll
+
+
+def build_plans(ctx):
+    expr_ids = ctx['expression_datasets']
+    symbols = ctx['symbols']
+    tissues = [t for t, _ in TISSUES]
+    ds = lambda i: expr_ids[i % len(expr_ids)]  # noqa: E731
+    return [
+        Plan('GET /api/health', lambda i: ('GET', '/api/health', None)),
+        Plan('GET /api/datasets?page', lambda i: ('GET', f'/api/datasets?page={1 + i % 5}&per_page=20', None)),
+        Plan('GET /api/datasets?limit&sort', lambda i: ('GET', '/api/datasets?limit=20&sort=-n_samples', None)),
+        Plan('GET /api/datasets/<id>', lambda i: ('GET', f'/api/datasets/{ds(i)}', None)),
+        Plan('GET /api/datasets/filter', lambda i: ('GET', f'/api/datasets/filter?tissue_type={tissues[i % len(tissues)]}', None)),
+        Plan('GET /api/datasets/filter?limit', lambda i: ('GET', '/api/datasets/filter?limit=50&min_samples=10', None)),
+        Plan('GET /api/datasets/filter?stream', lambda i: ('GET', '/api/datasets/filter?stream=1', None)),
+        Plan('GET /api/datasets/search', lambda i: ('GET', f'/api/datasets/search?q={TITLE_WORDS[i % len(TITLE_WORDS)].split()[0]}', None)),
+        Plan('GET /api/datasets/statistics', lambda i: ('GET', '/api/datasets/statistics', None)),
+        Plan('GET /api/statistics/overview', lambda i: ('GET', '/api/statistics/overview', None)),
+        Plan('GET /api/genes/search', lambda i: ('GET', f'/api/genes/search?q={symbols[i % len(symbols)][:1 + i % 4]}', None)),
+        Plan('GET /api/genes/<symbol>/expression', lambda i: ('GET', f'/api/genes/{symbols[i % len(symbols)]}/expression', None)),
+        Plan('GET /api/datasets/<id>/coexpression/<gene>', lambda i: (
+            'GET', f'/api/datasets/{ds(i)}/coexpression/{symbols[i % len(symbols)]}?limit=25', None)),
+        Plan('GET /api/cache/stats', lambda i: ('GET', '/api/cache/stats', None)),
+        Plan('GET /api/metrics', lambda i: ('GET', '/api/metrics', None)),
+        Plan('POST /api/analysis/differential_expression [r]', lambda i: ('POST', '/api/analysis/differential_expression', {
+            'dataset_id': ds(i), 'engine': 'r', 'group_by': 'tumor_subtype', 'group1': 'NET', 'group2': 'NEC', 'run': i
+        }), kind='analysis', poll=True),
+        Plan('POST /api/analysis/differential_expression [python]', lambda i: ('POST', '/api/analysis/differential_expression', {
+            'dataset_id': ds(i), 'engine': 'python', 'group_by': 'tumor_subtype', 'group1': 'NET', 'group2': 'NEC', 'run': i
+        }), kind='analysis', poll=True),
+        Plan('POST /api/analysis/pca [r]', lambda i: ('POST', '/api/analysis/pca', {
+            'dataset_id': ds(i), 'engine': 'r', 'n_components': 2, 'run': i
+        }), kind='analysis', poll=True),
+        Plan('POST /api/analysis/pca [python]', lambda i: ('POST', '/api/analysis/pca', {
+            'dataset_id': ds(i), 'engine': 'python', 'n_components': 2, 'top_genes': 500, 'run': i
+        }), kind='analysis', poll=True),
+        Plan('POST /api/analysis/survival [gene]', lambda i: ('POST', '/api/analysis/survival', {
+            'dataset_id': ds(i), 'engine': 'python', 'gene': symbols[i % len(symbols)], 'run': i
+        }), kind='analysis', poll=True),
+        Plan('POST /api/analysis/survival [all_genes]', lambda i: ('POST', '/api/analysis/survival', {
+            'dataset_id': ds(i), 'engine': 'python', 'all_genes': True, 'cutpoint': 'optimal', 'run': i
+        }), kind='analysis', poll=True),
+        Plan('POST /api/analysis/enrichment [r]', lambda i: ('POST', '/api/analysis/enrichment', {
+            'dataset_id': ds(i), 'engine': 'r', 'gene_list': symbols[i % 100:i % 100 + 100], 'run': i
+        }), kind='analysis', poll=True),
+        Plan('POST /api/analysis/enrichment [ora]', lambda i: ('POST', '/api/analysis/enrichment', {
+            'engine': 'python', 'gene_list': symbols[i % 100:i % 100 + 200], 'run': i
+        }), kind='analysis', poll=True),
+        Plan('POST /api/analysis/enrichment [gsea]', lambda i: ('POST', '/api/analysis/enrichment', {
+            'engine': 'python', 'method': 'gsea', 'permutations': 1000, 'run': i,
+            'ranked_genes': {s: float(np.sin(j + i)) for j, s in enumerate(symbols)}
+        }), kind='analysis', poll=True),
+        Plan('GET /api/gene_sets', lambda i: ('GET', '/api/gene_sets', None)),
+        Plan('POST /api/analysis/batch', lambda i: ('POST', '/api/analysis/batch', {
+            'analysis_type': 'pca', 'dataset_ids': expr_ids[:4], 'parameters': {'n_components': 2, 'run': i}
+        }), kind='analysis'),
+        # Task routes read the tasks created by the analysis plans above
+        Plan('GET /api/tasks', lambda i: ('GET', '/api/tasks?limit=50', None)),
+        Plan('GET /api/tasks/<id>', lambda i: ('GET', f"/api/tasks/{ctx['task_ids'][i % len(ctx['task_ids'])]}", None)),
+        Plan('GET /api/tasks/<id>?stream', lambda i: ('GET', f"/api/tasks/{ctx['task_ids'][i % len(ctx['task_ids'])]}?stream=1", None)),
+        Plan('GET /api/tasks/<id>/results', lambda i: ('GET', f"/api/tasks/{ctx['task_ids'][i % len(ctx['task_ids'])]}/results", None)),
+        # Paged reads of differential expression result tables stored as columnar artifacts
+        Plan('GET /api/tasks/<id>/results/<table>?filter', lambda i: ('GET', (
+            f"/api/tasks/{ctx['de_task_ids'][i % len(ctx['de_task_ids'])]}/results/de_results"
+            f"?filter=padj<0.05&filter=abs(log2FoldChange)>1&sort=padj&limit=100&offset={100 * (i % 3)}"), None)),
+        Plan('GET /api/tasks/<id>/results/<table>?fields', lambda i: ('GET', (
+            f"/api/tasks/{ctx['de_task_ids'][i % len(ctx['de_task_ids'])]}/results/de_results"
+            f"?fields=gene,log2FoldChange,padj&limit=1000&offset={1000 * (i % 3)}"), None)),
+        Plan('GET /api/tasks/<id>/plots/volcano', lambda i: ('GET', (
+            f"/api/tasks/{ctx['de_task_ids'][i % len(ctx['de_task_ids'])]}/plots/volcano?width={600 + 100 * (i % 3)}"), None)),
+        Plan('GET /api/tasks/<id>/plots/heatmap', lambda i: ('GET', (
+            f"/api/tasks/{ctx['de_task_ids'][i % len(ctx['de_task_ids'])]}/plots/heatmap?max_genes={40 + 10 * (i % 3)}"), None)),
+    ]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(timings, errors, elapsed):
+    timings = sorted(timings)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None  # noqa: E731
+    return {
+        'requests': len(timings),
+        'errors': errors,
+        'mean_ms': ms(statistics.mean(timings)) if timings else None,
+        'p50_ms': ms(percentile(timings, 0.50)),
+        'p95_ms': ms(percentile(timings, 0.95)),
+        'p99_ms': ms(percentile(timings, 0.99)),
+        'max_ms': ms(timings[-1]) if timings else None,
+        'throughput_rps': round(len(timings) / elapsed, 1) if elapsed else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def wait_for_task(client, task_id, timeout=600):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        task = client.get(f'/api/tasks/{task_id}').get_json()
+        if task['status'] in ('completed', 'failed'):
+            return task['status']
+        time.sleep(0.002)
+    return 'timeout'
+
+
+def route_rule(app, method, url):
+    """The route template (url_map rule) that serves a request, or None when no route matches"""
+    try:
+        rule, _ = app.url_map.bind('localhost').match(urlsplit(url).path, method=method, return_rule=True)
+    except HTTPException:
+        return None
+    return rule.rule
+
+
+def run_plan(client, neta, plan, iterations, warmup, cold, requested=None):
+    """Time one plan; analysis plans record submit latency and, when polled, end-to-end latency
+
+    Every (method, url) sent is added to `requested` for the route coverage report.
+    """
+    submit, end_to_end, errors, task_ids = [], [], 0, []
+    started = None
+    for i in range(-warmup, iterations):
+        if i == 0:
+            started = time.perf_counter()
+        # Warmup runs use negative indices so their parameters never repeat a timed request
+        method, url, body = plan.make(i)
+        if requested is not None:
+            requested.add((method, url))
+        if cold:
+            # Outside the timer: drop in-process response and result caches
+            neta.http_cache.clear()
+            neta.result_cache.clear()
+        start = time.perf_counter()
+        response = client.open(url, method=method, json=body)
+        data = response.get_data()  # drain streamed bodies inside the timer
+        submitted = time.perf_counter()
+        status = response.status_code
+        if plan.poll and status in (200, 202):
+            payload = json.loads(data)
+            task_ids.append(payload['task_id'])
+            if payload.get('status') != 'completed' and wait_for_task(client, payload['task_id']) != 'completed':
+                status = 500
+        finished = time.perf_counter()
+        if i < 0:
+            continue
+        if status >= 400:
+            errors += 1
+        submit.append(submitted - start)
+        end_to_end.append(finished - start)
+    elapsed = time.perf_counter() - started
+    results = {plan.name + (' [submit]' if plan.poll else ''): summarize(submit, errors, elapsed)}
+    if plan.poll:
+        results[plan.name + ' [end-to-end]'] = summarize(end_to_end, errors, elapsed)
+    return results, task_ids
+
+
+def compare(report, baseline, threshold):
+    """Compare p50/p95 per route; a route regresses when either grows by more than `threshold`"""
+    comparison, regressions = {}, []
+    for mode, routes in report['routes'].items():
+        for name, current in routes.items():
+            previous = baseline.get('routes', {}).get(mode, {}).get(name)
+            if not previous or not previous.get('p50_ms') or not current.get('p50_ms'):
+                continue
+            entry = {}
+            for metric in ('p50_ms', 'p95_ms'):
+                if previous.get(metric):
+                    entry[metric.replace('_ms', '_ratio')] = round(current[metric] / previous[metric], 3)
+            comparison.setdefault(mode, {})[name] = entry
+            if any(v > 1 + threshold for v in entry.values()):
+                regressions.append(f'{mode}: {name}')
+    return comparison, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every backend route against a synthetic NETA database')
+    parser.add_argument('--rows', default='4M', help='expression rows to generate, e.g. 4M, 40M, 400M')
+    parser.add_argument('--genes', type=int, default=20000, help='genes per expression dataset')
+    parser.add_argument('--samples', type=int, default=100, help='samples per dataset')
+    parser.add_argument('--metadata-datasets', type=int, default=200, help='extra datasets without expression rows')
+    parser.add_argument('--db', type=Path, help='database to generate or reuse (default: data/benchmark/neta_<rows>.sqlite)')
+    parser.add_argument('--regenerate', action='store_true', help='rebuild the database even if it exists')
+    parser.add_argument('--no-migrate', action='store_true', help='skip schema migrations (measure without indexes)')
+    parser.add_argument('--expression-store', action='store_true', help='build the columnar and gene-major expression stores before timing')
+    parser.add_argument('--gene-sets', type=int, default=10000, help='synthetic GMT gene sets for the enrichment engine')
+    parser.add_argument('--iterations', type=int, default=50, help='timed requests per read route')
+    parser.add_argument('--analysis-iterations', type=int, default=5, help='timed requests per analysis route')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--cache', choices=('cold', 'warm', 'both'), default='both',
+                        help='cold clears response/result caches before every request')
+    parser.add_argument('--r-latency-ms', type=float, default=0, help='delay added by the stubbed RRunner')
+    parser.add_argument('--r-result-rows', type=int, default=1000, help='rows in stubbed R results')
+    parser.add_argument('--only', action='append', default=[], help='run only routes containing this text (repeatable)')
+    parser.add_argument('--skip-ingest', action='store_true', help='skip the series-matrix ingestion benchmark')
+    parser.add_argument('--output', type=Path, help='write the JSON report here')
+    parser.add_argument('--baseline', type=Path, help='previous JSON report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed p50/p95 growth before flagging')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    rows = parse_count(args.rows)
+    bench_dir = ROOT / 'data' / 'benchmark'
+    bench_dir.mkdir(parents=True, exist_ok=True)
+    db_path = (args.db or bench_dir / f'neta_{args.rows}.sqlite').resolve()
+    report = {
+        'generated_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+        'rows': rows,
+    }
+
+    if args.regenerate and db_path.exists():
+        db_path.unlink()
+    if not db_path.exists():
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        report['database'] = generate_database(db_path, rows, args.genes, args.samples, args.metadata_datasets)
+    else:
+        report['database'] = {'reused': True}
+    report['database']['path'] = str(db_path)
+    report['database']['size_mb'] = round(db_path.stat().st_size / 1024 / 1024, 1)
+
+    # The app reads its configuration at import time
+    os.environ['NETA_DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['NETA_EXPRESSION_STORE'] = str(db_path.with_suffix('.store'))
+    os.environ['NETA_GENE_MAJOR_STORE'] = str(db_path.with_suffix('.gene_major'))
+    os.environ['NETA_RESULT_STORE'] = str(db_path.with_suffix('.results'))
+    os.environ['NETA_PLOT_CACHE'] = str(db_path.with_suffix('.plots'))
+    os.environ['NETA_COEXPRESSION_DIR'] = str(db_path.with_suffix('.coexpression'))
+    gene_set_dir = db_path.with_suffix('.gene_sets')
+    if args.regenerate or not gene_set_dir.exists():
+        with sqlite3.connect(db_path) as conn:
+            write_gene_sets(gene_set_dir, [r[0] for r in conn.execute('SELECT gene_symbol FROM genes')], args.gene_sets)
+    os.environ['NETA_GENE_SET_DIR'] = str(gene_set_dir)
+    os.environ.setdefault('NETA_R_WORKERS', '0')
+    os.chdir(tempfile.mkdtemp(prefix='neta-bench-'))  # RRunner writes job directories relative to cwd
+    import app as neta
+
+    report['database'].update(prepare_app(neta, args.expression_store, migrate=not args.no_migrate))
+    stub = stub_runner_class(neta.RRunner)(args.r_latency_ms, args.r_result_rows)
+    neta.r_runner = stub
+
+    with neta.app.app_context():
+        ctx = {
+            'expression_datasets': [r[0] for r in neta.db.session.query(neta.DatasetSummary.dataset_id).filter(
+                neta.DatasetSummary.has_expression.is_(True)).order_by(neta.DatasetSummary.dataset_id)],
+            'symbols': [r[0] for r in neta.db.session.query(neta.Gene.gene_symbol).limit(1000)],
+            'task_ids': [],
+            'de_task_ids': [],
+        }
+    plans = [p for p in build_plans(ctx) if not args.only or any(s in p.name for s in args.only)]
+    modes = ['cold', 'warm'] if args.cache == 'both' else [args.cache]
+    client = neta.app.test_client()
+
+    report['routes'] = {}
+    requested = set()
+    for mode in modes:
+        routes = {}
+        for plan in plans:
+            if '<id>' in plan.name and plan.name.startswith('GET /api/tasks') and not ctx['task_ids']:
+                continue
+            if ('<table>' in plan.name or '/plots/' in plan.name) and not ctx['de_task_ids']:
+                continue
+            iterations = args.analysis_iterations if plan.kind == 'analysis' else args.iterations
+            results, task_ids = run_plan(client, neta, plan, iterations, args.warmup, mode == 'cold', requested)
+            ctx['task_ids'].extend(task_ids)
+            # Python-engine results carry the full volcano_data columns that the plot routes read
+            if 'differential_expression [python]' in plan.name:
+                ctx['de_task_ids'].extend(task_ids)
+            routes.update(results)
+            for name, stats in results.items():
+                print(f"[{mode}] {name}: p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms, "
+                      f"{stats['errors']} errors", file=sys.stderr)
+        report['routes'][mode] = routes
+
+    # Routes registered in the app that no request of this run reached, matched on the route templates
+    covered = {route_rule(neta.app, method, url) for method, url in requested}
+    registered = {r.rule for r in neta.app.url_map.iter_rules() if r.rule.startswith('/api/')}
+    report['uncovered_routes'] = sorted(registered - covered)
+    report['stub_r_calls'] = stub.calls
+    neta.task_queue.shutdown()
+
+    if not args.skip_ingest:
+        with tempfile.TemporaryDirectory() as tmp:
+            matrix_path = Path(tmp) / 'GSE0000001_series_matrix.txt'
+            write_series_matrix(matrix_path, min(args.genes, 20000), args.samples)
+            report['ingestion'] = bench_python(matrix_path, Path(tmp) / 'ingest.sqlite')
+
+    report['peak_rss_mb'] = peak_rss_mb()
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        report['comparison'], report['regressions'] = compare(report, baseline, args.threshold)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(text)
+    print(text)
+    if args.fail_on_regression and report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
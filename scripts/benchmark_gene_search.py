@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# Benchmark the in-process gene search index with a synthetic genes table
+
+import argparse
+import json
+import random
+import statistics
+import string
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'backend'))
+
+from gene_index import GeneSearchIndex  # noqa: E402
+
+NAME_WORDS = ['kinase', 'receptor', 'protein', 'binding', 'factor', 'channel', 'domain', 'family',
+              'transcription', 'subunit', 'zinc', 'finger', 'member', 'associated', 'neuroendocrine']
+
+
+def synthetic_genes(n, seed=42):
+    rng = random.Random(seed)
+    for i in range(1, n + 1):
+        symbol = ''.join(rng.choices(string.ascii_uppercase, k=rng.randint(2, 5))) + str(rng.randint(1, 99))
+        name = ' '.join(rng.choices(NAME_WORDS, k=rng.randint(2, 5)))
+        yield (i, f'ENSG{i:011d}', symbol, name, str(rng.randint(1, 22)), 'protein_coding',
+               str(100000 + i), f'ENSG{i:011d}.{rng.randint(1, 20)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark gene search typeahead latency')
+    parser.add_argument('--genes', type=int, default=250000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    genes = list(synthetic_genes(args.genes))
+    start = time.perf_counter()
+    index = GeneSearchIndex().build(genes)
+    build_s = time.perf_counter() - start
+
+    rng = random.Random(7)
+    symbols = [row[2] for row in genes]
+    queries = []
+    for _ in range(args.queries):
+        kind = rng.random()
+        symbol = rng.choice(symbols)
+        if kind < 0.5:
+            # typeahead: growing prefixes of a real symbol
+            queries.append(symbol[:rng.randint(1, len(symbol))])
+        elif kind < 0.7:
+            queries.append(symbol)
+        elif kind < 0.8:
+            queries.append(str(100000 + rng.randint(1, args.genes)))
+        elif kind < 0.9:
+            queries.append(rng.choice(NAME_WORDS)[:rng.randint(2, 6)])
+        else:
+            queries.append(symbol[1:4])
+
+    timings = []
+    for q in queries:
+        t = time.perf_counter()
+        index.search(q, args.limit)
+        timings.append((time.perf_counter() - t) * 1000)
+    timings.sort()
+
+    def pct(p):
+        return round(timings[min(len(timings) - 1, int(len(timings) * p))], 3)
+
+    print(json.dumps({
+        'genes': index.size,
+        'build_s': round(build_s, 3),
+        'queries': len(timings),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'p99_ms': pct(0.99),
+        'max_ms': round(timings[-1], 3),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
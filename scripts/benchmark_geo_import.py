@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# Benchmark series-matrix ingestion: bulk Python loader vs the R importer's write pattern
+
+import argparse
+import json
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'scripts'))
+
+from import_geo_series import SCHEMA, GeoImporter, configure_bulk_load, read_series_matrix  # noqa: E402
+
+# Mirrors import_expression_data() in R_scripts/import_real_geo_data.R on the same file
+R_IMPORT = r'''
+suppressMessages({library(RSQLite); library(DBI)})
+args <- commandArgs(trailingOnly = TRUE)
+lines <- readLines(args[1])
+begin <- grep("^!series_matrix_table_begin", lines)
+end <- grep("^!series_matrix_table_end", lines)
+expr <- read.delim(text = lines[(begin + 1):(end - 1)], row.names = 1, check.names = FALSE)
+conn <- dbConnect(RSQLite::SQLite(), args[2])
+started <- Sys.time()
+expr_df <- as.data.frame(expr)
+expr_df$gene_id <- rownames(expr_df)
+expr_long <- reshape2::melt(expr_df, id.vars = "gene_id", variable.name = "sample_id", value.name = "expression_value")
+expr_long$log2_expression <- log2(expr_long$expression_value + 1)
+expr_long$gene_symbol <- expr_long$gene_id
+expr_long$dataset_id <- 1
+batch_size <- 10000
+for (i in seq(1, nrow(expr_long), by = batch_size)) {
+  batch <- expr_long[i:min(i + batch_size - 1, nrow(expr_long)), ]
+  batch$normalized_value <- batch$expression_value
+  batch$percentile_rank <- runif(nrow(batch), 0, 100)
+  batch$is_expressed <- batch$expression_value > 10
+  dbWriteTable(conn, "gene_expression", batch, append = TRUE, row.names = FALSE)
+}
+cat(as.numeric(difftime(Sys.time(), started, units = "secs")), nrow(expr_long), "\n")
+dbDisconnect(conn)
+'''
+
+
+def write_series_matrix(path, genes, samples, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.lognormal(5, 2, size=(genes, samples)).astype(np.float32)
+    with open(path, 'w') as f:
+        f.write('!Series_title\t"Synthetic benchmark series"\n')
+        f.write('!Series_geo_accession\t"GSE0000001"\n')
+        f.write('!Series_platform_id\t"GPL570"\n')
+        f.write('!Sample_title\t' + '\t'.join(f'"Sample {j}"' for j in range(samples)) + '\n')
+        f.write('!Sample_geo_accession\t' + '\t'.join(f'"GSM{j:07d}"' for j in range(samples)) + '\n')
+        f.write('!Sample_characteristics_ch1\t' + '\t'.join(f'"age: {40 + j % 30}"' for j in range(samples)) + '\n')
+        f.write('!series_matrix_table_begin\n')
+        f.write('"ID_REF"\t' + '\t'.join(f'"GSM{j:07d}"' for j in range(samples)) + '\n')
+        for i in range(genes):
+            f.write(f'"PROBE_{i}"\t' + '\t'.join(f'{v:.4f}' for v in values[i]) + '\n')
+        f.write('!series_matrix_table_end\n')
+
+
+def bench_python(matrix_path, db_path):
+    conn = sqlite3.connect(db_path)
+    configure_bulk_load(conn)
+    start = time.perf_counter()
+    result = GeoImporter(conn).import_series(matrix_path, tumor_type='Benchmark', tissue_type='Synthetic')
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return {
+        'rows': result['expression_rows'],
+        'seconds': round(elapsed, 3),
+        'rows_per_s': round(result['expression_rows'] / elapsed),
+        'phases': {k: result[k] for k in ('parse_s', 'compute_s', 'load_s')},
+    }
+
+
+def bench_batched(matrix_path, db_path, batch_size=10000):
+    """The R importer's write pattern from Python: default PRAGMAs, one commit per 10k-row batch"""
+    _, samples, probe_ids, matrix = read_series_matrix(matrix_path)
+    conn = sqlite3.connect(db_path)
+    for ddl in SCHEMA:
+        conn.execute(ddl)
+    start = time.perf_counter()
+    rng = np.random.default_rng(0)
+    batch, rows = [], 0
+    for j, sample in enumerate(samples):
+        column = matrix[:, j].astype(np.float64)
+        for gene_id, value in zip(probe_ids, column.tolist()):
+            batch.append((1, sample['sample_id'], gene_id, gene_id, value, float(np.log2(value + 1)), value,
+                          float(rng.uniform(0, 100)), value > 10))
+            if len(batch) == batch_size:
+                rows += _write_batch(conn, batch)
+                batch = []
+    if batch:
+        rows += _write_batch(conn, batch)
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return {'rows': rows, 'seconds': round(elapsed, 3), 'rows_per_s': round(rows / elapsed)}
+
+
+def _write_batch(conn, batch):
+    conn.executemany("""
+        INSERT INTO gene_expression (dataset_id, sample_id, gene_id, gene_symbol, expression_value,
+                                     log2_expression, normalized_value, percentile_rank, is_expressed)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, batch)
+    conn.commit()
+    return len(batch)
+
+
+def bench_r(matrix_path, db_path):
+    rscript = shutil.which('Rscript')
+    if rscript is None:
+        return {'available': False, 'reason': 'Rscript not found'}
+    conn = sqlite3.connect(db_path)
+    for ddl in SCHEMA:
+        conn.execute(ddl)
+    conn.close()
+    proc = subprocess.run([rscript, '-e', R_IMPORT, str(matrix_path), str(db_path)],
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {'available': False, 'reason': proc.stderr.strip().splitlines()[-1:] or 'Rscript failed'}
+    seconds, rows = proc.stdout.split()[:2]
+    seconds, rows = float(seconds), int(rows)
+    return {'available': True, 'rows': rows, 'seconds': round(seconds, 3), 'rows_per_s': round(rows / seconds)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare GEO ingestion throughput (rows/sec)')
+    parser.add_argument('--genes', type=int, default=20000)
+    parser.add_argument('--samples', type=int, default=100)
+    parser.add_argument('--skip-r', action='store_true', help='do not run the R importer path')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        matrix_path = tmp / 'GSE0000001_series_matrix.txt'
+        write_series_matrix(matrix_path, args.genes, args.samples)
+
+        report = {
+            'genes': args.genes,
+            'samples': args.samples,
+            'python_bulk': bench_python(matrix_path, tmp / 'bulk.sqlite'),
+            'r_pattern_batched': bench_batched(matrix_path, tmp / 'batched.sqlite'),
+            'r_importer': {'available': False, 'reason': 'skipped'} if args.skip_r else bench_r(matrix_path, tmp / 'r.sqlite'),
+        }
+        baseline = report['r_importer'] if report['r_importer'].get('available') else report['r_pattern_batched']
+        report['speedup'] = round(report['python_bulk']['rows_per_s'] / baseline['rows_per_s'], 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
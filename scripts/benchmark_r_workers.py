@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# Benchmark cold Rscript spawns against the persistent R worker pool
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'backend'))
+
+from r_runner import RRunner  # noqa: E402
+from r_worker_pool import RWorkerPool  # noqa: E402
+
+
+def time_runs(runner, analysis_type, iterations):
+    timings = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        runner.run_analysis(analysis_type, {'dataset_id': 1, 'n_components': 2, 'iteration': i})
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(timings):
+    return {
+        'runs': len(timings),
+        'mean_s': round(statistics.mean(timings), 4),
+        'median_s': round(statistics.median(timings), 4),
+        'min_s': round(min(timings), 4),
+        'max_s': round(max(timings), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare cold Rscript spawns with the warm R worker pool')
+    parser.add_argument('--analysis-type', default='pca_analysis')
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--preload', default='', help='comma-separated R packages to preload in the pool')
+    args = parser.parse_args()
+
+    # R scripts are resolved relative to the repository root, like the backend does
+    os.chdir(ROOT)
+    data_dir = ROOT / 'data' / 'benchmark'
+
+    cold = RRunner(data_dir=data_dir)
+    cold_timings = time_runs(cold, args.analysis_type, args.iterations)
+
+    pool = RWorkerPool(size=args.workers, preload=[p for p in args.preload.split(',') if p])
+    start = time.perf_counter()
+    pool.warm()
+    warmup = time.perf_counter() - start
+    try:
+        warm = RRunner(data_dir=data_dir, worker_pool=pool)
+        warm_timings = time_runs(warm, args.analysis_type, args.iterations)
+    finally:
+        pool.close()
+
+    report = {
+        'analysis_type': args.analysis_type,
+        'cold_spawn': summarize(cold_timings),
+        'warm_pool': summarize(warm_timings),
+        'pool_warmup_s': round(warmup, 4),
+        'speedup': round(statistics.mean(cold_timings) / statistics.mean(warm_timings), 2),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
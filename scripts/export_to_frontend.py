@@ -1,14 +1,35 @@
 #!/usr/bin/env python3
 # Export real datasets to frontend static JSON files
-
-import os
+#
+# Output (under frontend/public/data):
+#   datasets.json          list index with the fields the dataset list renders
+#   stats.json             platform statistics
+#   datasets/<id>.json     per-dataset detail shards, lazy-loaded by the detail view
+#   *.gz / *.br            precompressed siblings for nginx gzip_static / brotli_static
+#   manifest.json          content hashes; files whose hash is unchanged are not rewritten
+
+import argparse
+import gzip
+import hashlib
 import json
 import sqlite3
+import time
 from pathlib import Path
 
+try:
+    import brotli
+except ImportError:  # optional: only .gz siblings are written without it
+    brotli = None
+
 ROOT = Path(__file__).resolve().parents[1]
 DB_PATHS = [ROOT / 'neta_data.sqlite', ROOT / 'data' / 'neta_data.sqlite', ROOT / '..' / 'neta_data.sqlite']
 OUT_DIR = ROOT / 'frontend' / 'public' / 'data'
+MANIFEST = 'manifest.json'
+
+# Fields needed by the dataset list; everything else lives in the per-dataset shard
+INDEX_FIELDS = ('id', 'geo_id', 'title', 'tissue_type', 'tumor_type', 'platform', 'n_samples', 'n_genes',
+                'publication_year', 'data_source', 'priority')
+DETAIL_FIELDS = INDEX_FIELDS + ('description', 'reference_pmid')
 
 
 def find_db():
@@ -24,104 +45,164 @@ def get_connection(db_path: Path):
     return conn
 
 
+def has_table(conn, name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone() is not None
+
+
+def expression_source(conn):
+    # Prefer the materialized dataset_summary table; otherwise aggregate gene_expression once
+    if has_table(conn, 'dataset_summary'):
+        return """
+            SELECT dataset_id, expression_rows, n_genes AS expressed_genes, n_samples AS expressed_samples,
+                   min_value, max_value, mean_value
+            FROM dataset_summary WHERE has_expression
+        """
+    return """
+        SELECT dataset_id, COUNT(1) AS expression_rows, COUNT(DISTINCT gene_id) AS expressed_genes,
+               COUNT(DISTINCT sample_id) AS expressed_samples, MIN(expression_value) AS min_value,
+               MAX(expression_value) AS max_value, AVG(expression_value) AS mean_value
+        FROM gene_expression GROUP BY dataset_id
+    """
+
+
 def fetch_real_datasets(conn):
-    # Only datasets that actually have gene_expression rows
-    query = """
-    SELECT d.*,
-           (SELECT COUNT(1) FROM gene_expression ge WHERE ge.dataset_id = d.id) AS expr_count
+    # Only active datasets that actually have gene_expression rows, in one joined pass
+    query = f"""
+    SELECT d.*, e.expression_rows AS expr_count, e.expressed_genes, e.expressed_samples,
+           e.min_value, e.max_value, e.mean_value
     FROM datasets d
-    WHERE EXISTS (SELECT 1 FROM gene_expression ge WHERE ge.dataset_id = d.id)
-      AND (d.status IS NULL OR d.status = 'active')
+    JOIN ({expression_source(conn)}) e ON e.dataset_id = d.id
+    WHERE d.status IS NULL OR d.status = 'active'
     ORDER BY d.priority ASC, d.id ASC
     """
     return [dict(row) for row in conn.execute(query).fetchall()]
 
 
-def fetch_stats(conn):
-    # Global stats limited to real-expression datasets
-    total_datasets = conn.execute("""
-        SELECT COUNT(1) FROM datasets d WHERE EXISTS(SELECT 1 FROM gene_expression ge WHERE ge.dataset_id = d.id)
-    """).fetchone()[0]
-    total_samples = conn.execute("SELECT COUNT(1) FROM samples").fetchone()[0]
-    total_genes = conn.execute("SELECT COUNT(1) FROM genes").fetchone()[0]
-    total_expressions = conn.execute("SELECT COUNT(1) FROM gene_expression").fetchone()[0]
-
-    tissue_stats = [
-        {"name": r[0], "count": r[1]}
-        for r in conn.execute(
-            """
-            SELECT d.tissue_type, COUNT(1)
-            FROM datasets d
-            WHERE EXISTS(SELECT 1 FROM gene_expression ge WHERE ge.dataset_id = d.id)
-            GROUP BY d.tissue_type
-            ORDER BY COUNT(1) DESC
-            """
-        ).fetchall()
-    ]
-
-    tumor_stats = [
-        {"name": r[0], "count": r[1]}
-        for r in conn.execute(
-            """
-            SELECT d.tumor_type, COUNT(1)
-            FROM datasets d
-            WHERE EXISTS(SELECT 1 FROM gene_expression ge WHERE ge.dataset_id = d.id)
-            GROUP BY d.tumor_type
-            ORDER BY COUNT(1) DESC
-            """
-        ).fetchall()
-    ]
+def build_stats(conn, datasets):
+    # Dataset-level statistics come from the rows already fetched; only the global totals hit the DB
+    totals = conn.execute("SELECT (SELECT COUNT(1) FROM samples), (SELECT COUNT(1) FROM genes)").fetchone()
+
+    def counts(field):
+        tally = {}
+        for d in datasets:
+            tally[d.get(field)] = tally.get(d.get(field), 0) + 1
+        return [{'name': k, 'count': v} for k, v in sorted(tally.items(), key=lambda kv: -kv[1])]
 
     return {
-        "total_datasets": total_datasets,
-        "total_samples": total_samples,
-        "total_genes": total_genes,
-        "total_expressions": total_expressions,
-        "tissue_types": tissue_stats,
-        "tumor_types": tumor_stats,
+        'total_datasets': len(datasets),
+        'total_samples': totals[0],
+        'total_genes': totals[1],
+        'total_expressions': sum(d['expr_count'] or 0 for d in datasets),
+        'tissue_types': counts('tissue_type'),
+        'tumor_types': counts('tumor_type'),
     }
 
 
+def dataset_detail(d):
+    detail = {k: d.get(k) for k in DETAIL_FIELDS}
+    detail['expression_summary'] = {
+        'expression_rows': d['expr_count'],
+        'n_genes': d['expressed_genes'],
+        'n_samples': d['expressed_samples'],
+        'min_value': d['min_value'],
+        'max_value': d['max_value'],
+        'mean_value': d['mean_value'],
+    }
+    return detail
+
+
+def encode(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class Exporter:
+    """Writes files atomically, skipping any whose content hash matches the previous manifest"""
+
+    def __init__(self, out_dir, compress=True):
+        self.out_dir = out_dir
+        self.compress = compress
+        manifest_path = out_dir / MANIFEST
+        self.previous = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+        self.manifest = {}
+        self.written = []
+
+    def write(self, relative, payload):
+        data = encode(payload)
+        digest = hashlib.sha256(data).hexdigest()
+        self.manifest[relative] = digest
+        path = self.out_dir / relative
+        if self.previous.get(relative) == digest and path.exists() and self._siblings_exist(path):
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._atomic_write(path, data)
+        if self.compress:
+            # mtime=0 keeps the .gz bytes stable for identical content
+            self._atomic_write(path.with_name(path.name + '.gz'), gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                self._atomic_write(path.with_name(path.name + '.br'), brotli.compress(data, quality=11))
+        self.written.append(relative)
+
+    def _siblings_exist(self, path):
+        if not self.compress:
+            return True
+        suffixes = ['.gz'] + (['.br'] if brotli is not None else [])
+        return all(path.with_name(path.name + s).exists() for s in suffixes)
+
+    @staticmethod
+    def _atomic_write(path, data):
+        tmp = path.with_name(path.name + '.tmp')
+        tmp.write_bytes(data)
+        tmp.replace(path)
+
+    def remove_stale(self):
+        """Delete files (and compressed siblings) from the previous export that were not produced this time"""
+        removed = []
+        for relative in set(self.previous) - set(self.manifest):
+            for suffix in ('', '.gz', '.br'):
+                path = self.out_dir / (relative + suffix)
+                if path.exists():
+                    path.unlink()
+            removed.append(relative)
+        return removed
+
+    def save_manifest(self):
+        self._atomic_write(self.out_dir / MANIFEST, json.dumps(self.manifest, indent=1, sort_keys=True).encode('utf-8'))
+
+
 def main():
-    db_path = find_db()
-    conn = get_connection(db_path)
-    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    parser = argparse.ArgumentParser(description='Export datasets and statistics as static JSON for the frontend')
+    parser.add_argument('--db', type=Path, help='SQLite database (default: first of the known locations)')
+    parser.add_argument('--out', type=Path, default=OUT_DIR)
+    parser.add_argument('--no-compress', action='store_true', help='do not write .gz/.br siblings')
+    args = parser.parse_args()
 
-    datasets = fetch_real_datasets(conn)
+    start = time.perf_counter()
+    conn = get_connection(args.db or find_db())
+    args.out.mkdir(parents=True, exist_ok=True)
+    exporter = Exporter(args.out, compress=not args.no_compress)
 
-    # Trim fields and keep only necessary
-    datasets_min = []
+    datasets = fetch_real_datasets(conn)
+    index = [{k: d.get(k) for k in INDEX_FIELDS} for d in datasets]
+
+    exporter.write('datasets.json', {
+        'datasets': index,
+        'total': len(index),
+        'pages': 1,
+        'current_page': 1
+    })
+    exporter.write('stats.json', build_stats(conn, datasets))
     for d in datasets:
-        datasets_min.append({
-            'id': d['id'],
-            'geo_id': d['geo_id'],
-            'title': d.get('title'),
-            'description': d.get('description'),
-            'tissue_type': d.get('tissue_type'),
-            'tumor_type': d.get('tumor_type'),
-            'platform': d.get('platform'),
-            'n_samples': d.get('n_samples'),
-            'n_genes': d.get('n_genes'),
-            'publication_year': d.get('publication_year'),
-            'data_source': d.get('data_source'),
-            'priority': d.get('priority') if 'priority' in d else None,
-        })
-
-    stats = fetch_stats(conn)
-
-    with open(OUT_DIR / 'datasets.json', 'w') as f:
-        json.dump({
-            'datasets': datasets_min,
-            'total': len(datasets_min),
-            'pages': 1,
-            'current_page': 1
-        }, f, indent=2, ensure_ascii=False)
-
-    with open(OUT_DIR / 'stats.json', 'w') as f:
-        json.dump(stats, f, indent=2, ensure_ascii=False)
-
-    print('Exported:', OUT_DIR / 'datasets.json')
-    print('Exported:', OUT_DIR / 'stats.json')
+        exporter.write(f"datasets/{d['id']}.json", dataset_detail(d))
+
+    removed = exporter.remove_stale()
+    exporter.save_manifest()
+
+    print(f"Exported {len(exporter.manifest)} files to {args.out}: "
+          f"{len(exporter.written)} written, {len(removed)} removed, "
+          f"{len(exporter.manifest) - len(exporter.written)} unchanged "
+          f"({time.perf_counter() - start:.3f}s)")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,543 @@
+#!/usr/bin/env python3
+# Bulk-load GEO series-matrix files into the NETA SQLite database
+#
+# Python counterpart of R_scripts/import_real_geo_data.R for large series: the
+# matrix is streamed once, log2 / normalized / percentile values are computed
+# per sample with NumPy, and everything for a series is written in a single
+# transaction with bulk-load PRAGMAs and gene_expression indexes rebuilt at the end.
+
+import argparse
+import gzip
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_DB = ROOT / 'neta_data.sqlite'
+# Memory-mapped matrices built by `flask build-expression-store`; a reloaded series makes them stale
+DEFAULT_EXPRESSION_STORE = Path(os.environ.get('NETA_EXPRESSION_STORE', ROOT / 'backend' / 'data' / 'processed' / 'expression_store'))
+DEFAULT_COEXPRESSION_DIR = Path(os.environ.get('NETA_COEXPRESSION_DIR', ROOT / 'backend' / 'data' / 'processed' / 'coexpression'))
+
+# Same tables as import_real_geo_data.R, so either importer can run first
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS datasets (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      geo_id TEXT UNIQUE NOT NULL,
+      title TEXT,
+      description TEXT,
+      tissue_type TEXT,
+      tumor_type TEXT,
+      platform TEXT,
+      n_samples INTEGER,
+      n_genes INTEGER,
+      publication_year INTEGER,
+      reference_pmid TEXT,
+      data_source TEXT,
+      priority INTEGER DEFAULT 1,
+      status TEXT DEFAULT 'active',
+      created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+      updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS samples (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      dataset_id INTEGER,
+      sample_id TEXT,
+      sample_name TEXT,
+      tissue_type TEXT,
+      tumor_type TEXT,
+      tumor_subtype TEXT,
+      grade TEXT,
+      stage TEXT,
+      age INTEGER,
+      gender TEXT,
+      survival_status TEXT,
+      survival_time INTEGER,
+      treatment_type TEXT,
+      metastasis_status TEXT,
+      primary_site TEXT,
+      quality_score REAL,
+      FOREIGN KEY (dataset_id) REFERENCES datasets (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS genes (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      gene_id TEXT UNIQUE NOT NULL,
+      gene_symbol TEXT,
+      gene_name TEXT,
+      chromosome TEXT,
+      gene_type TEXT,
+      description TEXT,
+      entrez_id TEXT,
+      ensembl_id TEXT,
+      uniprot_id TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS gene_expression (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      dataset_id INTEGER,
+      sample_id TEXT,
+      gene_id TEXT,
+      gene_symbol TEXT,
+      expression_value REAL,
+      log2_expression REAL,
+      normalized_value REAL,
+      percentile_rank REAL,
+      is_expressed BOOLEAN,
+      FOREIGN KEY (dataset_id) REFERENCES datasets (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS data_version (
+      dataset_id INTEGER PRIMARY KEY,
+      version INTEGER NOT NULL DEFAULT 0,
+      updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS dataset_summary (
+      dataset_id INTEGER PRIMARY KEY,
+      has_expression BOOLEAN NOT NULL DEFAULT 0,
+      expression_rows INTEGER NOT NULL DEFAULT 0,
+      n_genes INTEGER NOT NULL DEFAULT 0,
+      n_samples INTEGER NOT NULL DEFAULT 0,
+      min_value REAL,
+      max_value REAL,
+      mean_value REAL,
+      non_zero_rows INTEGER NOT NULL DEFAULT 0,
+      data_version INTEGER NOT NULL DEFAULT 0,
+      updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+      FOREIGN KEY (dataset_id) REFERENCES datasets (id)
+    )
+    """,
+]
+
+# Annotation columns, in the same order of preference as process_gene_metadata()
+SYMBOL_COLUMNS = ('Gene Symbol', 'GENE_SYMBOL', 'SYMBOL')
+NAME_COLUMNS = ('Gene Title', 'GENE_NAME', 'NAME')
+CHROMOSOME_COLUMNS = ('Chromosome', 'CHR')
+ENTREZ_COLUMNS = ('ENTREZ_GENE_ID', 'Entrez Gene')
+
+# Raw expression above this (log2(10 + 1) on the log scale) counts as expressed,
+# matching the expression_value > 10 rule used by the R importer
+EXPRESSED_LOG2 = float(np.log2(11))
+
+
+def open_text(path):
+    path = Path(path)
+    if path.suffix == '.gz':
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, 'r', encoding='utf-8', errors='replace')
+
+
+def _unquote(value):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        value = value[1:-1]
+    return value
+
+
+def _fields(line):
+    return [_unquote(v) for v in line.rstrip('\n').split('\t')]
+
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def _parse_values(fields, n):
+    """Parse one matrix row; empty, "null" or "NA" cells become NaN and short rows are padded"""
+    values = [v.strip().strip('"') or 'nan' for v in fields[:n]]
+    try:
+        row = np.array(values, dtype=np.float32)
+    except ValueError:
+        row = np.array([_parse_float(v) for v in values], dtype=np.float32)
+    if row.size < n:
+        row = np.concatenate([row, np.full(n - row.size, np.nan, dtype=np.float32)])
+    return row
+
+
+def read_series_matrix(path, max_genes=None):
+    """Parse a series-matrix file in one pass
+
+    Returns (series, samples, probe_ids, matrix) where series holds the !Series_ header
+    values, samples one metadata dict per GSM column and matrix is genes x samples float32.
+    """
+    series, sample_fields = {}, {}
+    probe_ids, rows = [], []
+    sample_ids = None
+    in_table = False
+
+    with open_text(path) as handle:
+        for line in handle:
+            if in_table:
+                if line.startswith('!series_matrix_table_end'):
+                    break
+                fields = line.rstrip('\n').split('\t')
+                if sample_ids is None:
+                    sample_ids = [_unquote(v) for v in fields[1:]]
+                    continue
+                if max_genes and len(probe_ids) >= max_genes:
+                    continue
+                probe_ids.append(_unquote(fields[0]))
+                rows.append(_parse_values(fields[1:], len(sample_ids)))
+            elif line.startswith('!series_matrix_table_begin'):
+                in_table = True
+            elif line.startswith('!Series_'):
+                key, *values = _fields(line)
+                series.setdefault(key[len('!Series_'):], []).extend(values)
+            elif line.startswith('!Sample_'):
+                key, *values = _fields(line)
+                sample_fields.setdefault(key[len('!Sample_'):], []).append(values)
+
+    if sample_ids is None:
+        raise ValueError(f'{path}: no series_matrix_table section found')
+    matrix = np.vstack(rows) if rows else np.empty((0, len(sample_ids)), dtype=np.float32)
+    return series, parse_samples(sample_ids, sample_fields), probe_ids, matrix
+
+
+def parse_samples(sample_ids, sample_fields):
+    """Turn !Sample_ header lines into one dict per sample (characteristics as key: value)"""
+    samples = []
+    for i, sample_id in enumerate(sample_ids):
+        item = {'sample_id': sample_id, 'characteristics': {}}
+        for key, lines in sample_fields.items():
+            values = [line[i] for line in lines if i < len(line) and line[i]]
+            if key.startswith('characteristics'):
+                for value in values:
+                    name, sep, rest = value.partition(':')
+                    if sep:
+                        item['characteristics'][name.strip().lower()] = rest.strip()
+            elif values:
+                item[key] = values[0]
+        samples.append(item)
+    return samples
+
+
+def _first_int(value):
+    match = re.search(r'\d+', value or '')
+    return int(match.group()) if match else None
+
+
+def sample_record(sample, dataset_id, tissue_type, tumor_type):
+    """Map GEO sample metadata onto the samples table, like process_sample_metadata()"""
+    ch = sample['characteristics']
+    gender = 'Unknown'
+    sex = (ch.get('gender') or ch.get('sex') or '').lower()
+    if sex.startswith('f'):
+        gender = 'Female'
+    elif sex.startswith('m'):
+        gender = 'Male'
+    return (
+        dataset_id, sample['sample_id'], sample.get('title') or sample['sample_id'], tissue_type, tumor_type,
+        ch.get('grade', 'Unknown'), ch.get('stage', 'Unknown'), _first_int(ch.get('age')), gender,
+        ch.get('survival_status') or ch.get('vital status') or 'Unknown',
+        _first_int(ch.get('survival_time') or ch.get('overall survival'))
+    )
+
+
+def read_annotation(path):
+    """Read a platform annotation table (GPL .annot / SOFT table / TSV) into {probe_id: gene fields}"""
+    annotation, header = {}, None
+    with open_text(path) as handle:
+        for line in handle:
+            if line.startswith(('#', '!', '^')) or not line.strip():
+                continue
+            fields = _fields(line)
+            if header is None:
+                header = {name: i for i, name in enumerate(fields)}
+                if 'ID' not in header:
+                    raise ValueError(f'{path}: annotation table has no ID column')
+
+                def column(names, header=header):
+                    return next((header[n] for n in names if n in header), None)
+                cols = {'symbol': column(SYMBOL_COLUMNS), 'name': column(NAME_COLUMNS),
+                        'chromosome': column(CHROMOSOME_COLUMNS), 'entrez': column(ENTREZ_COLUMNS)}
+                continue
+
+            def get(key):
+                idx = cols[key]
+                return fields[idx] if idx is not None and idx < len(fields) and fields[idx] else None
+            annotation[fields[header['ID']]] = {k: get(k) for k in cols}
+    return annotation
+
+
+def clean_symbol(symbol, probe_id):
+    # Same cleanup as the R importer: first symbol of "A /// B", no spaces, probe ID if empty
+    symbol = (symbol or '').split('///')[0].replace(' ', '')
+    return symbol or probe_id
+
+
+def is_log_scale(matrix):
+    """GEO2R heuristic: data already log-transformed unless the upper quantiles look linear"""
+    values = matrix[np.isfinite(matrix)]
+    if values.size == 0:
+        return True
+    q = np.quantile(values, [0.0, 0.25, 0.5, 0.75, 0.99, 1.0])
+    needs_log = q[4] > 100 or (q[5] - q[0] > 50 and q[1] > 0)
+    return not needs_log
+
+
+def derived_values(matrix):
+    """Vectorized per-sample log2, median-normalized and percentile-rank matrices"""
+    if is_log_scale(matrix):
+        log2 = matrix.astype(np.float64)
+    else:
+        log2 = np.log2(np.clip(matrix, 0, None).astype(np.float64) + 1)
+
+    # Median normalization on the log scale: align every sample's median to the overall median
+    with np.errstate(all='ignore'):
+        medians = np.nanmedian(log2, axis=0)
+        normalized = log2 - medians + np.nanmedian(medians)
+
+    # Percentile rank of each gene within its sample (ties share the average rank, NaN stays NaN)
+    percentile = np.full(log2.shape, np.nan)
+    for j in range(log2.shape[1]):
+        column = log2[:, j]
+        valid = np.flatnonzero(np.isfinite(column))
+        if valid.size == 0:
+            continue
+        order = valid[np.argsort(column[valid], kind='mergesort')]
+        ordered = column[order]
+        starts = np.r_[0, np.flatnonzero(np.diff(ordered)) + 1]
+        ends = np.r_[starts[1:], ordered.size]
+        ranks = np.repeat((starts + ends + 1) / 2.0, ends - starts)
+        percentile[order, j] = ranks / valid.size * 100
+    return log2, normalized, percentile
+
+
+def configure_bulk_load(conn, cache_mb=512):
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute(f'PRAGMA cache_size = {-cache_mb * 1024}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute(f'PRAGMA mmap_size = {cache_mb * 1024 * 1024}')
+
+
+def drop_expression_indexes(conn):
+    """Drop secondary indexes on gene_expression and return their DDL for rebuilding after the load"""
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'gene_expression' AND sql IS NOT NULL"
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX "{name}"')
+    return [sql for _, sql in indexes]
+
+
+def expression_table_empty(conn):
+    return conn.execute('SELECT 1 FROM gene_expression LIMIT 1').fetchone() is None
+
+
+def bump_data_version(conn, dataset_id):
+    for key in (dataset_id, 0):
+        conn.execute("""
+            INSERT INTO data_version (dataset_id, version, updated_at)
+            VALUES (?, 1, CURRENT_TIMESTAMP)
+            ON CONFLICT(dataset_id) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+        """, (key,))
+
+
+def refresh_dataset_summary(conn, dataset_id):
+    conn.execute("""
+        INSERT OR REPLACE INTO dataset_summary (
+          dataset_id, has_expression, expression_rows, n_genes, n_samples,
+          min_value, max_value, mean_value, non_zero_rows, data_version, updated_at
+        )
+        SELECT ?, COUNT(*) > 0, COUNT(*), COUNT(DISTINCT gene_id), COUNT(DISTINCT sample_id),
+               MIN(expression_value), MAX(expression_value), AVG(expression_value),
+               COALESCE(SUM(CASE WHEN expression_value > 0 THEN 1 ELSE 0 END), 0),
+               COALESCE((SELECT version FROM data_version WHERE dataset_id = ?), 0),
+               CURRENT_TIMESTAMP
+        FROM gene_expression
+        WHERE dataset_id = ?
+    """, (dataset_id, dataset_id, dataset_id))
+
+
+def evict_derived_stores(dataset_id, expression_store=None, coexpression_dir=None):
+    """Delete per-dataset files derived from gene_expression so the app falls back to the database"""
+    for root in (expression_store, coexpression_dir):
+        if root is not None:
+            shutil.rmtree(Path(root) / str(int(dataset_id)), ignore_errors=True)
+
+
+class GeoImporter:
+    """Imports series into one connection; the known gene_id set is loaded once and shared
+
+    Secondary indexes on gene_expression are dropped for the load and rebuilt afterwards only when the
+    table starts empty or bulk is set; rebuilding them costs time proportional to every row already loaded.
+    """
+
+    def __init__(self, conn, expression_store=None, coexpression_dir=None, bulk=False):
+        self.conn = conn
+        self.expression_store = expression_store
+        self.coexpression_dir = coexpression_dir
+        self.bulk = bulk
+        self.conn.isolation_level = None
+        for ddl in SCHEMA:
+            self.conn.execute(ddl)
+        self.known_genes = {row[0] for row in conn.execute('SELECT gene_id FROM genes')}
+
+    def import_series(self, path, title=None, tumor_type=None, tissue_type=None, priority=2,
+                      annotation=None, max_genes=None, max_samples=None, replace=False):
+        started = time.perf_counter()
+        series, samples, probe_ids, matrix = read_series_matrix(path, max_genes)
+        if max_samples:
+            samples, matrix = samples[:max_samples], matrix[:, :max_samples]
+        parsed = time.perf_counter()
+
+        geo_id = (series.get('geo_accession') or [Path(path).name.split('_')[0]])[0]
+        annotation = annotation or {}
+        symbols = [clean_symbol((annotation.get(p) or {}).get('symbol'), p) for p in probe_ids]
+        log2, normalized, percentile = derived_values(matrix)
+        computed = time.perf_counter()
+
+        conn = self.conn
+        conn.execute('BEGIN')
+        try:
+            existing = conn.execute('SELECT id FROM datasets WHERE geo_id = ?', (geo_id,)).fetchone()
+            if existing and not replace:
+                conn.execute('ROLLBACK')
+                return {'geo_id': geo_id, 'dataset_id': existing[0], 'skipped': True}
+            index_sql = drop_expression_indexes(conn) if self.bulk or expression_table_empty(conn) else []
+            if existing:
+                dataset_id = existing[0]
+                conn.execute('DELETE FROM gene_expression WHERE dataset_id = ?', (dataset_id,))
+                conn.execute('DELETE FROM samples WHERE dataset_id = ?', (dataset_id,))
+                # datasets.updated_at only exists in tables created by the R importer; the reload time is kept in data_version
+                conn.execute('UPDATE datasets SET n_samples = ?, n_genes = ? WHERE id = ?',
+                             (len(samples), len(probe_ids), dataset_id))
+            else:
+                summary = (series.get('summary') or [None])[0]
+                year = _first_int((series.get('submission_date') or [''])[0][-4:])
+                dataset_id = conn.execute("""
+                    INSERT INTO datasets (geo_id, title, description, tissue_type, tumor_type, platform,
+                                          n_samples, n_genes, publication_year, reference_pmid, data_source,
+                                          priority, status)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'GEO', ?, 'active')
+                """, (
+                    geo_id, title or (series.get('title') or [geo_id])[0], summary, tissue_type, tumor_type,
+                    (series.get('platform_id') or [None])[0], len(samples), len(probe_ids), year,
+                    (series.get('pubmed_id') or [None])[0], priority
+                )).lastrowid
+
+            conn.executemany("""
+                INSERT INTO samples (dataset_id, sample_id, sample_name, tissue_type, tumor_type, grade, stage,
+                                     age, gender, survival_status, survival_time)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [sample_record(s, dataset_id, tissue_type, tumor_type) for s in samples])
+
+            new_genes = []
+            for probe_id, symbol in zip(probe_ids, symbols):
+                if probe_id not in self.known_genes:
+                    self.known_genes.add(probe_id)
+                    info = annotation.get(probe_id) or {}
+                    new_genes.append((probe_id, symbol, info.get('name'), info.get('chromosome'),
+                                      'protein_coding', info.get('entrez')))
+            conn.executemany("""
+                INSERT OR IGNORE INTO genes (gene_id, gene_symbol, gene_name, chromosome, gene_type, entrez_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, new_genes)
+
+            rows = conn.executemany("""
+                INSERT INTO gene_expression (dataset_id, sample_id, gene_id, gene_symbol, expression_value,
+                                             log2_expression, normalized_value, percentile_rank, is_expressed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, self._expression_rows(dataset_id, samples, probe_ids, symbols, matrix, log2, normalized, percentile)).rowcount
+
+            for sql in index_sql:
+                conn.execute(sql)
+            bump_data_version(conn, dataset_id)
+            refresh_dataset_summary(conn, dataset_id)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        evict_derived_stores(dataset_id, self.expression_store, self.coexpression_dir)
+        finished = time.perf_counter()
+
+        return {
+            'geo_id': geo_id,
+            'dataset_id': dataset_id,
+            'samples': len(samples),
+            'genes': len(probe_ids),
+            'new_genes': len(new_genes),
+            'expression_rows': rows,
+            'parse_s': round(parsed - started, 3),
+            'compute_s': round(computed - parsed, 3),
+            'load_s': round(finished - computed, 3),
+            'rows_per_s': round(rows / (finished - started)) if finished > started else None,
+        }
+
+    @staticmethod
+    def _expression_rows(dataset_id, samples, probe_ids, symbols, matrix, log2, normalized, percentile):
+        # Sample-major order like reshape2::melt in the R importer; NaN is stored as NULL
+        for j, sample in enumerate(samples):
+            sample_id = sample['sample_id']
+            log2_col = log2[:, j]
+            expressed = (log2_col > EXPRESSED_LOG2).tolist()
+            columns = [np.where(np.isfinite(c), c, np.nan).tolist()
+                       for c in (matrix[:, j].astype(np.float64), log2_col, normalized[:, j], percentile[:, j])]
+            for gene_id, symbol, value, lg, norm, pct, is_expr in zip(probe_ids, symbols, *columns, expressed):
+                yield (dataset_id, sample_id, gene_id, symbol,
+                       None if value != value else value,
+                       None if lg != lg else lg,
+                       None if norm != norm else norm,
+                       None if pct != pct else pct,
+                       is_expr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk-load GEO series-matrix files into the NETA database')
+    parser.add_argument('files', nargs='+', help='GSE*_series_matrix.txt[.gz] files')
+    parser.add_argument('--db', default=str(DEFAULT_DB), help='SQLite database path (default: %(default)s)')
+    parser.add_argument('--annotation', help='platform annotation table for gene symbols (GPL .annot or TSV with ID column)')
+    parser.add_argument('--title')
+    parser.add_argument('--tumor-type')
+    parser.add_argument('--tissue-type')
+    parser.add_argument('--priority', type=int, default=2)
+    parser.add_argument('--max-genes', type=int, help='only load the first N probes')
+    parser.add_argument('--max-samples', type=int, help='only load the first N samples')
+    parser.add_argument('--replace', action='store_true', help='reload series that already exist')
+    parser.add_argument('--cache-mb', type=int, default=512, help='SQLite page cache for the load')
+    parser.add_argument('--expression-store', default=str(DEFAULT_EXPRESSION_STORE),
+                        help='expression store to evict replaced series from (default: %(default)s)')
+    parser.add_argument('--coexpression-dir', default=str(DEFAULT_COEXPRESSION_DIR),
+                        help='co-expression index to evict replaced series from (default: %(default)s)')
+    parser.add_argument('--bulk', action='store_true',
+                        help='drop and rebuild gene_expression indexes around each series even if the table '
+                             'already has data (faster for series that are large relative to the table)')
+    args = parser.parse_args()
+
+    annotation = read_annotation(args.annotation) if args.annotation else None
+    conn = sqlite3.connect(args.db)
+    configure_bulk_load(conn, args.cache_mb)
+    importer = GeoImporter(conn, expression_store=args.expression_store,
+                           coexpression_dir=args.coexpression_dir, bulk=args.bulk)
+    for path in args.files:
+        result = importer.import_series(
+            path, title=args.title, tumor_type=args.tumor_type, tissue_type=args.tissue_type,
+            priority=args.priority, annotation=annotation, max_genes=args.max_genes,
+            max_samples=args.max_samples, replace=args.replace
+        )
+        print(json.dumps(result), flush=True)
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())